@@ -3,6 +3,8 @@ from os.path import basename, isdir, join
 import os
 
 import json
+from argparse import ArgumentParser
+from multiprocessing import Pool, cpu_count
 from sys import exit as sys_exit
 from string import Template
 
@@ -13,6 +15,7 @@ import tools.build_api
 from tools.export import EXPORTERS
 from tools.settings import ROOT
 from tools.targets import TARGET_MAP
+from tools.toolchains import SourceTree
 
 MBED_LIBS = [
     join(ROOT, "rtos"),
@@ -27,6 +30,10 @@ MBED_LIBS = [
 ]
 
 
+# Snapshot of ROOT shared by the scans of every target. See init_worker
+SOURCE_TREE = None
+
+
 def log_message(msg):
     print msg
 
@@ -175,82 +182,114 @@ $config_str
         fp.write(config.substitute(config_str=data))
 
 
-def main():
+def init_worker(source_tree):
+    global SOURCE_TREE
+    SOURCE_TREE = source_tree
 
-    log_message("Targets count %d" % len(EXPORTERS['gcc_arm'].TARGETS))
-    exporter = EXPORTERS['gcc_arm']
-    for target in TARGET_MAP:
-        if not exporter.is_target_supported(target) and "mts" not in target.lower():
-            log_message("* Skipped target %s" % target)
-            continue
 
-        log_message("Current target %s" % target)
-        create_target_dir(target)
+def generate_variant(target):
+    """Write the variant of a target: its configuration header and the
+    parameters of the core, features and libraries"""
+    log_message("Current target %s" % target)
+    create_target_dir(target)
 
-        toolchain = tools.build_api.prepare_toolchain(
-            [ROOT], "", target, 'GCC_ARM', silent=True)
+    toolchain = tools.build_api.prepare_toolchain(
+        [ROOT], "", target, 'GCC_ARM', silent=True)
+    toolchain.source_tree = SOURCE_TREE
 
-        framework_resources = toolchain.scan_resources(ROOT)
-        toolchain.config.load_resources(framework_resources)
+    framework_resources = toolchain.scan_resources(ROOT)
+    toolchain.config.load_resources(framework_resources)
+
+    mbed_parameters = {
+        "symbols": toolchain.get_symbols(),
+        "build_flags": toolchain.flags,
+        "syslibs": toolchain.sys_libs,
+        "ldscript": get_ldscript(framework_resources),
+        "softdevice_hex": get_softdevice(toolchain, framework_resources)
+    }
 
-        mbed_parameters = {
-            "symbols": toolchain.get_symbols(),
-            "build_flags": toolchain.flags,
-            "syslibs": toolchain.sys_libs,
-            "ldscript": get_ldscript(framework_resources),
-            "softdevice_hex": get_softdevice(toolchain, framework_resources)
-        }
+    # add default toolchain flags
+    for key, value in get_toolchain_flags("release").iteritems():
+        mbed_parameters['build_flags'][key].extend(value)
 
-        # add default toolchain flags
-        for key, value in get_toolchain_flags("release").iteritems():
-            mbed_parameters['build_flags'][key].extend(value)
+    # Add include with configuration file
+    create_config_include(target, toolchain)
 
-        # Add include with configuration file
-        create_config_include(target, toolchain)
+    mbed_parameters['build_flags']['common'].extend(
+        ["-include", "mbed_config.h"])
 
-        mbed_parameters['build_flags']['common'].extend(
-            ["-include", "mbed_config.h"])
+    # mbed_parameters['symbols'] // MBED_CONF_*
 
-        # mbed_parameters['symbols'] // MBED_CONF_*
+    # Add to core everything except from libraries, features and platformio
+    # folder
+    excludes = MBED_LIBS + \
+        [join(ROOT, "features"), join(ROOT, "platformio")]
 
-        # Add to core everything except from libraries, features and platformio
-        # folder
-        excludes = MBED_LIBS + \
-            [join(ROOT, "features"), join(ROOT, "platformio")]
+    core_resources = toolchain.scan_resources(ROOT, exclude_paths=excludes)
+    mbed_parameters['core'] = get_component_parameters(
+        core_resources.base_path, core_resources)
 
-        core_resources = toolchain.scan_resources(ROOT, exclude_paths=excludes)
-        mbed_parameters['core'] = get_component_parameters(
-            core_resources.base_path, core_resources)
+    feature_parameters = dict()
+    feature_set = [f for f in framework_resources.features]
+    for feature in feature_set:
+        # feature_toolchain = deepcopy(toolchain)
+        feature_recources = framework_resources.features[feature]
+        # feature_toolchain.config.load_resources(feature_recources)
 
-        feature_parameters = dict()
-        feature_set = [f for f in framework_resources.features]
-        for feature in feature_set:
-            # feature_toolchain = deepcopy(toolchain)
-            feature_recources = framework_resources.features[feature]
-            # feature_toolchain.config.load_resources(feature_recources)
+        feature_parameters[feature] = get_component_parameters(
+            framework_resources.features[feature].inc_dirs[0], feature_recources)
 
-            feature_parameters[feature] = get_component_parameters(
-                framework_resources.features[feature].inc_dirs[0], feature_recources)
+        feature_parameters[feature]['dir'] = fix_paths(
+            ROOT, framework_resources.features[feature].inc_dirs[0])
 
-            feature_parameters[feature]['dir'] = fix_paths(
-                ROOT, framework_resources.features[feature].inc_dirs[0])
+    mbed_parameters['features'] = feature_parameters
 
-        mbed_parameters['features'] = feature_parameters
+    library_parameters = dict()
+    lib_set = [l for l in MBED_LIBS]
+    for lib in lib_set:
+        lib_resources = toolchain.scan_resources(lib)
+        lib_name = basename(lib)
 
-        library_parameters = dict()
-        lib_set = [l for l in MBED_LIBS]
-        for lib in lib_set:
-            lib_resources = toolchain.scan_resources(lib)
-            lib_name = basename(lib)
+        library_parameters[lib_name] = get_component_parameters(
+            lib, lib_resources)
 
-            library_parameters[lib_name] = get_component_parameters(
-                lib, lib_resources)
+        library_parameters[lib_name]['dir'] = fix_paths(ROOT, lib)
 
-            library_parameters[lib_name]['dir'] = fix_paths(ROOT, lib)
+    mbed_parameters['libs'] = library_parameters
 
-        mbed_parameters['libs'] = library_parameters
+    save_config(target, mbed_parameters)
 
-        save_config(target, mbed_parameters)
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(),
+                        help="Number of targets processed at once")
+    options = parser.parse_args()
+
+    log_message("Targets count %d" % len(EXPORTERS['gcc_arm'].TARGETS))
+    exporter = EXPORTERS['gcc_arm']
+    targets = []
+    for target in TARGET_MAP:
+        if not exporter.is_target_supported(target) and "mts" not in target.lower():
+            log_message("* Skipped target %s" % target)
+            continue
+        targets.append(target)
+
+    # Every target scans the same tree; list it once and let each target
+    # filter it by its own labels in memory
+    source_tree = SourceTree(ROOT)
+    if options.jobs > 1:
+        pool = Pool(options.jobs, init_worker, (source_tree,))
+        try:
+            pool.map(generate_variant, targets)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        init_worker(source_tree)
+        for target in targets:
+            generate_variant(target)
 
 
 if __name__ == "__main__":
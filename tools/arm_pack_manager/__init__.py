@@ -1,29 +1,51 @@
-from urllib2 import urlopen, URLError
-from bs4 import BeautifulSoup
-from os.path import join, dirname, basename
-from os import makedirs
+from os.path import join, dirname, basename, exists, getsize
+from os import makedirs, stat, remove, rename
 from errno import EEXIST
 from threading import Thread
 from Queue import Queue
 from re import compile, sub
-from sys import stderr, stdout
+from sys import stderr, stdout, platform
 from itertools import takewhile
 import argparse
 from json import dump, load
+from time import sleep
 from zipfile import ZipFile
 from tempfile import gettempdir
 import warnings
 from distutils.version import LooseVersion
+from hashlib import md5
+from multiprocessing import Pool, cpu_count
+
+from tools.arm_pack_manager.packed_index import open_index, packed_path, \
+    write_packed_index
+from tools.arm_pack_manager.pdsc import parse_xml, ParseError
 
 warnings.filterwarnings("ignore")
 
-from fuzzywuzzy import process
 
 RootPackURL = "http://www.keil.com/pack/index.idx"
 
 LocalPackDir = dirname(__file__)
 LocalPackIndex = join(LocalPackDir, "index.json")
 LocalPackAliases = join(LocalPackDir, "aliases.json")
+# The digest, devices and aliases of every PDSC file in index.json, so that
+# regenerating the index only parses the PDSC files that changed
+LocalPackSources = join(LocalPackDir, "index_sources.json")
+
+# Number of devices ranked by find_device, when the index can preselect them
+FuzzyCandidates = 200
+
+# Number of files downloaded at once
+DownloadThreads = 20
+# Size of the pieces a download is written to disk in
+DownloadChunk = 64 * 1024
+# Seconds without progress before a download is abandoned, unless timeouts
+# are disabled
+DownloadTimeout = 60
+# Attempts made for each download, and the delay before the first retry in
+# seconds. The delay doubles on every retry
+DownloadAttempts = 4
+DownloadBackoff = 1.0
 
 
 protocol_matcher = compile("\w*://")
@@ -34,9 +56,31 @@ def largest_version(content) :
     return sorted([t['version'] for t in content.package.releases('release')],
                   reverse=True, key=lambda v: LooseVersion(v))[0]
 
-def do_queue(Class, function, interable) :
+def pack_url(content) :
+    url = content.package.url.get_text()
+    if not url.endswith("/") :
+        url = url + "/"
+    return (url + content.package.vendor.get_text() + "." +
+            content.package.find('name').get_text() + "." +
+            largest_version(content) + ".pack")
+
+def _index_pdsc(job) :
+    """Parse a cached PDSC file for the index, in a worker process.
+
+    :param job: The cache directory and the URL of the PDSC file
+    :type job: (str, str)
+    :return: The URL, the devices of the PDSC file, or None when it does not
+             conform, and the board aliases it defines
+    :rtype: (str, dict, dict)
+    """
+    data_path, url = job
+    cache = Cache(True, True)
+    cache.data_path = data_path
+    return (url,) + cache._parse_for_index(url)
+
+def do_queue(Class, function, interable, threads=DownloadThreads) :
     q = Queue()
-    threads = [Class(q, function) for each in range(20)]
+    threads = [Class(q, function) for each in range(threads)]
     for each in threads :
         each.setDaemon(True)
         each.start()
@@ -52,8 +96,15 @@ class Reader (Thread) :
     def run(self) :
         while True :
             url = self.queue.get()
-            self.func(url)
-            self.queue.task_done()
+            try :
+                self.func(url)
+            except Exception as e :
+                # One bad URL must not stop the worker, or do_queue would
+                # wait for the rest of the queue forever
+                stderr.write("[ ERROR ] {}: {}\n".format(
+                    url, str(e) or e.__class__.__name__))
+            finally :
+                self.queue.task_done()
 
 
 class Cache () :
@@ -66,9 +117,12 @@ class Cache () :
     :type silent: bool
     :param no_timeouts: A boolean that, when True, disables the default connection timeout and low speed timeout for downloading things.
     :type no_timeouts: bool
+    :param threads: The number of files downloaded at once
+    :type threads: int
     """
-    def __init__ (self, silent, no_timeouts) :
+    def __init__ (self, silent, no_timeouts, threads=DownloadThreads) :
         self.silent = silent
+        self.threads = threads
         self.counter = 0
         self.total = 1
         self._index = {}
@@ -84,24 +138,128 @@ class Cache () :
     def cache_file (self, url) :
         """Low level interface to caching a single file.
 
+        A file that is already cached is revalidated with a conditional
+        request, and only downloaded again when it changed. Downloads are
+        streamed to disk, resumed after an interruption and retried with
+        an increasing delay.
+
         :param url: The URL to cache.
         :type url: str
-        :rtype: None
+        :return: True when the cached copy changed
+        :rtype: bool
         """
+        from urllib2 import URLError, HTTPError
+        from httplib import HTTPException
+        from socket import error as SocketError
         if not self.silent : print("Caching {}...".format(url))
         dest = join(self.data_path, strip_protocol(url))
+        changed, error = False, None
+        attempts = DownloadAttempts
         try :
             makedirs(dirname(dest))
         except OSError as exc :
-            if exc.errno == EEXIST : pass
-            else : raise
-        try:
-            with open(dest, "wb+") as fd :
-                fd.write(urlopen(url).read())
-        except URLError as e:
-            stderr.write(e.reason)
+            if exc.errno != EEXIST :
+                error, attempts = str(exc), 0
+        for attempt in range(attempts) :
+            try :
+                changed, error = self._download(url, dest), None
+                break
+            except HTTPError as e :
+                error = "{} {}".format(e.code, e.msg)
+                # Only server errors may go away by themselves
+                if e.code < 500 : break
+            except URLError as e :
+                error = str(e.reason)
+            except (HTTPException, SocketError, EnvironmentError,
+                    ValueError) as e :
+                error = str(e) or e.__class__.__name__
+            if attempt + 1 < DownloadAttempts :
+                sleep(DownloadBackoff * 2 ** attempt)
+        if error :
+            stderr.write("[ ERROR ] {}: {}\n".format(url, error))
         self.counter += 1
         self.display_counter("Caching Files")
+        return changed
+
+    def _download(self, url, dest) :
+        """Make one attempt at bringing the cached copy of a URL up to date.
+
+        The validators (ETag and Last-Modified) of the cached copy, and of a
+        partial download, are kept in a ".meta" file next to it.
+
+        :return: True when the cached copy changed, False when it is current
+        :rtype: bool
+        """
+        from urllib2 import Request, urlopen, HTTPError
+        meta_file = dest + ".meta"
+        part = dest + ".part"
+        try :
+            with open(meta_file) as fd :
+                meta = load(fd)
+        except (IOError, ValueError) :
+            meta = {}
+
+        request = Request(url)
+        if exists(dest) :
+            if meta.get("etag") :
+                request.add_header("If-None-Match", meta["etag"])
+            if meta.get("last-modified") :
+                request.add_header("If-Modified-Since", meta["last-modified"])
+        partial = meta.get("partial") or {}
+        offset = getsize(part) if exists(part) else 0
+        validator = partial.get("etag") or partial.get("last-modified")
+        if offset and validator :
+            request.add_header("Range", "bytes={}-".format(offset))
+            request.add_header("If-Range", validator)
+
+        try :
+            if self.no_timeouts :
+                response = urlopen(request)
+            else :
+                response = urlopen(request, timeout=DownloadTimeout)
+        except HTTPError as e :
+            if e.code == 304 :
+                return False
+            if e.code == 416 and exists(part) :
+                # The partial download does not match the file any more
+                remove(part)
+            raise
+
+        headers = response.info()
+        validators = dict((name, headers.get(name)) for name in
+                          ["etag", "last-modified"] if headers.get(name))
+        if response.getcode() == 206 :
+            content_range = headers.get("content-range") or ""
+            if not content_range.startswith("bytes {}-".format(offset)) :
+                # Not the rest of the partial download, start over
+                response.close()
+                remove(part)
+                raise IOError("unexpected range \"{}\"".format(content_range))
+        else :
+            offset = 0
+        meta["partial"] = validators
+        with open(meta_file, "w") as fd :
+            dump(meta, fd)
+
+        length = headers.get("content-length")
+        expected = offset + int(length) if length is not None else None
+        with open(part, "ab" if offset else "wb") as fd :
+            while True :
+                chunk = response.read(DownloadChunk)
+                if not chunk :
+                    break
+                fd.write(chunk)
+                offset += len(chunk)
+        response.close()
+        if expected is not None and offset < expected :
+            raise IOError("download interrupted after {} bytes".format(offset))
+
+        if platform == "win32" and exists(dest) :
+            remove(dest)
+        rename(part, dest)
+        with open(meta_file, "w") as fd :
+            dump(validators, fd)
+        return True
 
     def pdsc_to_pack (self, url) :
         """Find the URL of the specified pack file described by a PDSC.
@@ -113,13 +271,7 @@ class Cache () :
         :return: The url of the PACK file.
         :rtype: str
         """
-        content = self.pdsc_from_cache(url)
-        new_url = content.package.url.get_text()
-        if not new_url.endswith("/") :
-            new_url = new_url + "/"
-        return (new_url + content.package.vendor.get_text() + "." +
-                content.package.find('name').get_text() + "." +
-                largest_version(content) + ".pack")
+        return pack_url(self.pdsc_from_cache(url))
 
     def cache_pdsc_and_pack (self, url) :
         self.cache_file(url)
@@ -222,30 +374,109 @@ class Cache () :
 
         return to_ret
 
-    def _generate_index_helper(self, d) :
+    def _parse_for_index(self, url) :
         try :
-            pack = self.pdsc_to_pack(d)
-            self._index.update(dict([(dev['dname'], self._extract_dict(dev, d, pack)) for dev in
-                                    (self.pdsc_from_cache(d)("device"))]))
-        except AttributeError as e :
-            stderr.write("[ ERROR ] file {}\n".format(d))
-            print(e)
-        self.counter += 1
-        self.display_counter("Generating Index")
+            content = self.pdsc_from_cache(url)
+        except IOError :
+            return None, {}
+        aliases = {}
+        for board in content("board") :
+            try :
+                aliases[board['name']] = board.mounteddevice['dname']
+            except (KeyError, TypeError, IndexError) :
+                pass
+        try :
+            pack = pack_url(content)
+            devices = dict((dev['dname'], self._extract_dict(dev, url, pack))
+                           for dev in content("device"))
+        except (AttributeError, KeyError, TypeError, IndexError) :
+            devices = None
+        return devices, aliases
+
+    def _pdsc_digest(self, url) :
+        try :
+            with open(join(self.data_path, strip_protocol(url)), "rb") as fd :
+                return md5(fd.read()).hexdigest()
+        except IOError :
+            return None
+
+    def update_index(self) :
+        """Bring index.json up to date with the cached PDSC files.
+
+        Only the PDSC files that changed since the index was last generated
+        are parsed, in parallel; the devices of the others are kept. An
+        unchanged PDSC file is parsed again when it describes a device that
+        the index took from a changed or removed one.
 
-    def _generate_aliases_helper(self, d) :
+        :return: The digest, device names and aliases of every PDSC file in the index
+        :rtype: dict
+        """
+        urls = self.get_urls()
         try :
-            mydict = []
-            for dev in self.pdsc_from_cache(d)("board"):
-                try :
-                    mydict.append((dev['name'], dev.mounteddevice['dname']))
-                except (KeyError, TypeError, IndexError) as e:
-                    pass
-            self._aliases.update(dict(mydict))
-        except (AttributeError, TypeError) as e :
-            pass
-        self.counter += 1
-        self.display_counter("Scanning for Aliases")
+            with open(LocalPackIndex) as fd :
+                index = load(fd)
+            with open(LocalPackSources) as fd :
+                sources = load(fd)
+        except (IOError, ValueError) :
+            index, sources = {}, {}
+        digests = dict((url, self._pdsc_digest(url)) for url in urls)
+        changed = sorted(
+            url for url in urls if digests[url] and
+            (url not in sources or sources[url]["digest"] != digests[url] or
+             any(dev not in index for dev in sources[url]["devices"])))
+        stale = (set(sources) - set(urls)) | set(changed)
+        dropped = set()
+        for url in stale :
+            for dev in sources.pop(url, {}).get("devices", []) :
+                # Another PDSC file may describe the same device
+                if dev in index and index[dev].get("pdsc_file") in stale :
+                    del index[dev]
+                    dropped.add(dev)
+        # Parse the unchanged PDSC files that also describe a dropped device
+        # again, so that the device stays in the index
+        changed += sorted(url for url, source in sources.items()
+                          if dropped.intersection(source["devices"]))
+
+        self.counter = 0
+        self.total = len(changed)
+        results = []
+        jobs = [(self.data_path, url) for url in changed]
+        if len(jobs) > 1 :
+            pool = Pool(min(cpu_count(), len(jobs)))
+            try :
+                for result in pool.imap_unordered(_index_pdsc, jobs) :
+                    results.append(result)
+                    self.counter += 1
+                    self.display_counter("Generating Index")
+                pool.close()
+            finally :
+                pool.terminate()
+                pool.join()
+        else :
+            results = [_index_pdsc(job) for job in jobs]
+
+        for url, devices, aliases in sorted(results) :
+            if devices is None :
+                stderr.write("[ ERROR ] file {}\n".format(url))
+                devices = {}
+            index.update(devices)
+            sources[url] = dict(digest=digests[url], devices=sorted(devices),
+                                aliases=aliases)
+        if stale or not exists(LocalPackIndex) :
+            index["version"] = "0.1.0"
+            with open(LocalPackIndex, "wb+") as out :
+                dump(index, out)
+            info = stat(LocalPackIndex)
+            try :
+                write_packed_index(index, packed_path(LocalPackIndex),
+                                   info.st_size, info.st_mtime)
+            except (IOError, OSError) :
+                pass
+            with open(LocalPackSources, "wb+") as out :
+                dump(sources, out)
+        self._index = index
+        stdout.write("\n")
+        return sources
 
     def get_flash_algorthim_binary(self, device_name, all=False) :
         """Retrieve the flash algorithm file for a particular part.
@@ -280,31 +511,33 @@ class Cache () :
         return pack.open(device['debug'])
 
     def generate_index(self) :
-        self._index = {}
-        self.counter = 0
-        do_queue(Reader, self._generate_index_helper, self.get_urls())
-        with open(LocalPackIndex, "wb+") as out:
-            self._index["version"] = "0.1.0"
-            dump(self._index, out)
-        stdout.write("\n")
+        self.update_index()
 
     def generate_aliases(self) :
+        sources = self.update_index()
         self._aliases = {}
-        self.counter = 0
-        do_queue(Reader, self._generate_aliases_helper, self.get_urls())
+        for url in sorted(sources) :
+            self._aliases.update(sources[url]["aliases"])
         with open(LocalPackAliases, "wb+") as out:
             dump(self._aliases, out)
-        stdout.write("\n")
 
     def find_device(self, match) :
-        choices = process.extract(match, self.index.keys(), limit=len(self.index))
+        from fuzzywuzzy import process
+        # Ranking every device is slow; a packed index preselects the devices
+        # sharing the most of match with their name
+        candidates = None
+        if hasattr(self.index, "candidates"):
+            candidates = self.index.candidates(match, FuzzyCandidates)
+        if not candidates:
+            candidates = self.index.keys()
+        choices = process.extract(match, candidates, limit=len(candidates))
         choices = sorted([(v, k) for k, v in choices], reverse=True)
         if choices : choices = list(takewhile(lambda t: t[0] == choices[0][0], choices))
         return [(v, self.index[v]) for k,v in choices]
 
     def dump_index_to_file(self, file) :
         with open(file, "wb+") as out:
-            dump(self.index, out)
+            dump(dict(self.index), out)
 
     @property
     def index(self) :
@@ -328,10 +561,11 @@ class Cache () :
                      u'IROM1': {u'size': u'0x80000', u'start': u'0x00000000'}}}
 
 
+        The index is read from a memory mapped, packed form of index.json,
+        so that looking up a device does not parse every other device.
         """
         if not self._index :
-            with open(LocalPackIndex) as i :
-                self._index = load(i)
+            self._index = open_index(LocalPackIndex)
         return self._index
     @property
     def aliases(self) :
@@ -391,7 +625,7 @@ class Cache () :
         """
         self.total = len(list)
         self.display_counter("Caching Files")
-        do_queue(Reader, self.cache_file, list)
+        do_queue(Reader, self.cache_file, list, self.threads)
         stdout.write("\n")
 
     def cache_pack_list(self, list) :
@@ -402,7 +636,7 @@ class Cache () :
         """
         self.total = len(list) * 2
         self.display_counter("Caching Files")
-        do_queue(Reader, self.cache_pdsc_and_pack, list)
+        do_queue(Reader, self.cache_pdsc_and_pack, list, self.threads)
         stdout.write("\n")
 
     def pdsc_from_cache(self, url) :
@@ -410,12 +644,21 @@ class Cache () :
 
         Assumes that the file specified is a PDSC file and is in the cache.
 
+        The file is parsed with ElementTree, which is much faster than
+        BeautifulSoup; files that are not well formed XML are still parsed
+        with BeautifulSoup.
+
         :param url: The URL of a PDSC file.
         :type url: str
         :return: A parsed representation of the PDSC file.
-        :rtype: BeautifulSoup
+        :rtype: XmlTag or BeautifulSoup
         """
         dest = join(self.data_path, strip_protocol(url))
+        try :
+            return parse_xml(dest)
+        except ParseError :
+            pass
+        from bs4 import BeautifulSoup
         with open(dest, "r") as fd :
             return BeautifulSoup(fd, "html.parser")
 
@@ -0,0 +1,247 @@
+"""A compact, memory mapped form of the pack index (index.json).
+
+Loading index.json parses the records of every device, while a tool usually
+needs one of them. The packed index is a binary file holding:
+
+ - a header, recording the size and mtime of the index.json it was made from
+ - a table of devices sorted by name, each entry giving the location of the
+   name and of the JSON record of the device
+ - a table of sorted trigrams of the normalized device names, each entry
+   giving the location of the list of devices whose name contains it
+ - the names, records and device lists the tables point to
+
+The file is opened through mmap, so a lookup only reads the pages it touches.
+"""
+import re
+import sys
+import mmap
+from os import stat, remove, rename, getpid
+from os.path import splitext
+from bisect import bisect_left
+from collections import Mapping
+from json import load, loads, dumps
+from struct import Struct, unpack_from
+
+MAGIC = "MBEDPIX1"
+
+# magic, size and mtime of the index.json, number of devices, number of
+# trigrams, offset of the device table, offset of the trigram table
+HEADER = Struct("<8sQdIIII")
+
+# offset and length of the name, offset and length of the record
+DEVICE = Struct("<IIII")
+
+# trigram, offset and number of entries of the device list
+TRIGRAM = Struct("<3sxII")
+
+DEVICE_NUMBER = Struct("<I")
+
+_NOT_ALNUM = re.compile("[^a-z0-9]")
+
+
+def normalize(name):
+    """Lower case a device name and strip anything but letters and digits"""
+    if isinstance(name, unicode):
+        name = name.encode("utf-8")
+    return _NOT_ALNUM.sub("", name.lower())
+
+
+def trigrams(name):
+    """The set of trigrams of a normalized device name"""
+    return set(name[i:i + 3] for i in range(len(name) - 2))
+
+
+def packed_path(json_path):
+    """The location of the packed form of a JSON index"""
+    return splitext(json_path)[0] + ".bin"
+
+
+def write_packed_index(index, path, source_size, source_mtime):
+    """Write the packed form of an index
+
+    Positional arguments:
+    index - the index, as loaded from index.json
+    path - where to write the packed index
+    source_size - the size of the index.json the index was loaded from
+    source_mtime - the mtime of the index.json the index was loaded from
+
+    Raises IOError or OSError when the file may not be written. The file is
+    replaced atomically, so that readers never see it partially written.
+    """
+    names = sorted(name.encode("utf-8") if isinstance(name, unicode) else name
+                   for name in index)
+    grams = {}
+    for number, name in enumerate(names):
+        for gram in trigrams(normalize(name)):
+            grams.setdefault(gram, []).append(number)
+    sorted_grams = sorted(grams)
+
+    devices_offset = HEADER.size
+    grams_offset = devices_offset + DEVICE.size * len(names)
+    data_offset = grams_offset + TRIGRAM.size * len(sorted_grams)
+
+    tables, data = [], []
+    position = [data_offset]
+
+    def add_data(blob):
+        offset = position[0]
+        data.append(blob)
+        position[0] += len(blob)
+        return offset
+
+    for name in names:
+        record = dumps(index[name.decode("utf-8")])
+        tables.append(DEVICE.pack(add_data(name), len(name),
+                                  add_data(record), len(record)))
+    for gram in sorted_grams:
+        numbers = grams[gram]
+        tables.append(TRIGRAM.pack(gram, add_data("".join(
+            DEVICE_NUMBER.pack(number) for number in numbers)), len(numbers)))
+
+    tmp_file = "%s.%d" % (path, getpid())
+    with open(tmp_file, "wb") as fd:
+        fd.write(HEADER.pack(MAGIC, source_size, source_mtime, len(names),
+                             len(sorted_grams), devices_offset, grams_offset))
+        fd.write("".join(tables))
+        fd.write("".join(data))
+    if sys.platform == "win32":
+        try:
+            remove(path)
+        except OSError:
+            pass
+    rename(tmp_file, path)
+
+
+class PackedIndex(Mapping):
+    """A read only mapping from device names to their records, backed by a
+    packed index file. Records are decoded on every lookup
+    """
+    def __init__(self, path):
+        with open(path, "rb") as fd:
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map.size() < HEADER.size:
+            raise ValueError("%s is not a packed index" % path)
+        (magic, self.source_size, self.source_mtime, self._count,
+         self._gram_count, self._devices, self._grams) = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a packed index" % path)
+        self._names = _Table(self._count, self._name)
+        self._gram_table = _Table(self._gram_count, self._gram)
+
+    def _device(self, number):
+        return DEVICE.unpack_from(self._map, self._devices +
+                                  number * DEVICE.size)
+
+    def _name(self, number):
+        offset, length, _, _ = self._device(number)
+        return self._map[offset:offset + length]
+
+    def _gram(self, number):
+        offset = self._grams + number * TRIGRAM.size
+        return self._map[offset:offset + 3]
+
+    def _find(self, name):
+        """The number of a device, or None when it is not in the index"""
+        if isinstance(name, unicode):
+            name = name.encode("utf-8")
+        elif not isinstance(name, str):
+            return None
+        number = bisect_left(self._names, name)
+        if number < self._count and self._name(number) == name:
+            return number
+        return None
+
+    def __getitem__(self, name):
+        number = self._find(name)
+        if number is None:
+            raise KeyError(name)
+        _, _, offset, length = self._device(number)
+        return loads(self._map[offset:offset + length])
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __iter__(self):
+        for number in range(self._count):
+            yield self._name(number).decode("utf-8")
+
+    def __len__(self):
+        return self._count
+
+    def _devices_with(self, gram):
+        """The numbers of the devices whose normalized name contains gram"""
+        number = bisect_left(self._gram_table, gram)
+        if number == self._gram_count or self._gram(number) != gram:
+            return []
+        _, offset, count = TRIGRAM.unpack_from(
+            self._map, self._grams + number * TRIGRAM.size)
+        return list(unpack_from("<%dI" % count, self._map, offset))
+
+    def candidates(self, match, limit):
+        """The names of the devices most likely to be a fuzzy match: those
+        starting with match, followed by those sharing the most trigrams with
+        it. Returns None when match is too short to have trigrams
+
+        Positional arguments:
+        match - the text to match
+        limit - the maximum number of names returned
+        """
+        grams = trigrams(normalize(match))
+        if not grams:
+            return None
+        if isinstance(match, unicode):
+            match = match.encode("utf-8")
+        shared = {}
+        for gram in grams:
+            for number in self._devices_with(gram):
+                shared[number] = shared.get(number, 0) + 1
+        ranked = sorted(shared, key=lambda number: (-shared[number], number))
+        prefixed = []
+        number = bisect_left(self._names, match)
+        while (number < self._count and len(prefixed) < limit and
+               self._name(number).startswith(match)):
+            prefixed.append(number)
+            number += 1
+        skip = set(prefixed)
+        numbers = prefixed + [n for n in ranked if n not in skip]
+        return [self._name(n).decode("utf-8") for n in numbers[:limit]]
+
+
+class _Table(object):
+    """A sorted table of a packed index, as a sequence for bisect"""
+    def __init__(self, length, getter):
+        self.length = length
+        self.getter = getter
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, number):
+        return self.getter(number)
+
+
+def open_index(json_path):
+    """Open the packed form of a JSON index, packing it first when it is
+    missing or older than the JSON index. Falls back to loading the JSON index
+    when the packed form may not be written
+
+    Positional arguments:
+    json_path - the location of index.json
+    """
+    info = stat(json_path)
+    path = packed_path(json_path)
+    try:
+        index = PackedIndex(path)
+        if (index.source_size == info.st_size and
+                index.source_mtime == info.st_mtime):
+            return index
+    except (IOError, OSError, ValueError):
+        pass
+    with open(json_path) as fd:
+        data = load(fd)
+    try:
+        write_packed_index(data, path, info.st_size, info.st_mtime)
+        return PackedIndex(path)
+    except (IOError, OSError, ValueError):
+        return data
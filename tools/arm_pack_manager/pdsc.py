@@ -0,0 +1,82 @@
+"""Fast parsing of PDSC files.
+
+The pack manager navigates PDSC files through the BeautifulSoup interface.
+BeautifulSoup builds its tree in Python and is slow on the larger device
+families. XmlTag offers the part of that interface the pack manager uses on
+top of cElementTree, so that the same code reads the result of either parser.
+Like BeautifulSoup's html.parser, tag and attribute names are lower cased.
+"""
+try:
+    from xml.etree.cElementTree import parse, Element, ParseError
+except ImportError:
+    from xml.etree.ElementTree import parse, Element, ParseError
+
+
+def parse_xml(source):
+    """Parse an XML file into an XmlTag for the whole document
+
+    Positional arguments:
+    source - a file name or file object
+
+    Raises ParseError when the file is not well formed XML
+    """
+    root = parse(source).getroot()
+    for element in root.iter():
+        element.tag = element.tag.rsplit("}", 1)[-1].lower()
+        if element.attrib:
+            attrib = dict((name.rsplit("}", 1)[-1].lower(), value)
+                          for name, value in element.attrib.items())
+            element.attrib.clear()
+            element.attrib.update(attrib)
+    document = Element("[document]")
+    document.append(root)
+    parents = dict((child, parent) for parent in document.iter()
+                   for child in parent)
+    return XmlTag(document, parents)
+
+
+class XmlTag(object):
+    """An element of a parsed XML file, with the BeautifulSoup Tag interface
+    used by the pack manager:
+
+    tag("<name>") and tag.find_all("<name>") - every descendant named <name>
+    tag.<name> and tag.find("<name>") - the first descendant named <name>, or
+                                        None
+    tag["attribute"] and tag.get("attribute") - an attribute
+    tag.parent and tag.get_text()
+    """
+    def __init__(self, element, parents):
+        self._element = element
+        self._parents = parents
+
+    def find_all(self, name):
+        return [XmlTag(element, self._parents)
+                for element in self._element.iter(name)
+                if element is not self._element]
+
+    __call__ = find_all
+
+    def find(self, name):
+        for element in self._element.iter(name):
+            if element is not self._element:
+                return XmlTag(element, self._parents)
+        return None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.find(name)
+
+    def __getitem__(self, attribute):
+        return self._element.attrib[attribute]
+
+    def get(self, attribute, default=None):
+        return self._element.attrib.get(attribute, default)
+
+    @property
+    def parent(self):
+        parent = self._parents.get(self._element)
+        return None if parent is None else XmlTag(parent, self._parents)
+
+    def get_text(self):
+        return "".join(self._element.itertext())
@@ -25,7 +25,6 @@ from os.path import join, exists, dirname, basename, abspath, normpath, splitext
 from os.path import relpath
 from os import linesep, remove, makedirs
 from time import time
-from intelhex import IntelHex
 from json import load, dump
 
 from tools.utils import mkdir, run_cmd, run_cmd_ext, NotSupportedException,\
@@ -37,8 +36,7 @@ from tools.paths import MBED_CMSIS_PATH, MBED_TARGETS_PATH, MBED_LIBRARIES,\
 from tools.targets import TARGET_NAMES, TARGET_MAP
 from tools.libraries import Library
 from tools.toolchains import TOOLCHAIN_CLASSES
-from jinja2 import FileSystemLoader
-from jinja2.environment import Environment
+from tools.object_cache import ObjectCache
 from tools.config import Config
 
 RELEASE_VERSIONS = ['2', '5']
@@ -313,7 +311,11 @@ def prepare_toolchain(src_paths, build_dir, target, toolchain_name,
                       macros=None, clean=False, jobs=1,
                       notify=None, silent=False, verbose=False,
                       extra_verbose=False, config=None,
-                      app_config=None, build_profile=None):
+                      app_config=None, build_profile=None,
+                      scan_cache_dir=None, compile_timeout=None,
+                      content_hash=False, object_cache=None,
+                      object_cache_size=None, source_tree=None,
+                      deterministic=False):
     """ Prepares resource related objects - toolchain, target, config
 
     Positional arguments:
@@ -332,6 +334,17 @@ def prepare_toolchain(src_paths, build_dir, target, toolchain_name,
     config - a Config object to use instead of creating one
     app_config - location of a chosen mbed_app.json file
     build_profile - a list of mergeable build profiles
+    scan_cache_dir - where to keep the resource scan cache (defaults to the
+                     build directory; False disables it)
+    compile_timeout - seconds allowed for compiling all sources (defaults to
+                      the toolchain's COMPILE_TIMEOUT)
+    content_hash - decide what to rebuild from file contents instead of
+                   modification times
+    object_cache - directory of an object cache shared between builds
+    object_cache_size - the maximum size of the object cache in bytes
+    source_tree - a SourceTree to scan instead of the file system
+    deterministic - leave the build time and absolute paths out of the
+                    compiled objects
     """
 
     # We need to remove all paths which are repeated to avoid
@@ -361,6 +374,16 @@ def prepare_toolchain(src_paths, build_dir, target, toolchain_name,
     toolchain.jobs = jobs
     toolchain.build_all = clean
     toolchain.VERBOSE = verbose
+    toolchain.scan_cache_dir = scan_cache_dir
+    if compile_timeout is not None:
+        toolchain.compile_timeout = compile_timeout
+    toolchain.content_hash = content_hash
+    if object_cache:
+        toolchain.object_cache = ObjectCache(
+            object_cache, max_size=object_cache_size or
+            ObjectCache.DEFAULT_MAX_SIZE)
+    toolchain.source_tree = source_tree
+    toolchain.deterministic = deterministic
 
     return toolchain
 
@@ -372,6 +395,7 @@ def merge_region_list(region_list, destination, padding=b'\xFF'):
     destination - file name to write all regions to
     padding - bytes to fill gapps with
     """
+    from intelhex import IntelHex
     merged = IntelHex()
 
     print("Merging Regions:")
@@ -446,7 +470,11 @@ def build_project(src_paths, build_path, target, toolchain_name,
                   macros=None, inc_dirs=None, jobs=1, silent=False,
                   report=None, properties=None, project_id=None,
                   project_description=None, extra_verbose=False, config=None,
-                  app_config=None, build_profile=None, stats_depth=None):
+                  app_config=None, build_profile=None, stats_depth=None,
+                  scan_cache_dir=None, compile_timeout=None,
+                  content_hash=False, object_cache=None,
+                  object_cache_size=None, source_tree=None,
+                  deterministic=False):
     """ Build a project. A project may be a test or a user program.
 
     Positional arguments:
@@ -476,6 +504,16 @@ def build_project(src_paths, build_path, target, toolchain_name,
     app_config - location of a chosen mbed_app.json file
     build_profile - a dict of flags that will be passed to the compiler
     stats_depth - depth level for memap to display file/dirs
+    scan_cache_dir - where to keep the resource scan cache (defaults to the
+                     build directory)
+    compile_timeout - seconds allowed for compiling all sources
+    content_hash - decide what to rebuild from file contents instead of
+                   modification times
+    object_cache - directory of an object cache shared between builds
+    object_cache_size - the maximum size of the object cache in bytes
+    source_tree - a SourceTree to scan instead of the file system
+    deterministic - leave the build time and absolute paths out of the
+                    compiled objects
     """
 
     # Convert src_path to a list if needed
@@ -494,7 +532,10 @@ def build_project(src_paths, build_path, target, toolchain_name,
         src_paths, build_path, target, toolchain_name, macros=macros,
         clean=clean, jobs=jobs, notify=notify, silent=silent, verbose=verbose,
         extra_verbose=extra_verbose, config=config, app_config=app_config,
-        build_profile=build_profile)
+        build_profile=build_profile, scan_cache_dir=scan_cache_dir,
+        compile_timeout=compile_timeout, content_hash=content_hash,
+        object_cache=object_cache, object_cache_size=object_cache_size,
+        source_tree=source_tree, deterministic=deterministic)
 
     # The first path will give the name to the library
     name = (name or toolchain.config.name or
@@ -609,7 +650,10 @@ def build_library(src_paths, build_path, target, toolchain_name,
                   inc_dirs=None, jobs=1, silent=False, report=None,
                   properties=None, extra_verbose=False, project_id=None,
                   remove_config_header_file=False, app_config=None,
-                  build_profile=None):
+                  build_profile=None, compile_timeout=None,
+                  content_hash=False, object_cache=None,
+                  object_cache_size=None, source_tree=None,
+                  deterministic=False):
     """ Build a library
 
     Positional arguments:
@@ -637,6 +681,14 @@ def build_library(src_paths, build_path, target, toolchain_name,
     remove_config_header_file - delete config header file when done building
     app_config - location of a chosen mbed_app.json file
     build_profile - a dict of flags that will be passed to the compiler
+    compile_timeout - seconds allowed for compiling all sources
+    content_hash - decide what to rebuild from file contents instead of
+                   modification times
+    object_cache - directory of an object cache shared between builds
+    object_cache_size - the maximum size of the object cache in bytes
+    source_tree - a SourceTree to scan instead of the file system
+    deterministic - leave the build time and absolute paths out of the
+                    compiled objects
     """
 
     # Convert src_path to a list if needed
@@ -661,7 +713,10 @@ def build_library(src_paths, build_path, target, toolchain_name,
         src_paths, build_path, target, toolchain_name, macros=macros,
         clean=clean, jobs=jobs, notify=notify, silent=silent,
         verbose=verbose, extra_verbose=extra_verbose, app_config=app_config,
-        build_profile=build_profile)
+        build_profile=build_profile, compile_timeout=compile_timeout,
+        content_hash=content_hash, object_cache=object_cache,
+        object_cache_size=object_cache_size, source_tree=source_tree,
+        deterministic=deterministic)
 
     # The first path will give the name to the library
     if name is None:
@@ -934,7 +989,7 @@ def build_lib(lib_id, target, toolchain_name, verbose=False,
 def build_mbed_libs(target, toolchain_name, verbose=False,
                     clean=False, macros=None, notify=None, jobs=1, silent=False,
                     report=None, properties=None, extra_verbose=False,
-                    build_profile=None):
+                    build_profile=None, source_tree=None):
     """ Function returns True is library was built and false if building was
     skipped
 
@@ -953,6 +1008,7 @@ def build_mbed_libs(target, toolchain_name, verbose=False,
     properties - UUUUHHHHH beats me
     extra_verbose - even more output!
     build_profile - a dict of flags that will be passed to the compiler
+    source_tree - a SourceTree to scan instead of the file system
     """
 
     if report != None:
@@ -997,7 +1053,8 @@ def build_mbed_libs(target, toolchain_name, verbose=False,
         toolchain = prepare_toolchain(
             [""], tmp_path, target, toolchain_name, macros=macros,verbose=verbose,
             notify=notify, silent=silent, extra_verbose=extra_verbose,
-            build_profile=build_profile, jobs=jobs, clean=clean)
+            build_profile=build_profile, jobs=jobs, clean=clean,
+            source_tree=source_tree)
 
         # Take into account the library configuration (MBED_CONFIG_FILE)
         config = toolchain.config
@@ -1378,6 +1435,8 @@ def write_build_report(build_report, template_filename, filename):
         else:
             build_report_passing.append(report)
 
+    from jinja2 import FileSystemLoader
+    from jinja2.environment import Environment
     env = Environment(extensions=['jinja2.ext.with_'])
     env.loader = FileSystemLoader('ci_templates')
     template = env.get_template(template_filename)
@@ -28,7 +28,7 @@ sys.path.insert(0, ROOT)
 from tools.build_api import build_library
 from tools.build_api import write_build_report
 from tools.targets import TARGET_MAP, TARGET_NAMES
-from tools.toolchains import TOOLCHAINS
+from tools.toolchains import TOOLCHAINS, SourceTree
 from tools.test_exporters import ReportExporter, ResultExporterType
 from tools.test_api import find_tests, build_tests, test_spec_from_test_builds
 from tools.build_release import OFFICIAL_MBED_LIBRARY_BUILD
@@ -154,6 +154,12 @@ if __name__ == '__main__':
         test_builds = {}
         total_build_success = True
 
+        # The library of every target and toolchain is built from the same
+        # sources; list them once and let each build filter them by its
+        # labels in memory
+        source_tree = SourceTree(base_source_paths[0],
+                                 exclude_paths=[options.build_dir])
+
         for target_name, target_toolchains in build_config.iteritems():
             target = TARGET_MAP[target_name]
             
@@ -171,7 +177,8 @@ if __name__ == '__main__':
                                                     name="mbed-os",
                                                     macros=options.macros,
                                                     verbose=options.verbose,
-                                                    archive=False)
+                                                    archive=False,
+                                                    source_tree=source_tree)
                 except Exception, e:
                     library_build_success = False
                     print "Failed to build library"
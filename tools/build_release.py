@@ -34,7 +34,8 @@ from tools.targets import TARGET_MAP, TARGET_NAMES
 from tools.test_exporters import ReportExporter, ResultExporterType
 from tools.test_api import SingleTestRunner
 from tools.test_api import singletest_in_cli_mode
-from tools.paths import TEST_DIR, MBED_LIBRARIES
+from tools.paths import TEST_DIR, MBED_LIBRARIES, BUILD_DIR
+from tools.toolchains import SourceTree
 from tools.tests import TEST_MAP
 
 OFFICIAL_MBED_LIBRARY_BUILD = get_mbed_official_release('2')
@@ -145,6 +146,10 @@ if __name__ == '__main__':
         # Runs test suite in CLI mode
         test_summary, shuffle_seed, test_summary_ext, test_suite_properties_ext, new_build_report, new_build_properties = single_test.execute()
     else:
+        # Every target and toolchain scans the same sources; list them once
+        # and let each build filter them by its labels in memory
+        source_tree = SourceTree(ROOT, exclude_paths=[BUILD_DIR])
+
         for target_name, toolchain_list in OFFICIAL_MBED_LIBRARY_BUILD:
             if platforms is not None and not target_name in platforms:
                 print("Excluding %s from release" % target_name)
@@ -176,7 +181,8 @@ if __name__ == '__main__':
                                                      jobs=options.jobs,
                                                      report=build_report,
                                                      properties=build_properties,
-                                                     build_profile=profile)
+                                                     build_profile=profile,
+                                                     source_tree=source_tree)
 
                 except Exception, e:
                     print str(e)
@@ -15,15 +15,12 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from copy import deepcopy
+from copy import copy
 import os
 from os.path import dirname, abspath, exists, join
 import sys
 from collections import namedtuple
 from os.path import splitext, relpath
-from intelhex import IntelHex
-from jinja2 import FileSystemLoader, StrictUndefined
-from jinja2.environment import Environment
 # Implementation of mbed configuration mechanism
 from tools.utils import json_file_to_dict, intelhex_offset
 from tools.arm_pack_manager import Cache
@@ -433,7 +430,8 @@ class Config(object):
 
         else:
             self.target = tgt
-        self.target = deepcopy(self.target)
+        # Overrides are set on a copy, to keep the target shared
+        self.target = copy(self.target)
         self.target_labels = self.target.labels
 
         self.cumulative_overrides = {key: ConfigCumulativeOverride(key)
@@ -930,6 +928,8 @@ class Config(object):
                             [len(m.macro_value or "") for m in macros.values()]
                             + [0]),
         }
+        from jinja2 import FileSystemLoader, StrictUndefined
+        from jinja2.environment import Environment
         jinja_loader = FileSystemLoader(dirname(abspath(__file__)))
         jinja_environment = Environment(loader=jinja_loader,
                                         undefined=StrictUndefined)
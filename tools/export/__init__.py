@@ -22,45 +22,65 @@ from os import makedirs, walk
 import copy
 from shutil import rmtree, copyfile
 import zipfile
+from collections import Mapping
+from importlib import import_module
 ROOT = abspath(join(dirname(__file__), ".."))
 sys.path.insert(0, ROOT)
 
 from tools.build_api import prepare_toolchain
 from tools.build_api import scan_resources
 from tools.toolchains import Resources
-from tools.export import lpcxpresso, ds5_5, iar, makefile
-from tools.export import embitz, coide, kds, simplicity, atmelstudio
-from tools.export import sw4stm32, e2studio, zip, cmsis, uvision, cdt, vscode
-from tools.export import gnuarmeclipse
-from tools.export import qtcreator
 from tools.targets import TARGET_NAMES
 
-EXPORTERS = {
-    'uvision5': uvision.Uvision,
-    'uvision': uvision.Uvision,
-    'lpcxpresso': lpcxpresso.LPCXpresso,
-    'gcc_arm': makefile.GccArm,
-    'make_gcc_arm': makefile.GccArm,
-    'make_armc5': makefile.Armc5,
-    'make_iar': makefile.IAR,
-    'ds5_5': ds5_5.DS5_5,
-    'iar': iar.IAR,
-    'embitz' : embitz.EmBitz,
-    'coide' : coide.CoIDE,
-    'kds' : kds.KDS,
-    'simplicityv3' : simplicity.SimplicityV3,
-    'atmelstudio' : atmelstudio.AtmelStudio,
-    'sw4stm32'    : sw4stm32.Sw4STM32,
-    'e2studio' : e2studio.E2Studio,
-    'eclipse_gcc_arm'  : cdt.EclipseGcc,
-    'eclipse_iar'      : cdt.EclipseIAR,
-    'eclipse_armc5'    : cdt.EclipseArmc5,
-    'gnuarmeclipse': gnuarmeclipse.GNUARMEclipse,
-    'qtcreator': qtcreator.QtCreator,
-    'vscode_gcc_arm' : vscode.VSCodeGcc,
-    'vscode_iar' : vscode.VSCodeIAR,
-    'vscode_armc5' : vscode.VSCodeArmc5
-}
+
+class ExporterRegistry(Mapping):
+    """The exporter classes, keyed on the name of the IDE. The module of an
+    exporter is only imported when the exporter is first looked up.
+    """
+    def __init__(self, exporters):
+        self._exporters = exporters
+        self._classes = {}
+
+    def __getitem__(self, ide):
+        if ide not in self._classes:
+            module, name = self._exporters[ide]
+            self._classes[ide] = getattr(
+                import_module("tools.export." + module), name)
+        return self._classes[ide]
+
+    def __iter__(self):
+        return iter(self._exporters)
+
+    def __len__(self):
+        return len(self._exporters)
+
+
+EXPORTERS = ExporterRegistry({
+    'uvision5': ('uvision', 'Uvision'),
+    'uvision': ('uvision', 'Uvision'),
+    'lpcxpresso': ('lpcxpresso', 'LPCXpresso'),
+    'gcc_arm': ('makefile', 'GccArm'),
+    'make_gcc_arm': ('makefile', 'GccArm'),
+    'make_armc5': ('makefile', 'Armc5'),
+    'make_iar': ('makefile', 'IAR'),
+    'ds5_5': ('ds5_5', 'DS5_5'),
+    'iar': ('iar', 'IAR'),
+    'embitz' : ('embitz', 'EmBitz'),
+    'coide' : ('coide', 'CoIDE'),
+    'kds' : ('kds', 'KDS'),
+    'simplicityv3' : ('simplicity', 'SimplicityV3'),
+    'atmelstudio' : ('atmelstudio', 'AtmelStudio'),
+    'sw4stm32'    : ('sw4stm32', 'Sw4STM32'),
+    'e2studio' : ('e2studio', 'E2Studio'),
+    'eclipse_gcc_arm'  : ('cdt', 'EclipseGcc'),
+    'eclipse_iar'      : ('cdt', 'EclipseIAR'),
+    'eclipse_armc5'    : ('cdt', 'EclipseArmc5'),
+    'gnuarmeclipse': ('gnuarmeclipse', 'GNUARMEclipse'),
+    'qtcreator': ('qtcreator', 'QtCreator'),
+    'vscode_gcc_arm' : ('vscode', 'VSCodeGcc'),
+    'vscode_iar' : ('vscode', 'VSCodeIAR'),
+    'vscode_armc5' : ('vscode', 'VSCodeArmc5')
+})
 
 ERROR_MESSAGE_UNSUPPORTED_TOOLCHAIN = """
 Sorry, the target %s is not currently supported on the %s toolchain.
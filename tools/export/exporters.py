@@ -4,8 +4,6 @@ from abc import abstractmethod, ABCMeta
 import logging
 from os.path import join, dirname, relpath, basename, realpath, normpath
 from itertools import groupby
-from jinja2 import FileSystemLoader, StrictUndefined
-from jinja2.environment import Environment
 import copy
 
 from tools.targets import TARGET_MAP
@@ -69,8 +67,6 @@ class Exporter(object):
         self.target = target
         self.project_name = project_name
         self.toolchain = toolchain
-        jinja_loader = FileSystemLoader(os.path.dirname(os.path.abspath(__file__)))
-        self.jinja_environment = Environment(loader=jinja_loader)
         self.resources = resources
         self.generated_files = []
         self.static_files = (
@@ -118,6 +114,15 @@ class Exporter(object):
                 config_header)
         return flags
 
+    @property
+    def jinja_environment(self):
+        """A jinja environment that loads templates from the exporters"""
+        from jinja2 import FileSystemLoader
+        from jinja2.environment import Environment
+        jinja_loader = FileSystemLoader(
+            os.path.dirname(os.path.abspath(__file__)))
+        return Environment(loader=jinja_loader)
+
     def get_source_paths(self):
         """Returns a list of the directories where source files are contained"""
         source_keys = ['s_sources', 'c_sources', 'cpp_sources', 'hex_files',
@@ -129,6 +134,8 @@ class Exporter(object):
 
     def gen_file(self, template_file, data, target_file, **kwargs):
         """Generates a project file from a template using jinja"""
+        from jinja2 import FileSystemLoader, StrictUndefined
+        from jinja2.environment import Environment
         jinja_loader = FileSystemLoader(
             os.path.dirname(os.path.abspath(__file__)))
         jinja_environment = Environment(loader=jinja_loader,
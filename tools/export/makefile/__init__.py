@@ -20,7 +20,6 @@ from os import remove
 import sys
 from subprocess import check_output, CalledProcessError, Popen, PIPE
 import shutil
-from jinja2.exceptions import TemplateNotFound
 from tools.export.exporters import Exporter, apply_supported_whitelist
 from tools.utils import NotSupportedException
 from tools.targets import TARGET_MAP
@@ -119,6 +118,7 @@ class Makefile(Exporter):
             ctx[key] = sorted(ctx[key])
         ctx.update(self.format_flags())
 
+        from jinja2.exceptions import TemplateNotFound
         for templatefile in \
             ['makefile/%s_%s.tmpl' % (self.TEMPLATE,
                                       self.target.lower())] + \
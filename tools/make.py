@@ -51,6 +51,7 @@ from tools.build_api import merge_build_data
 from utils import argparse_filestring_type
 from utils import argparse_many
 from utils import argparse_dir_not_parent
+from utils import argparse_size_type
 from tools.toolchains import mbedToolchain, TOOLCHAIN_CLASSES, TOOLCHAIN_PATHS
 from tools.settings import CLI_COLOR_MAP
 
@@ -119,6 +120,36 @@ if __name__ == '__main__':
         default=2,
         help="Depth level for static memory report")
 
+    parser.add_argument(
+        "--content-hash",
+        action="store_true",
+        dest="content_hash",
+        default=False,
+        help="Rebuild objects based on the contents of their sources instead "
+        "of modification times")
+
+    parser.add_argument(
+        "--object-cache",
+        dest="object_cache",
+        default=None,
+        help="Directory of a compiled object cache shared between builds")
+
+    parser.add_argument(
+        "--object-cache-size",
+        type=argparse_size_type,
+        dest="object_cache_size",
+        default=None,
+        help="Maximum size of the object cache, in megabytes unless followed "
+        "by K, M or G (default: 5G)")
+
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        dest="deterministic",
+        default=False,
+        help="Leave the build time and absolute paths out of compiled "
+        "objects, so that building the same sources gives the same objects")
+
     # Local run
     parser.add_argument("--automated", action="store_true", dest="automated",
                       default=False, help="Automated test")
@@ -293,7 +324,11 @@ if __name__ == '__main__':
                                      build_profile=extract_profile(parser,
                                                                    options,
                                                                    toolchain),
-                                     stats_depth=options.stats_depth)
+                                     stats_depth=options.stats_depth,
+                                     content_hash=options.content_hash,
+                                     object_cache=options.object_cache,
+                                     object_cache_size=options.object_cache_size,
+                                     deterministic=options.deterministic)
             print 'Image: %s'% bin_file
 
             if options.disk:
@@ -8,8 +8,6 @@ import re
 import csv
 import json
 import argparse
-from copy import deepcopy
-from prettytable import PrettyTable
 
 from utils import argparse_filestring_type, \
     argparse_lowercase_hyphen_type, argparse_uppercase_type
@@ -20,6 +18,19 @@ RE_IAR = re.compile(
     r'^\s+(.+)\s+(zero|const|ro code|inited|uninit)\s'
     r'+0x(\w{8})\s+0x(\w+)\s+(.+)\s.+$')
 
+# A section of an object (address, size, object) or, failing that, a fill
+# (address, size)
+RE_SECTION_GCC = re.compile(
+    r'^\s+(?:.*0x(\w{8,16})\s+0x(\w+)\s(.+)|'
+    r'\*fill\*\s+0x(\w{8,16})\s+0x(\w+).*)$')
+RE_OBJECT_FILE_GCC = re.compile(r'^.+\/(.+\.o)$')
+RE_LIBRARY_OBJECT_GCC = re.compile(r'^.+\/(lib.+\.a)\((.+\.o)\)$')
+RE_OBJECT_ARMCC = re.compile(r'(.+\.l)\((.+\.o)\)')
+RE_LIBRARY_IAR = re.compile(r'^(.+\.a)\:.+$')
+RE_OBJECT_LIBRARY_IAR = re.compile(r'^\s+(.+\.o)\s.*')
+RE_PATH_MAP_FILE = re.compile(r'^(.+)\/.+\.map$')
+RE_PATH_TESTS_MAP_FILE = re.compile(r'^(.+)\/mbed-os\/.*TESTS\/.+\.map$')
+
 class MemapParser(object):
     """An object that represents parsed results, parses the memory map files,
     and writes out different file types of memory results
@@ -45,10 +56,23 @@ class MemapParser(object):
         self.modules = dict()       # full list - doesn't change with depth
         self.short_modules = dict() # short version with specific depth
 
+        # modules by object file name, see module_index
+        self._basenames = dict()
+        self._indexed_modules = None
+
+        # directories that objects are named relative to, see module_path
+        self.search_paths = []
+        self._module_paths = dict()
+
         # sections must be defined in this order to take irrelevant out
         self.all_sections = self.sections + self.other_sections + \
                             self.misc_flash_sections + ('unknown', 'OUTPUT')
 
+        # matches the name of any section at the start of a line, trying
+        # sections in the same order as all_sections
+        self._re_section = re.compile(
+            '|'.join(re.escape(section) for section in self.all_sections))
+
         # Memory report (sections + summary)
         self.mem_report = []
 
@@ -64,6 +88,8 @@ class MemapParser(object):
         """ Removes modules/objects that were compiled but are not used
         """
 
+        self.module_index()
+
         # Using keys to be able to remove entry
         for i in self.modules.keys():
             size = 0
@@ -71,6 +97,38 @@ class MemapParser(object):
                 size += self.modules[i][k]
             if size == 0:
                 del self.modules[i]
+                self._index_remove(i)
+
+    def module_index(self):
+        """ Returns a dictionary that maps object file names to the paths of
+        the modules with that name, in the order they were added. It is
+        rebuilt whenever self.modules is replaced
+        """
+
+        if self._indexed_modules is not self.modules:
+            self._basenames = dict()
+            for module_path in self.modules:
+                self._basenames.setdefault(os.path.basename(module_path),
+                                           []).append(module_path)
+            self._indexed_modules = self.modules
+        return self._basenames
+
+    def _index_add(self, object_name):
+        self.module_index().setdefault(os.path.basename(object_name),
+                                       []).append(object_name)
+
+    def _index_remove(self, object_name):
+        index = self.module_index()
+        obj_split = os.path.basename(object_name)
+        index[obj_split].remove(object_name)
+        if not index[obj_split]:
+            del index[obj_split]
+
+    def new_module(self):
+        """ Returns a module with all of its sections empty
+        """
+
+        return dict.fromkeys(self.all_sections, 0)
 
     def module_init(self, object_name):
         """ Initialize a module. Just adds the name of the module
@@ -80,10 +138,9 @@ class MemapParser(object):
         """
 
         if object_name not in self.modules:
-            temp_dic = dict()
-            for section_idx in self.all_sections:
-                temp_dic[section_idx] = 0
-            self.modules[object_name] = temp_dic
+            self.module_index()
+            self.modules[object_name] = self.new_module()
+            self._index_add(object_name)
 
     def module_add(self, object_name, size, section):
         """ Adds a module / section to the list
@@ -94,22 +151,18 @@ class MemapParser(object):
         section - the section the module contributes to
         """
 
-        # Check if object is a sub-string of key
-        for module_path in self.modules:
-
-            # this is required to differenciate: main.o vs xxxmain.o
-            module_split = os.path.basename(module_path)
-            obj_split = os.path.basename(object_name)
+        # Match on the object file name only, to differenciate main.o vs
+        # xxxmain.o
+        module_paths = self.module_index().get(os.path.basename(object_name))
 
-            if module_split == obj_split:
-                self.modules[module_path][section] += size
-                return
+        if module_paths:
+            self.modules[module_paths[0]][section] += size
+            return
 
-        new_module = dict()
-        for section_idx in self.all_sections:
-            new_module[section_idx] = 0
+        new_module = self.new_module()
         new_module[section] = size
         self.modules[object_name] = new_module
+        self._index_add(object_name)
 
     def module_replace(self, old_object, new_object):
         """ Replaces an object name with a new one
@@ -117,8 +170,11 @@ class MemapParser(object):
 
         # Check if object is a sub-string of key
         if old_object in self.modules:
+            self.module_index()
             self.modules[new_object] = self.modules[old_object]
             del self.modules[old_object]
+            self._index_remove(old_object)
+            self._index_add(new_object)
 
     def check_new_section_gcc(self, line):
         """ Check whether a new section in a map file has been detected (only
@@ -128,10 +184,11 @@ class MemapParser(object):
         line - the line to check for a new section
         """
 
-        for i in self.all_sections:
-            if line.startswith(i):
-                # should name of the section (assuming it's a known one)
-                return i
+        test_re_section = self._re_section.match(line)
+
+        if test_re_section:
+            # should name of the section (assuming it's a known one)
+            return test_re_section.group(0)
 
         if line.startswith('.'):
             return 'unknown'     # all others are classified are unknown
@@ -147,8 +204,7 @@ class MemapParser(object):
         """
 
         line = line.replace('\\', '/')
-        RE_OBJECT_FILE = r'^.+\/(.+\.o)$'
-        test_re_mbed_os_name = re.match(RE_OBJECT_FILE, line)
+        test_re_mbed_os_name = RE_OBJECT_FILE_GCC.match(line)
 
         if test_re_mbed_os_name:
 
@@ -156,14 +212,13 @@ class MemapParser(object):
 
             # corner case: certain objects are provided by the GCC toolchain
             if 'arm-none-eabi' in line:
-                object_name = '[lib]/misc/' + object_name
+                return '[lib]/misc/' + object_name
 
-            return object_name
+            return self.module_path(line)
 
         else:
 
-            RE_LIBRARY_OBJECT_FILE = r'^.+\/(lib.+\.a)\((.+\.o)\)$'
-            test_re_obj_name = re.match(RE_LIBRARY_OBJECT_FILE, line)
+            test_re_obj_name = RE_LIBRARY_OBJECT_GCC.match(line)
 
             if test_re_obj_name:
                 object_name = test_re_obj_name.group(1) + '/' + \
@@ -186,12 +241,12 @@ class MemapParser(object):
         line - the line to parse a section from
         """
 
-        RE_STD_SECTION_GCC = re.compile(
-            r'^\s+.*0x(\w{8,16})\s+0x(\w+)\s(.+)$')
+        test_address_len_name = RE_SECTION_GCC.match(line)
 
-        test_address_len_name = re.match(RE_STD_SECTION_GCC, line)
+        if not test_address_len_name:
+            return ["", 0] # no valid entry
 
-        if test_address_len_name:
+        elif test_address_len_name.group(2):
 
             if int(test_address_len_name.group(2), 16) == 0: # size == 0
                 return ["", 0] # no valid entry
@@ -206,19 +261,12 @@ class MemapParser(object):
             #  example
             # *fill*         0x0000abe4        0x4
 
-            RE_FILL_SECTION_GCC = r'^\s+\*fill\*\s+0x(\w{8,16})\s+0x(\w+).*$'
-
-            test_address_len = re.match(RE_FILL_SECTION_GCC, line)
-
-            if test_address_len:
-                if int(test_address_len.group(2), 16) == 0: # size == 0
-                    return ["", 0] # no valid entry
-                else:
-                    o_name = '[fill]'
-                    o_size = int(test_address_len.group(2), 16)
-                    return [o_name, o_size]
-            else:
+            if int(test_address_len_name.group(5), 16) == 0: # size == 0
                 return ["", 0] # no valid entry
+            else:
+                o_name = '[fill]'
+                o_size = int(test_address_len_name.group(5), 16)
+                return [o_name, o_size]
 
 
     def parse_map_file_gcc(self, file_desc):
@@ -269,8 +317,7 @@ class MemapParser(object):
 
         else:
 
-            RE_OBJECT_ARMCC = r'(.+\.l)\((.+\.o)\)'
-            test_re_obj_name = re.match(RE_OBJECT_ARMCC, line)
+            test_re_obj_name = RE_OBJECT_ARMCC.match(line)
 
             if test_re_obj_name:
                 object_name = test_re_obj_name.group(1) + '/' + \
@@ -420,9 +467,7 @@ class MemapParser(object):
 
         """
 
-        RE_LIBRARY_IAR = re.compile(r'^(.+\.a)\:.+$')
-
-        test_address_line = re.match(RE_LIBRARY_IAR, line)
+        test_address_line = RE_LIBRARY_IAR.match(line)
 
         if test_address_line:
             return test_address_line.group(1)
@@ -441,9 +486,7 @@ class MemapParser(object):
 
         """
 
-        RE_OBJECT_LIBRARY_IAR = re.compile(r'^\s+(.+\.o)\s.*')
-
-        test_address_line = re.match(RE_OBJECT_LIBRARY_IAR, line)
+        test_address_line = RE_OBJECT_LIBRARY_IAR.match(line)
 
         if test_address_line:
             return test_address_line.group(1)
@@ -495,63 +538,91 @@ class MemapParser(object):
 
     export_formats = ["json", "csv-ci", "table"]
 
-    def list_dir_obj(self, path):
-        """ Searches all objects in BUILD directory and creates list
+    def set_search_paths(self, path):
+        """ Finds the directories that objects are named relative to: the
+        BUILD directory and, for TESTS, the directory holding mbed-os
 
         Positional arguments:
-        path - the path to a map file
+        path - the absolute path to a map file
+
+        Returns: False if the map file is not in an mbed project
         """
 
         path = path.replace('\\', '/')
+        self.search_paths = []
+        self._module_paths = dict()
 
         # check location of map file
-        RE_PATH_MAP_FILE = r'^(.+)\/.+\.map$'
-        test_re = re.match(RE_PATH_MAP_FILE, path)
+        test_re = RE_PATH_MAP_FILE.match(path)
 
         if test_re:
-            search_path = test_re.group(1)
+            self.search_paths.append(test_re.group(1))
         else:
             print "Warning: this doesn't look like an mbed project"
-            return
+            return False
 
-        # create empty disctionary
-        self.modules = dict()
+        # The code below is a special case for TESTS.
+        # mbed-os lives in a separate location and we need to explicitly search
+        # their object files skiping the TESTS folder (already scanned above)
 
-        # search for object files
-        for root, _, obj_files in os.walk(search_path):
-            for obj_file in obj_files:
-                if obj_file.endswith(".o"):
+        # check location of mbed-os
+        test_re = RE_PATH_TESTS_MAP_FILE.match(path)
 
-                    txt = os.path.join(root, obj_file)
+        if test_re:
+            self.search_paths.append(test_re.group(1))
 
-                    txt = txt.replace('\\', '/')
+        return True
 
-                    # add relative path + object to list
-                    self.module_init(txt[len(search_path)+1:])
+    def module_path(self, object_path):
+        """ Names a module after the path of its object file, relative to the
+        first search path that contains it. Objects outside of the search paths
+        are named after the object file alone
 
-        # The code below is a special case for TESTS.
-        # mbed-os lives in a separate location and we need to explicitly search
-        # their object files skiping the TESTS folder (already scanned above)
+        Positional arguments:
+        object_path - the path of an object file, as found in a map file
+        """
 
-        # check location of mbed-os
-        RE_PATH_MAP_FILE = r'^(.+)\/mbed-os\/.*TESTS\/.+\.map$'
-        test_re = re.match(RE_PATH_MAP_FILE, path)
+        if object_path not in self._module_paths:
+            path = os.path.abspath(object_path).replace('\\', '/')
+            module_name = os.path.basename(path)
+
+            for idx, search_path in enumerate(self.search_paths):
+                if path.startswith(search_path + '/') and \
+                   (idx == 0 or 'TESTS' not in os.path.dirname(path)):
+                    module_name = path[len(search_path)+1:]
+                    break
+
+            self._module_paths[object_path] = module_name
+
+        return self._module_paths[object_path]
+
+    def list_dir_obj(self, path):
+        """ Searches all objects in BUILD directory and creates list
+
+        Positional arguments:
+        path - the path to a map file
+        """
 
-        if test_re == None:
+        if not self.set_search_paths(path):
             return
 
-        search_path = test_re.group(1)
+        # create empty disctionary
+        self.modules = dict()
 
         # search for object files
-        for root, _, obj_files in os.walk(search_path):
-            for obj_file in obj_files:
-                if 'TESTS' not in root and obj_file.endswith(".o"):
+        for idx, search_path in enumerate(self.search_paths):
+            for root, _, obj_files in os.walk(search_path):
+                if idx > 0 and 'TESTS' in root:
+                    continue
+
+                for obj_file in obj_files:
+                    if obj_file.endswith(".o"):
 
-                    txt = os.path.join(root, obj_file)
-                    txt = txt.replace('\\', '/')
+                        txt = os.path.join(root, obj_file)
+                        txt = txt.replace('\\', '/')
 
-                    # add relative path + object to list
-                    self.module_init(txt[len(search_path)+1:])
+                        # add relative path + object to list
+                        self.module_init(txt[len(search_path)+1:])
 
 
     def reduce_depth(self, depth):
@@ -571,40 +642,24 @@ class MemapParser(object):
 
         # depth 0 or None shows all entries
         if depth == 0 or depth == None:
-            self.short_modules = deepcopy(self.modules)
+            self.short_modules = dict((name, dict(sections)) for name, sections
+                                      in self.modules.iteritems())
             return
 
         self.short_modules = dict()
 
         # create reduced list
-        for line in self.modules:
-
-            data = line.split('/')
-            ndir = len(data)
-
-            temp = ''
-            count = 0
-
-            # iterate until the max depth level
-            max_level = min(depth, ndir)
+        for line, sections in self.modules.iteritems():
 
             # rebuild the path based on depth level
-            while count < max_level:
-                if count > 0:    # ignore '/' from first entry
-                    temp = temp + '/'
-
-                temp = temp + data[count]
-                count += 1
+            temp = '/'.join(line.split('/')[:depth])
 
             if temp not in self.short_modules:
-                temp_dic = dict()
-                for section_idx in self.all_sections:
-                    temp_dic[section_idx] = 0
-                self.short_modules[temp] = temp_dic
-
-            for section_idx in self.all_sections:
-                self.short_modules[temp][section_idx] += \
-                    self.modules[line][section_idx]
+                self.short_modules[temp] = dict(sections)
+            else:
+                short_module = self.short_modules[temp]
+                for section_idx, size in sections.iteritems():
+                    short_module[section_idx] += size
 
 
     export_formats = ["json", "csv-ci", "table"]
@@ -687,6 +742,8 @@ class MemapParser(object):
 
         Returns: string of the generated table
         """
+        from prettytable import PrettyTable
+
         # Create table
         columns = ['Module']
         columns.extend(self.print_sections)
@@ -766,15 +823,19 @@ class MemapParser(object):
         try:
             with open(mapfile, 'r') as file_input:
 
-                # Common to all toolchains: first search for objects in BUILD
-                self.list_dir_obj(os.path.abspath(mapfile))
-
                 if toolchain == "ARM" or toolchain == "ARM_STD" or\
                   toolchain == "ARM_MICRO":
+                    # armcc and IAR maps only name the object files, the
+                    # directories come from the objects in BUILD
+                    self.list_dir_obj(os.path.abspath(mapfile))
                     self.parse_map_file_armcc(file_input)
                 elif toolchain == "GCC_ARM" or toolchain == "GCC_CR":
+                    # gcc maps have the path of every object
+                    self.modules = dict()
+                    self.set_search_paths(os.path.abspath(mapfile))
                     self.parse_map_file_gcc(file_input)
                 elif toolchain == "IAR":
+                    self.list_dir_obj(os.path.abspath(mapfile))
                     self.parse_map_file_iar(file_input)
                 else:
                     result = False
@@ -0,0 +1,246 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import sys
+import json
+from os import stat, walk, remove, rename, utime, makedirs, getpid
+from os.path import join, exists, splitext, isfile, dirname
+from hashlib import md5
+from time import time
+from distutils.spawn import find_executable
+
+# Digests of the files read so far, keyed on path, size, mtime and ctime
+_FILE_DIGESTS = {}
+
+# Files modified this recently may still change within the mtime resolution
+# of the file system, so their digests are not remembered
+RACY_SECONDS = 2
+
+
+def file_digest(path):
+    """Return the md5 digest of the contents of a file
+
+    Raises IOError or OSError if the file can not be read
+    """
+    info = stat(path)
+    key = (path, info.st_size, info.st_mtime, info.st_ctime)
+    if key not in _FILE_DIGESTS:
+        with open(path, "rb") as fd:
+            digest = md5(fd.read()).hexdigest()
+        if time() - max(info.st_mtime, info.st_ctime) <= RACY_SECONDS:
+            return digest
+        _FILE_DIGESTS[key] = digest
+    return _FILE_DIGESTS[key]
+
+
+def _write_file(path, contents):
+    """Replace a file atomically, so that concurrent readers never see it
+    partially written"""
+    tmp_file = "%s.%d" % (path, getpid())
+    with open(tmp_file, "wb") as fd:
+        fd.write(contents)
+    if sys.platform == "win32" and exists(path):
+        remove(path)
+    rename(tmp_file, path)
+
+
+class ObjectCache(object):
+    """A content addressed cache of compiled objects, shared by any number of
+    build directories
+
+    Objects are looked up in two steps, like the direct mode of ccache. The
+    compiler, the command line (with build directory specific paths replaced)
+    and the contents of the source select a manifest. The manifest lists the
+    objects compiled with that input along with the digests of every header
+    they depend on; the first object whose headers are all unchanged is used.
+    """
+    DEFAULT_MAX_SIZE = 5 * 1024 * 1024 * 1024
+
+    # Number of objects remembered for a single source and command line
+    MAX_MANIFEST_ENTRIES = 16
+
+    # Minimum time, in seconds, between two size checks of the cache
+    CLEANUP_INTERVAL = 10 * 60
+
+    # Placeholders for the paths that differ between build directories
+    OBJECT = "<OBJECT>"
+    BUILD_DIR = "<BUILD_DIR>"
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    @staticmethod
+    def _compiler_id(compiler):
+        """Identify a compiler by its location, size and modification time"""
+        exe = compiler if isfile(compiler) else find_executable(compiler)
+        if not exe:
+            return compiler
+        info = stat(exe)
+        return "%s:%d:%d" % (exe, info.st_size, info.st_mtime)
+
+    def _generalize(self, job, text):
+        base, _ = splitext(job['object'])
+        text = text.replace(base, self.OBJECT)
+        if job['build_dir'] not in ("", "."):
+            text = text.replace(job['build_dir'], self.BUILD_DIR)
+        return text
+
+    def _specialize(self, job, text):
+        base, _ = splitext(job['object'])
+        text = text.replace(self.OBJECT, base)
+        return text.replace(self.BUILD_DIR, job['build_dir'])
+
+    def _manifest_path(self, job):
+        digest = md5()
+        for command in job['commands']:
+            # The build timestamp changes on every build and would prevent
+            # any object from being found
+            digest.update(self._compiler_id(command[0]))
+            digest.update(repr([self._generalize(job, arg)
+                                for arg in command[1:]
+                                if 'MBED_BUILD_TIMESTAMP=' not in arg]))
+        digest.update(file_digest(job['source']))
+        key = digest.hexdigest()
+        return join(self.path, key[:2], key + ".manifest")
+
+    def _object_path(self, key):
+        return join(self.path, key[:2], key)
+
+    @staticmethod
+    def _read_manifest(path):
+        try:
+            with open(path) as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return []
+
+    def fetch(self, job):
+        """Place a cached object (and its dependency file) for a compile job
+
+        Positional arguments:
+        job - a compile job as passed to compile_worker
+
+        Return value:
+        The compiler output recorded with the object, or None on a miss
+        """
+        try:
+            manifest_path = self._manifest_path(job)
+        except (IOError, OSError):
+            return None
+        for entry in self._read_manifest(manifest_path):
+            try:
+                if any(file_digest(self._specialize(job, dep)) != digest
+                       for dep, digest in entry['deps'].items()):
+                    continue
+                obj = self._object_path(entry['object'])
+                with open(obj + ".o", "rb") as fd:
+                    contents = fd.read()
+                with open(obj + ".d", "rb") as fd:
+                    dependencies = fd.read()
+                _write_file(job['object'], contents)
+                _write_file(job['dep_path'],
+                            self._specialize(job, dependencies))
+                # The modification time tracks use, for least recently used
+                # eviction
+                utime(obj + ".o", None)
+                utime(manifest_path, None)
+            except (IOError, OSError):
+                continue
+            return entry['output'].encode("utf-8")
+        return None
+
+    def store(self, job, dependencies, output):
+        """Add the result of a successful compile job to the cache
+
+        Positional arguments:
+        job - the compile job that produced the object
+        dependencies - the headers the object was built from, as parsed from
+                       its dependency file
+        output - the output of the compiler
+        """
+        try:
+            manifest_path = self._manifest_path(job)
+            deps = dict((self._generalize(job, dep), file_digest(dep))
+                        for dep in dependencies if dep != job['source'])
+            with open(job['object'], "rb") as fd:
+                contents = fd.read()
+            with open(job['dep_path'], "rb") as fd:
+                dep_file = self._generalize(job, fd.read())
+            key = md5(manifest_path + repr(sorted(deps.items()))).hexdigest()
+            obj = self._object_path(key)
+            for directory in [dirname(obj), dirname(manifest_path)]:
+                if not exists(directory):
+                    makedirs(directory)
+            _write_file(obj + ".o", contents)
+            _write_file(obj + ".d", dep_file)
+
+            manifest = [entry for entry in self._read_manifest(manifest_path)
+                        if entry['object'] != key]
+            manifest.insert(0, {'deps': deps, 'object': key,
+                                'output': output})
+            _write_file(manifest_path, json.dumps(
+                manifest[:self.MAX_MANIFEST_ENTRIES]))
+        except (IOError, OSError, ValueError):
+            pass
+
+    def cleanup(self):
+        """Evict the least recently used files until the cache is back
+        under 90% of its maximum size. The size is checked at most once every
+        CLEANUP_INTERVAL seconds"""
+        stamp = join(self.path, "last_cleanup")
+        try:
+            if time() - stat(stamp).st_mtime < self.CLEANUP_INTERVAL:
+                return
+        except OSError:
+            pass
+        try:
+            if not exists(self.path):
+                makedirs(self.path)
+            open(stamp, "w").close()
+        except (IOError, OSError):
+            return
+        # An object and its dependency file are evicted together, any other
+        # file (manifests, temporary files left by an interrupted build) on
+        # its own
+        entries = {}
+        total = 0
+        for root, _, files in walk(self.path):
+            for name in files:
+                path = join(root, name)
+                if path == stamp:
+                    continue
+                try:
+                    info = stat(path)
+                except OSError:
+                    continue
+                base, ext = splitext(path)
+                key = base if ext in (".o", ".d") else path
+                mtime, size, paths = entries.get(key, (0, 0, []))
+                entries[key] = (max(mtime, info.st_mtime),
+                                size + info.st_size, paths + [path])
+                total += info.st_size
+        if total <= self.max_size:
+            return
+        for _, size, paths in sorted(entries.values()):
+            if total <= self.max_size * 0.9:
+                break
+            for path in paths:
+                try:
+                    remove(path)
+                except OSError:
+                    pass
+            total -= size
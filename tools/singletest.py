@@ -256,7 +256,8 @@ if __name__ == '__main__':
                                    _opts_waterfall_test=opts.waterfall_test,
                                    _opts_consolidate_waterfall_test=opts.consolidate_waterfall_test,
                                    _opts_extend_test_timeout=opts.extend_test_timeout,
-                                   _opts_auto_detect=opts.auto_detect)
+                                   _opts_auto_detect=opts.auto_detect,
+                                   _opts_build_workers=opts.build_workers)
 
     # Runs test suite in CLI mode
     if (singletest_in_cli_mode(single_test)):
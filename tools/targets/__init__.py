@@ -19,7 +19,6 @@ import os
 import binascii
 import struct
 import shutil
-import inspect
 import sys
 from copy import copy
 from collections import namedtuple, Mapping
@@ -95,8 +94,8 @@ def target(name, json_data):
     resolution_order = get_resolution_order(json_data, name, [])
     resolution_order_names = [tgt for tgt, _ in resolution_order]
     return Target(name=name,
-                  json_data={key: value for key, value in json_data.items()
-                             if key in resolution_order_names},
+                  json_data={key: json_data[key]
+                             for key in resolution_order_names},
                   resolution_order=resolution_order,
                   resolution_order_names=resolution_order_names)
 
@@ -164,6 +163,7 @@ class Target(namedtuple("Target", "name json_data resolution_order resolution_or
     @cached
     def get_module_data():
         """Get the members of this module using Python's "inspect" module"""
+        import inspect
         return dict([(m[0], m[1]) for m in
                      inspect.getmembers(sys.modules[__name__])])
 
@@ -317,6 +317,7 @@ class Target(namedtuple("Target", "name json_data resolution_order resolution_or
             hook_data = self.post_binary_hook
         except AttributeError:
             return
+        import inspect
         # A hook was found. The hook's name is in the format
         # "classname.functionname"
         temp = hook_data["function"].split(".")
@@ -36,7 +36,7 @@ from tools.targets import TARGET_MAP
 from tools.utils import mkdir, ToolException, NotSupportedException, args_error
 from tools.test_exporters import ReportExporter, ResultExporterType
 from utils import argparse_filestring_type, argparse_lowercase_type, argparse_many
-from utils import argparse_dir_not_parent
+from utils import argparse_dir_not_parent, argparse_size_type
 from tools.toolchains import mbedToolchain, TOOLCHAIN_PATHS, TOOLCHAIN_CLASSES
 from tools.settings import CLI_COLOR_MAP
 
@@ -106,6 +106,35 @@ if __name__ == '__main__':
                             default=2,
                             help="Depth level for static memory report")
 
+        parser.add_argument("--content-hash",
+                            action="store_true",
+                            dest="content_hash",
+                            default=False,
+                            help="Rebuild objects based on the contents of "
+                            "their sources instead of modification times")
+
+        parser.add_argument("--object-cache",
+                            dest="object_cache",
+                            default=None,
+                            help="Directory of a compiled object cache shared "
+                            "between builds")
+
+        parser.add_argument("--object-cache-size",
+                            type=argparse_size_type,
+                            dest="object_cache_size",
+                            default=None,
+                            help="Maximum size of the object cache, in "
+                            "megabytes unless followed by K, M or G "
+                            "(default: 5G)")
+
+        parser.add_argument("--deterministic",
+                            action="store_true",
+                            dest="deterministic",
+                            default=False,
+                            help="Leave the build time and absolute paths "
+                            "out of compiled objects, so that building the "
+                            "same sources gives the same objects")
+
         options = parser.parse_args()
 
         # Filter tests by path if specified
@@ -193,7 +222,11 @@ if __name__ == '__main__':
                               macros=options.macros, verbose=options.verbose,
                               notify=notify, archive=False,
                               app_config=options.app_config,
-                              build_profile=profile)
+                              build_profile=profile,
+                              content_hash=options.content_hash,
+                              object_cache=options.object_cache,
+                              object_cache_size=options.object_cache_size,
+                              deterministic=options.deterministic)
 
                 library_build_success = True
             except ToolException, e:
@@ -222,7 +255,12 @@ if __name__ == '__main__':
                         continue_on_build_fail=options.continue_on_build_fail,
                         app_config=options.app_config,
                         build_profile=profile,
-                        stats_depth=options.stats_depth)
+                        stats_depth=options.stats_depth,
+                        content_hash=options.content_hash,
+                        object_cache=options.object_cache,
+                        object_cache_size=options.object_cache_size,
+                        library_source_paths=base_source_paths,
+                        deterministic=options.deterministic)
 
                 # If a path to a test spec is provided, write it to a file
                 if options.test_spec:
@@ -0,0 +1,161 @@
+"""Tests for the pack downloader, against a local HTTP server"""
+import os
+import shutil
+import tempfile
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from mock import patch
+import pytest
+
+from tools.arm_pack_manager import Cache, Reader, do_queue
+
+
+class PackServer(HTTPServer):
+    """Serves files from a dictionary, with ETags and byte ranges. A file may
+    be cut short once, to simulate an interrupted download"""
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), PackHandler)
+        self.files = {}
+        self.requests = []
+        self.cut_once = set()
+        self.fail_once = set()
+        self.bad_range_once = set()
+
+
+class PackHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if self.path in server.fail_once:
+            server.fail_once.remove(self.path)
+            self.send_error(503)
+            return
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+        body = server.files[self.path]
+        etag = '"%d-%d"' % (len(body), hash(body) & 0xffff)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range") == etag:
+            start = int(byte_range.split("=")[1].split("-")[0])
+            if self.path in server.bad_range_once:
+                server.bad_range_once.remove(self.path)
+                start = 1
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" %
+                             (start, len(body) - 1, len(body)))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        if self.path in server.cut_once:
+            server.cut_once.remove(self.path)
+            self.wfile.write(body[start:start + len(body) // 2])
+            return
+        self.wfile.write(body[start:])
+
+
+@pytest.fixture
+def server():
+    server = PackServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache():
+    cache = Cache(True, False)
+    cache.data_path = tempfile.mkdtemp()
+    yield cache
+    shutil.rmtree(cache.data_path)
+
+
+def _url(server, path):
+    return "http://127.0.0.1:%d%s" % (server.server_port, path)
+
+
+def _cached(cache, server, path):
+    with open(os.path.join(cache.data_path, "127.0.0.1:%d%s" %
+                           (server.server_port, path)), "rb") as fd:
+        return fd.read()
+
+
+def test_revalidate(server, cache):
+    """Test that a cached file is only downloaded again when it changed"""
+    server.files["/Keil.A.pdsc"] = "first version"
+    url = _url(server, "/Keil.A.pdsc")
+    assert cache.cache_file(url)
+    assert _cached(cache, server, "/Keil.A.pdsc") == "first version"
+    assert not cache.cache_file(url)
+    assert "If-None-Match".lower() in server.requests[-1][1]
+
+    server.files["/Keil.A.pdsc"] = "second version"
+    assert cache.cache_file(url)
+    assert _cached(cache, server, "/Keil.A.pdsc") == "second version"
+
+
+def test_resume(server, cache):
+    """Test that an interrupted download is retried from where it stopped"""
+    body = "".join(chr(i % 256) for i in range(200000))
+    server.files["/Keil.A.pack"] = body
+    server.cut_once.add("/Keil.A.pack")
+    with patch("tools.arm_pack_manager.sleep") as _sleep:
+        assert cache.cache_file(_url(server, "/Keil.A.pack"))
+    assert _sleep.called
+    assert _cached(cache, server, "/Keil.A.pack") == body
+    assert server.requests[-1][1]["range"] == "bytes=100000-"
+
+
+def test_resume_bad_range(server, cache):
+    """Test that a partial answer that does not continue the interrupted
+    download restarts it from the beginning"""
+    body = "".join(chr(i % 256) for i in range(200000))
+    server.files["/Keil.A.pack"] = body
+    server.cut_once.add("/Keil.A.pack")
+    server.bad_range_once.add("/Keil.A.pack")
+    with patch("tools.arm_pack_manager.sleep"):
+        assert cache.cache_file(_url(server, "/Keil.A.pack"))
+    assert _cached(cache, server, "/Keil.A.pack") == body
+    assert "range" not in server.requests[-1][1]
+
+
+def test_local_errors(server, cache):
+    """Test that errors of the file system are reported like download
+    errors, and that a worker survives any error"""
+    server.files["/Keil.A.pdsc"] = "contents"
+    with patch("tools.arm_pack_manager.sleep"), \
+         patch("tools.arm_pack_manager.rename",
+               side_effect=OSError(13, "Permission denied")):
+        assert not cache.cache_file(_url(server, "/Keil.A.pdsc"))
+
+    done = []
+    def work(url):
+        if url == "bad":
+            raise KeyError(url)
+        done.append(url)
+    do_queue(Reader, work, ["bad", "good", "bad", "good"], threads=1)
+    assert done == ["good", "good"]
+
+
+def test_retry_errors(server, cache):
+    """Test that server errors are retried and missing files are not"""
+    server.files["/Keil.A.pdsc"] = "contents"
+    server.fail_once.add("/Keil.A.pdsc")
+    with patch("tools.arm_pack_manager.sleep"):
+        assert cache.cache_file(_url(server, "/Keil.A.pdsc"))
+        del server.requests[:]
+        assert not cache.cache_file(_url(server, "/Keil.B.pdsc"))
+    assert len(server.requests) == 1
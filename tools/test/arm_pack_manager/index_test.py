@@ -0,0 +1,167 @@
+"""Tests for the generation of the pack index from cached PDSC files"""
+import os
+import json
+from mock import patch
+import pytest
+
+import tools.arm_pack_manager as pack_manager
+from tools.arm_pack_manager import Cache
+
+PDSC = """<?xml version="1.0" encoding="UTF-8"?>
+<package schemaVersion="1.4" xmlns:xs="http://www.w3.org/2001/XMLSchema-instance">
+  <vendor>Keil</vendor>
+  <name>%(name)s</name>
+  <url>http://www.keil.com/pack</url>
+  <releases>
+    <release version="1.2.0">Second release</release>
+    <release version="1.10.0">Latest release</release>
+  </releases>
+  <boards>
+    <board vendor="Keil" name="%(board)s">
+      <mountedDevice deviceIndex="0" Dvendor="NXP:11" Dname="%(device)s"/>
+    </board>
+  </boards>
+  <devices>
+    <family Dfamily="LPC1700 Series" Dvendor="NXP:11">
+      <processor Dcore="Cortex-M3" DcoreVersion="r2p0"/>
+      <compile header="Device/Include/LPC17xx.h"/>
+      <debug svd="SVD/LPC176x5x.svd"/>
+      <subFamily DsubFamily="LPC176x">
+        <processor Dclock="100000000"/>
+        <device Dname="%(device)s">
+          <processor Dfpu="0" Dendian="Little-endian"/>
+          <compile define="LPC175x_6x"/>
+          <memory id="IROM1" start="0x00000000" size="0x80000" startup="1"/>
+          <memory id="IRAM1" start="0x10000000" size="0x8000"/>
+          <algorithm name="Flash\\LPC_IAP_512.FLM" start="0x00000000" size="0x80000" RAMstart="0x10000000" RAMsize="0x0FE0" default="1"/>
+        </device>
+        <device Dname="%(device)sB">
+          <memory id="IROM1" start="0x00000000" size="0x40000"/>
+        </device>
+      </subFamily>
+      <algorithm name="Flash/Family.FLM" start="0x00000000" size="0x10000"/>
+    </family>
+  </devices>
+</package>
+"""
+
+
+@pytest.fixture
+def cache(tmpdir):
+    cache = Cache(True, True)
+    cache.data_path = str(tmpdir.mkdir("cache"))
+    cache.urls = []
+    index = str(tmpdir.join("index.json"))
+    with patch("tools.arm_pack_manager.LocalPackIndex", index), \
+         patch("tools.arm_pack_manager.LocalPackSources",
+               str(tmpdir.join("index_sources.json"))), \
+         patch("tools.arm_pack_manager.LocalPackAliases",
+               str(tmpdir.join("aliases.json"))):
+        yield cache
+
+
+def _add_pdsc(cache, name, device, board):
+    url = "http://www.keil.com/pack/Keil.%s.pdsc" % name
+    path = os.path.join(cache.data_path, pack_manager.strip_protocol(url))
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(PDSC % dict(name=name, device=device, board=board))
+    if url not in cache.urls:
+        cache.urls.append(url)
+    return url
+
+
+def test_parsers_agree(cache):
+    """Test that devices extracted with ElementTree match those extracted
+    with BeautifulSoup"""
+    from bs4 import BeautifulSoup
+    url = _add_pdsc(cache, "LPC1700_DFP", "LPC1768", "MCB1700")
+    path = os.path.join(cache.data_path, pack_manager.strip_protocol(url))
+    with open(path) as fd:
+        soup = BeautifulSoup(fd, "html.parser")
+    xml = cache.pdsc_from_cache(url)
+    assert not isinstance(xml, BeautifulSoup)
+    assert pack_manager.pack_url(xml) == pack_manager.pack_url(soup) == \
+        "http://www.keil.com/pack/Keil.LPC1700_DFP.1.10.0.pack"
+    pack = pack_manager.pack_url(xml)
+    for from_xml, from_soup in zip(xml("device"), soup("device")):
+        assert (cache._extract_dict(from_xml, url, pack) ==
+                cache._extract_dict(from_soup, url, pack))
+    assert cache._extract_dict(xml("device")[0], url, pack)["algorithm"] == {
+        "Flash/LPC_IAP_512.FLM": dict(start="0x00000000", size="0x80000",
+                                      ramstart="0x10000000",
+                                      ramsize="0x0FE0", default="1")}
+
+
+def test_incremental_index(cache):
+    """Test that regenerating the index only parses the PDSC files that
+    changed, and drops the devices of those that went away"""
+    first = _add_pdsc(cache, "LPC1700_DFP", "LPC1768", "MCB1700")
+    second = _add_pdsc(cache, "Kinetis_DFP", "MK64FN1M0xxx12", "FRDM-K64F")
+    cache.generate_index()
+    cache.generate_aliases()
+    with open(pack_manager.LocalPackIndex) as fd:
+        index = json.load(fd)
+    assert set(index) == set(["version", "LPC1768", "LPC1768B",
+                              "MK64FN1M0xxx12", "MK64FN1M0xxx12B"])
+    assert index["LPC1768"]["pdsc_file"] == first
+    assert cache.aliases == {"MCB1700": "LPC1768",
+                             "FRDM-K64F": "MK64FN1M0xxx12"}
+
+    parsed = []
+    parse = Cache._parse_for_index
+    def _parse(self, url):
+        parsed.append(url)
+        return parse(self, url)
+    with patch.object(Cache, "_parse_for_index", _parse):
+        cache.generate_index()
+        assert parsed == []
+        _add_pdsc(cache, "LPC1700_DFP", "LPC1769", "MCB1700")
+        cache.urls.remove(second)
+        cache.generate_index()
+        assert parsed == [first]
+    with open(pack_manager.LocalPackIndex) as fd:
+        index = json.load(fd)
+    assert set(index) == set(["version", "LPC1769", "LPC1769B"])
+    assert cache.index["LPC1769"]["pdsc_file"] == first
+
+
+def test_shared_device(cache):
+    """Test that dropping a PDSC file only drops the devices that the index
+    took from it"""
+    first = _add_pdsc(cache, "LPC1700_DFP", "LPC1768", "MCB1700")
+    second = _add_pdsc(cache, "LPC1768_DFP", "LPC1768", "MCB1700")
+    cache.generate_index()
+    owner = cache.index["LPC1768"]["pdsc_file"]
+    other = first if owner == second else second
+
+    cache.urls.remove(other)
+    cache.generate_index()
+    with open(pack_manager.LocalPackIndex) as fd:
+        index = json.load(fd)
+    assert index["LPC1768"]["pdsc_file"] == owner
+    assert cache.index["LPC1768"]["pdsc_file"] == owner
+
+
+@pytest.mark.parametrize("remove", [False, True])
+def test_shared_device_owner_dropped(cache, remove):
+    """Test that a device taken from a changed or removed PDSC file is taken
+    from another PDSC file that describes it in the same run"""
+    first = _add_pdsc(cache, "LPC1700_DFP", "LPC1768", "MCB1700")
+    second = _add_pdsc(cache, "LPC1768_DFP", "LPC1768", "MCB1700")
+    cache.generate_index()
+    owner = cache.index["LPC1768"]["pdsc_file"]
+    other = first if owner == second else second
+
+    if remove:
+        cache.urls.remove(owner)
+    else:
+        _add_pdsc(cache, "LPC1768_DFP" if owner == second else "LPC1700_DFP",
+                  "LPC1769", "MCB1700")
+    cache.generate_index()
+    with open(pack_manager.LocalPackIndex) as fd:
+        index = json.load(fd)
+    assert index["LPC1768"]["pdsc_file"] == other
+    assert cache.index["LPC1768"]["pdsc_file"] == other
+    assert ("LPC1769" in index) != remove
@@ -0,0 +1,75 @@
+"""Tests for the packed form of the pack index"""
+import os
+import json
+import shutil
+import tempfile
+import pytest
+
+from tools.arm_pack_manager.packed_index import PackedIndex, open_index, \
+    packed_path
+
+INDEX = {
+    u"MK64FN1M0xxx12": {u"core": u"Cortex-M4F",
+                        u"memory": {u"IROM1": {u"start": u"0x00000000",
+                                               u"size": u"0x100000"}}},
+    u"MK64FX512xxx12": {u"core": u"Cortex-M4F"},
+    u"LPC1768": {u"core": u"Cortex-M3", u"debug": u"SVD/LPC176x5x.svd"},
+    u"nRF51822_xxAA": {u"core": u"Cortex-M0"},
+    u"version": u"0.1.0",
+}
+
+
+@pytest.fixture
+def index_json():
+    root = tempfile.mkdtemp()
+    path = os.path.join(root, "index.json")
+    with open(path, "w") as fd:
+        json.dump(INDEX, fd)
+    yield path
+    shutil.rmtree(root)
+
+
+def test_lookup(index_json):
+    """Test that the packed index holds the same devices as the JSON index"""
+    index = open_index(index_json)
+    assert isinstance(index, PackedIndex)
+    assert os.path.isfile(packed_path(index_json))
+    assert len(index) == len(INDEX)
+    assert list(index) == sorted(INDEX)
+    assert dict(index) == INDEX
+    assert "LPC1768" in index
+    assert u"LPC1768" in index
+    assert "LPC176" not in index
+    assert 1768 not in index
+    with pytest.raises(KeyError):
+        index["K64F"]
+    assert index["MK64FN1M0xxx12"]["memory"]["IROM1"]["size"] == "0x100000"
+
+
+def test_candidates(index_json):
+    """Test that names starting with the match come first, followed by the
+    names sharing the most trigrams with it"""
+    index = open_index(index_json)
+    assert index.candidates("MK64F", 10) == [u"MK64FN1M0xxx12",
+                                             u"MK64FX512xxx12"]
+    assert index.candidates("k64fn1m", 10)[0] == u"MK64FN1M0xxx12"
+    assert index.candidates("nrf51", 10) == [u"nRF51822_xxAA"]
+    assert index.candidates("MK64F", 1) == [u"MK64FN1M0xxx12"]
+    assert index.candidates("zzzz", 10) == []
+    assert index.candidates("K6", 10) is None
+
+
+def test_repack_when_changed(index_json):
+    """Test that the packed index is rebuilt when index.json changes"""
+    open_index(index_json)
+    with open(index_json, "w") as fd:
+        json.dump({u"K64F": {}, u"version": u"0.1.0"}, fd)
+    os.utime(index_json, (1000, 1000))
+    assert list(open_index(index_json)) == [u"K64F", u"version"]
+
+
+def test_fallback_to_json(index_json):
+    """Test that the JSON index is used when the packed one can not be
+    written"""
+    os.mkdir(packed_path(index_json) + ".%d" % os.getpid())
+    assert open_index(index_json) == INDEX
@@ -0,0 +1,104 @@
+"""Measure the start up time of the command line tools and the import time of
+the modules they depend on. Every measurement runs in a new interpreter.
+"""
+
+import os
+import sys
+import json
+import subprocess
+from argparse import ArgumentParser
+from time import time
+
+from prettytable import PrettyTable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..",
+                                    ".."))
+
+# Command lines that should start without loading the whole build system
+COMMANDS = [
+    ["tools/make.py", "--help"],
+    ["tools/build.py", "--help"],
+    ["tools/test.py", "--help"],
+    ["tools/project.py", "--help"],
+    ["tools/make.py", "--supported-toolchains"],
+]
+
+MODULES = [
+    "tools.targets",
+    "tools.toolchains",
+    "tools.options",
+    "tools.build_api",
+    "tools.test_api",
+    "tools.export",
+]
+
+IMPORT_TIMER = ("import sys, time\n"
+                "start = time.time()\n"
+                "__import__(sys.argv[1])\n"
+                "sys.stdout.write(repr(time.time() - start))\n")
+
+
+def time_command(command, runs):
+    """Best wall clock time of a number of runs of a command line, in seconds
+
+    Positional arguments:
+    command - the arguments of the command, run with this interpreter
+    runs - the number of times to run the command
+    """
+    best = None
+    with open(os.devnull, "w") as devnull:
+        for _ in range(runs):
+            start = time()
+            subprocess.call([sys.executable] + command, cwd=ROOT,
+                            stdout=devnull, stderr=devnull)
+            elapsed = time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_import(module, runs):
+    """Best time of a number of imports of a module, each in a new
+    interpreter, in seconds
+
+    Positional arguments:
+    module - the name of the module to import
+    runs - the number of times to import the module
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return min(float(subprocess.check_output(
+        [sys.executable, "-c", IMPORT_TIMER, module], cwd=ROOT, env=env))
+               for _ in range(runs))
+
+
+def main():
+    """Entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-r", "--runs", type=int, default=5,
+                        help="number of runs of every measurement, the best "
+                        "is reported (default: 5)")
+    parser.add_argument("--json", dest="json",
+                        help="also write the results to a json file")
+    options = parser.parse_args()
+
+    results = {"interpreter": time_command(["-c", "pass"], options.runs),
+               "commands": {}, "modules": {}}
+    table = PrettyTable(["Measurement", "Time (ms)"])
+    table.align["Measurement"] = "l"
+    table.add_row(["python -c pass", "%.1f" % (results["interpreter"] * 1000)])
+    for command in COMMANDS:
+        name = " ".join(command)
+        results["commands"][name] = time_command(command, options.runs)
+        table.add_row([name, "%.1f" % (results["commands"][name] * 1000)])
+    for module in MODULES:
+        results["modules"][module] = time_import(module, options.runs)
+        table.add_row(["import " + module,
+                       "%.1f" % (results["modules"][module] * 1000)])
+    print table
+
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -54,6 +54,16 @@ def main():
                                 argparse_force_uppercase_type(
                                     official_target_names, "MCU")),
                             default=official_target_names)
+    compile_cmd.add_argument("-j", "--jobs", type=int, default=0,
+                             help="number of example, target and toolchain "
+                             "combinations compiled in parallel (default: "
+                             "one per core)")
+    compile_cmd.add_argument("--logs", default="logs",
+                             help="directory for the compile logs")
+    compile_cmd.add_argument("--no-shared-os", dest="shared_os",
+                             action="store_false", default=True,
+                             help="compile mbed-os within every example "
+                             "instead of once per mbed-os revision")
     export_cmd = subparsers.add_parser("export")
     export_cmd.set_defaults(fn=do_export),
     export_cmd.add_argument(
@@ -111,7 +121,9 @@ def do_deploy(_, config, examples):
 def do_compile(args, config, examples):
     """Do the compile step"""
     results = {}
-    results = lib.compile_repos(config, args.toolchains, args.mcu, examples)
+    results = lib.compile_repos(config, args.toolchains, args.mcu, examples,
+                                 jobs=args.jobs, log_dir=args.logs,
+                                 shared_os=args.shared_os)
     
     lib.print_summary(results)
     failures = lib.get_num_failures(results)
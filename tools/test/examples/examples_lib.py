@@ -10,7 +10,10 @@ import os.path
 import sys
 import subprocess
 from shutil import rmtree
+from hashlib import sha1
 from sets import Set
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 ROOT = abspath(dirname(dirname(dirname(dirname(__file__)))))
 sys.path.insert(0, ROOT)
@@ -311,7 +314,76 @@ def export_repos(config, ides, targets, examples):
     return results
 
 
-def compile_repos(config, toolchains, targets, examples):
+def get_mbedos_revision(name):
+    """Returns the commit of the mbed-os checkout of an example, or None if
+    it cannot be determined
+
+    Args:
+    name - the example directory
+
+    """
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=devnull,
+                cwd=os.path.join(name, "mbed-os")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_app_config_digest(name):
+    """Returns a digest of the mbed_app.json of an example, or None if it does
+    not have one. The application configuration changes the macros mbed-os is
+    compiled with, so only examples with the same configuration may share it
+
+    Args:
+    name - the example directory
+
+    """
+    app_config = os.path.join(name, "mbed_app.json")
+    if not os.path.isfile(app_config):
+        return None
+    with open(app_config, "rb") as fd:
+        return sha1(fd.read()).hexdigest()
+
+
+def has_library_config(name):
+    """Returns True if an example has libraries besides mbed-os, found as an
+    mbed_lib.json or a .lib file. Their configuration may change the macros
+    mbed-os is compiled with, which a build of mbed-os alone does not see
+
+    Args:
+    name - the example directory
+
+    """
+    for root, dirs, files in os.walk(name):
+        dirs[:] = [d for d in dirs if d not in ("mbed-os", "BUILD")
+                   and not d.startswith(".")]
+        for entry in files:
+            if entry == "mbed_lib.json" or (entry.endswith(".lib") and
+                                            entry != "mbed-os.lib"):
+                return True
+    return False
+
+
+def compile_cell(cell):
+    """Runs mbed-cli compile in an example directory, with the output going to
+    a log file. Returns the exit code of mbed-cli
+
+    Args:
+    cell - a tuple of the example directory, the arguments of mbed-cli compile
+           and the log file
+
+    """
+    name, args, log_file = cell
+    with open(log_file, "w") as log:
+        proc = subprocess.Popen(["mbed-cli", "compile"] + args, cwd=name,
+                                stdout=log, stderr=subprocess.STDOUT)
+        return proc.wait()
+
+
+def compile_repos(config, toolchains, targets, examples, jobs=0,
+                  log_dir="logs", shared_os=True):
     """Compiles combinations of example programs, targets and compile chains.
 
        The results are returned in a [key: value] dictionary format:
@@ -326,52 +398,125 @@ def compile_repos(config, toolchains, targets, examples):
 
                    Both successes and failures contain the example name, target and compile chain
 
+       Every example, target and toolchain combination is compiled in its own
+       build directory, so they are compiled in parallel.
+
+       With shared_os, mbed-os is first compiled once for every revision,
+       application configuration, target and toolchain used by the examples
+       (to BUILD/mbed-os), and the examples are then compiled against these
+       objects instead of their own mbed-os copy. Examples with libraries of
+       their own, and examples whose mbed-os build failed, are compiled with
+       their own mbed-os copy.
+
     Args:
     config - the json object imported from the file.
     toolchains - List of toolchains to compile for.
-    results - results of the compilation stage.
+    targets - List of targets to compile for.
+    examples - List of example directories to compile.
+
+    Kwargs:
+    jobs - number of combinations compiled at the same time, 0 for one per
+           core
+    log_dir - directory receiving the compile log of every combination
+    shared_os - compile mbed-os once for all the examples using the same
+                revision
 
     """
     results = {}
+    cells = []
+    os_builds = {}
     valid_examples = Set(examples)
+    jobs = jobs or cpu_count()
+    # Each cell gets a share of the cores, so we do not run jobs x cores
+    # compilers when the matrix is large
+    cell_jobs = str(max(1, cpu_count() // jobs))
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
     print("\nCompiling example repos....\n")
     for example in config['examples']:
         example_names = [basename(x['repo']) for x in get_repo_list(example)]
         common_examples = valid_examples.intersection(Set(example_names))
         if not common_examples:
             continue
-        failures = []
-        successes = []
-        compiled = True
-        pass_status = True
         if example['compile']:
+            results[example['name']] = [True, True, [], []]
             for repo_info in get_repo_list(example):
                 name = basename(repo_info['repo'])
-                os.chdir(name)
+                # Examples with libraries of their own build mbed-os along
+                # with them, as the libraries may configure it
+                revision = (shared_os and not has_library_config(name) and
+                            get_mbedos_revision(name))
+                app_config = get_app_config_digest(name)
 
                 # Check that the target, toolchain and features combinations are valid and return a
                 # list of valid combinations to work through
                 for target, toolchain in target_cross_toolchain(valid_choices(example['targets'], targets),
                                                                 valid_choices(example['toolchains'], toolchains),
                                                                 example['features']):
-                    print("Compiling %s for %s, %s" % (name, target, toolchain))
-                    proc = subprocess.Popen(["mbed-cli", "compile", "-t", toolchain,
-                                             "-m", target, "-v"])
-                    proc.wait()
+                    args = ["-t", toolchain, "-m", target, "-v", "-j", cell_jobs,
+                            "--build", os.path.join("BUILD", target, toolchain)]
+                    os_build = None
+                    if revision:
+                        os_build = (revision, app_config or "", target, toolchain)
+                        if os_build not in os_builds:
+                            os_builds[os_build] = (name, abspath(os.path.join(
+                                "BUILD", "mbed-os", revision, app_config or "default",
+                                target, toolchain)))
+                    log_file = os.path.join(log_dir, "{}-{}-{}.log".format(
+                        name, target, toolchain))
                     example_summary = "{} {} {}".format(name, target, toolchain)
-                    if proc.returncode:
-                        failures.append(example_summary)
-                    else:
-                        successes.append(example_summary)
-                os.chdir("..")
-
-            # If there are any compilation failures for the example 'set' then the overall status is fail.
-            if len(failures) > 0:
-                pass_status = False
+                    cells.append((example['name'], example_summary, os_build,
+                                  (name, args, log_file)))
         else:
-            compiled = False
-
-        results[example['name']] = [compiled, pass_status, successes, failures]
+            results[example['name']] = [False, True, [], []]
+
+    pool = ThreadPool(jobs)
+    try:
+        os_build_keys = sorted(os_builds)
+        os_build_cells = []
+        for key in os_build_keys:
+            revision, app_config, target, toolchain = key
+            name, build_dir = os_builds[key]
+            args = ["--library", "--no-archive", "-t", toolchain, "-m", target,
+                    "-j", cell_jobs, "--source", "mbed-os", "--build", build_dir]
+            if app_config:
+                args += ["--app-config", "mbed_app.json"]
+            os_build_cells.append((name, args, os.path.join(
+                log_dir, "mbed-os-{}-{}-{}-{}.log".format(
+                    revision[:12], app_config[:12] or "default", target,
+                    toolchain))))
+        built = set()
+        returncodes = pool.imap(compile_cell, os_build_cells)
+        for key, cell, returncode in zip(os_build_keys, os_build_cells, returncodes):
+            if returncode:
+                # Examples of this mbed-os build get compiled on their own
+                print("FAILURE compiling mbed-os {} for {}, {}, see {}".format(
+                    key[0][:12], key[2], key[3], cell[2]))
+            else:
+                built.add(key)
+
+        for _, _, os_build, (name, args, _) in cells:
+            if os_build in built:
+                # The example without its mbed-os copy, plus the built OS
+                for entry in sorted(os.listdir(name)):
+                    if entry not in ("mbed-os", "BUILD") and not entry.startswith("."):
+                        args += ["--source", entry]
+                args += ["--source", os_builds[os_build][1]]
+
+        returncodes = pool.imap(compile_cell, [cell for _, _, _, cell in cells])
+        for (example, example_summary, _, cell), returncode in zip(cells, returncodes):
+            log_file = cell[2]
+            if returncode:
+                print("FAILURE compiling %s, see %s" % (example_summary, log_file))
+                # If there are any compilation failures for the example 'set' then the overall status is fail.
+                results[example][1] = False
+                results[example][3].append(example_summary)
+            else:
+                print("SUCCESS compiling %s" % example_summary)
+                results[example][2].append(example_summary)
+            sys.stdout.flush()
+    finally:
+        pool.terminate()
 
     return results
 
@@ -0,0 +1,71 @@
+"""Tests for the compilation of the examples against a shared mbed-os"""
+import os
+from mock import patch
+
+import examples_lib
+
+
+def _example(name, repo):
+    return {"name": name, "github": repo, "test-repo-source": "github",
+            "features": [], "targets": [], "toolchains": [], "compile": True}
+
+
+def _write(path, contents=""):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(contents)
+
+
+def _compile(tmpdir, failing=()):
+    """Compile the examples of tmpdir for K64F and GCC_ARM, and return the
+    arguments of every mbed-cli run by example directory"""
+    runs = []
+    def compile_cell(cell):
+        runs.append(cell)
+        return 1 if cell[0] in failing and "--library" in cell[1] else 0
+    config = {"examples": [_example("blinky", "https://github.com/x/blinky"),
+                           _example("other", "https://github.com/x/other"),
+                           _example("libs", "https://github.com/x/libs")]}
+    with tmpdir.as_cwd(), \
+         patch("examples_lib.compile_cell", side_effect=compile_cell), \
+         patch("examples_lib.get_mbedos_revision", return_value="a" * 40):
+        results = examples_lib.compile_repos(
+            config, ["GCC_ARM"], ["K64F"], ["blinky", "other", "libs"],
+            jobs=1, log_dir=str(tmpdir.join("logs")))
+    return results, runs
+
+
+def _setup(tmpdir):
+    for name in ["blinky", "other", "libs"]:
+        _write(str(tmpdir.join(name, "main.cpp")))
+        _write(str(tmpdir.join(name, "mbed-os", "mbed.h")))
+    _write(str(tmpdir.join("libs", "sensor", "mbed_lib.json")), "{}")
+
+
+def test_shared_os(tmpdir):
+    """Test that mbed-os is built once for the examples that share its
+    revision and configuration, and that examples with libraries of their own
+    build their own mbed-os copy"""
+    _setup(tmpdir)
+    results, runs = _compile(tmpdir)
+    libraries = [cell for cell in runs if "--library" in cell[1]]
+    assert len(libraries) == 1
+    os_build = libraries[0][1][libraries[0][1].index("--build") + 1]
+    examples = dict((cell[0], cell[1]) for cell in runs
+                    if "--library" not in cell[1])
+    for name in ["blinky", "other"]:
+        assert examples[name][-2:] == ["--source", os_build]
+        assert "mbed-os" not in examples[name]
+    assert "--source" not in examples["libs"]
+    assert all(result[1] for result in results.values())
+
+
+def test_shared_os_failure(tmpdir):
+    """Test that the examples of a failed mbed-os build are compiled with
+    their own mbed-os copy"""
+    _setup(tmpdir)
+    _, runs = _compile(tmpdir, failing=["blinky"])
+    examples = [cell for cell in runs if "--library" not in cell[1]]
+    assert len(examples) == 3
+    assert all("--source" not in cell[1] for cell in examples)
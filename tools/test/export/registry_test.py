@@ -0,0 +1,22 @@
+"""Tests for the lazily imported exporter registry"""
+import sys
+
+from tools.export import EXPORTERS, ExporterRegistry
+from tools.export.exporters import Exporter
+
+
+def test_exporters_resolve():
+    """Every registered exporter names an Exporter class"""
+    for ide in EXPORTERS:
+        assert issubclass(EXPORTERS[ide], Exporter)
+        assert EXPORTERS[ide].NAME
+
+
+def test_import_on_lookup():
+    """An exporter module is only imported when it is looked up"""
+    sys.modules.pop("tools.export.qtcreator", None)
+    registry = ExporterRegistry({'qtcreator': ('qtcreator', 'QtCreator')})
+    assert registry.keys() == ['qtcreator']
+    assert "tools.export.qtcreator" not in sys.modules
+    assert registry['qtcreator'] is registry['qtcreator']
+    assert "tools.export.qtcreator" in sys.modules
@@ -0,0 +1,122 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Synthetic map files in the formats of the supported toolchains, shared by
+the memap tests and benchmark.
+"""
+import os
+from os.path import dirname, join
+
+TOOLCHAINS = ["GCC_ARM", "ARM", "IAR"]
+
+# Location of the map file, relative to the directory the map is parsed from
+MAP_FILE = join("BUILD", "K64F", "%s", "benchmark.map")
+
+# Objects are spread over this many directories
+DIRECTORIES = 100
+
+
+def _objects(count):
+    """Generate the object file name and the sizes of its .text, .data and
+    .bss sections for a number of objects"""
+    for idx in range(count):
+        yield ("dir%d/object%d.o" % (idx % DIRECTORIES, idx),
+               0x10 + idx % 0x100, idx % 0x10, idx % 0x20)
+
+
+def _write_gcc(map_file, count):
+    build_dir = "./" + dirname(MAP_FILE % "GCC_ARM").replace("\\", "/")
+    map_file.write("Archive member included to satisfy reference by file "
+                   "(symbol)\n\nLinker script and memory map\n\n")
+    for section, size_idx in [(".text", 1), (".data", 2), (".bss", 3)]:
+        map_file.write("%s           0x00000000    0x10000\n" % section)
+        address = 0
+        for obj in _objects(count):
+            path = "%s/%s" % (build_dir, obj[0])
+            if obj[0].endswith("0.o"):
+                # long section names are followed by a line with the sizes
+                map_file.write(" %s._ZN4mbed6Ticker6attachEv\n"
+                               "                0x%08x      0x%x %s\n"
+                               % (section, address, obj[size_idx], path))
+            else:
+                map_file.write(" %s          0x%08x      0x%x %s\n"
+                               % (section, address, obj[size_idx], path))
+            map_file.write("                0x%08x                symbol%d\n"
+                           % (address, address))
+            address += obj[size_idx]
+            if address % 4:
+                map_file.write(" *fill*         0x%08x        0x%x\n"
+                               % (address, 4 - address % 4))
+                address += 4 - address % 4
+    map_file.write("OUTPUT(benchmark.elf elf32-littlearm)\n")
+
+
+def _write_armcc(map_file, count):
+    map_file.write("Memory Map of the image\n\n"
+                   "    Base Addr    Size         Type   Attr      Idx    E "
+                   "Section Name        Object\n\n")
+    for kind, attr, size_idx in [("Code", "RO", 1), ("Data", "RW", 2),
+                                 ("Zero", "RW", 3)]:
+        address = 0
+        for idx, obj in enumerate(_objects(count)):
+            map_file.write("    0x%08x   0x%08x   %s   %s        %d    "
+                           "i.function%d          %s\n"
+                           % (address, obj[size_idx], kind, attr, idx, idx,
+                              os.path.basename(obj[0])))
+            address += obj[size_idx]
+
+
+def _write_iar(map_file, count):
+    map_file.write("  Section  Kind  Address  Size  Object\n")
+    for section, kind, size_idx in [(".text", "ro code", 1),
+                                    (".data", "inited", 2),
+                                    (".bss", "zero", 3)]:
+        address = 0
+        for idx, obj in enumerate(_objects(count)):
+            map_file.write(" %s               %s  0x%08x    0x%x  %s [%d]\n"
+                           % (section, kind, address, obj[size_idx],
+                              os.path.basename(obj[0]), idx))
+            address += obj[size_idx]
+    map_file.write("*** MODULE SUMMARY\n\n")
+
+
+def generate_map(path, toolchain, count):
+    """Write a map file in the format of a toolchain
+
+    Positional arguments:
+    path - the directory the map file will be parsed from
+    toolchain - GCC_ARM, ARM or IAR
+    count - the number of objects in the map
+
+    Returns: the path of the map file
+    """
+    map_path = join(path, MAP_FILE % toolchain)
+    if not os.path.exists(dirname(map_path)):
+        os.makedirs(dirname(map_path))
+    writer = {"GCC_ARM": _write_gcc, "ARM": _write_armcc,
+              "IAR": _write_iar}[toolchain]
+    with open(map_path, "w") as map_file:
+        writer(map_file, count)
+    return map_path
+
+
+def expected_totals(count):
+    """The totals of the .text, .data and .bss sections of a generated map"""
+    totals = [0, 0, 0]
+    for obj in _objects(count):
+        for idx in range(3):
+            totals[idx] += obj[idx + 1]
+    return dict(zip([".text", ".data", ".bss"], totals))
@@ -0,0 +1,137 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark of the map file parsers of memap.py on synthetic map files.
+Every parse runs in a new process so that its peak memory can be measured.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from os.path import abspath, dirname, join
+from time import time
+
+ROOT = abspath(join(dirname(__file__), "..", "..", ".."))
+sys.path.insert(0, ROOT)
+
+from prettytable import PrettyTable
+
+from tools.memap import MemapParser
+from map_generator import TOOLCHAINS, MAP_FILE, generate_map
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SIZES = [1000, 10000, 100000]
+
+
+def _peak_memory():
+    """Peak resident memory of this process in KiB, if it can be measured"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB and OS X bytes
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+
+def _parse_worker(path, toolchain, results):
+    os.chdir(path)
+    start_memory = _peak_memory()
+    start = time()
+    memap = MemapParser()
+    memap.parse(MAP_FILE % toolchain, toolchain)
+    elapsed = time() - start
+    end_memory = _peak_memory()
+    results.put({
+        "toolchain": toolchain,
+        "objects": len(memap.modules),
+        "parse_time": elapsed,
+        "peak_memory": (end_memory - start_memory
+                        if end_memory is not None else None)
+    })
+
+
+def run_benchmark(toolchains, sizes):
+    """Parse a generated map file of every size for every toolchain
+
+    Positional arguments:
+    toolchains - the toolchains to generate map files for
+    sizes - the numbers of objects in the map files
+
+    Returns: a list of results, with the parse time in seconds and the growth
+    of peak memory in KiB
+    """
+    results = []
+    for size in sizes:
+        for toolchain in toolchains:
+            path = tempfile.mkdtemp()
+            try:
+                map_path = generate_map(path, toolchain, size)
+                queue = Queue()
+                worker = Process(target=_parse_worker,
+                                 args=(path, toolchain, queue))
+                worker.start()
+                worker.join()
+                if worker.exitcode != 0:
+                    raise Exception("Parsing a %s map of %d objects failed"
+                                    % (toolchain, size))
+                result = queue.get()
+                result["size"] = size
+                result["map_size"] = os.path.getsize(map_path)
+                results.append(result)
+            finally:
+                shutil.rmtree(path)
+    return results
+
+
+def main():
+    """Entry point"""
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-1])
+    parser.add_argument("-t", "--toolchain", dest="toolchains",
+                        action="append", choices=TOOLCHAINS,
+                        help="toolchains to benchmark (default: all)")
+    parser.add_argument("-s", "--size", dest="sizes", action="append",
+                        type=int,
+                        help="number of objects in a map file (default: %s)"
+                        % ", ".join(str(size) for size in SIZES))
+    parser.add_argument("--json", dest="json",
+                        help="also write the results to a json file")
+    options = parser.parse_args()
+
+    results = run_benchmark(options.toolchains or TOOLCHAINS,
+                            options.sizes or SIZES)
+
+    table = PrettyTable(["Toolchain", "Objects", "Map size (KiB)",
+                         "Parse time (s)", "Peak memory (KiB)"])
+    for result in results:
+        table.add_row([result["toolchain"], result["size"],
+                       result["map_size"] / 1024,
+                       "%.3f" % result["parse_time"],
+                       result["peak_memory"]])
+    print table
+
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,8 @@ import json
 import pytest
 
 from tools.memap import MemapParser
+from map_generator import TOOLCHAINS, MAP_FILE, generate_map, \
+    expected_totals
 from copy import deepcopy
 
 """
@@ -208,3 +210,73 @@ def test_generate_output_csv_ci(memap_parser, tmpdir, depth):
     file_name = str(tmpdir.join('output.csv').realpath())
     generate_test_helper(memap_parser, 'csv-ci', depth, file_name)
     assert isfile(file_name), "Failed to create csv-ci file"
+
+
+def test_module_add(memap_parser):
+    """
+    Test that sections are added to the module with the same object file name
+
+    :param memap_parser: Mocked parser
+    """
+    memap_parser.module_add("BUILD/main.o", 16, ".text")
+    memap_parser.module_add("xxxmain.o", 32, ".bss")
+    memap_parser.module_add("BUILD/pinmap.o", 64, ".data")
+
+    assert memap_parser.modules["main.o"][".text"] == 7 + 16
+    assert memap_parser.modules["xxxmain.o"][".bss"] == 32
+    assert memap_parser.modules[
+        "mbed-os/targets/TARGET/TARGET_MCUS/api/pinmap.o"][".data"] == 2 + 64
+
+    memap_parser.module_replace("main.o", "[lib]/libmain.a/main.o")
+    memap_parser.module_add("main.o", 1, ".text")
+    memap_parser.remove_unused_modules()
+    memap_parser.module_add("test.o", 2, ".text")
+
+    assert memap_parser.modules["[lib]/libmain.a/main.o"][".text"] == 7 + 17
+    assert "main.o" not in memap_parser.modules
+    assert memap_parser.modules["test.o"][".text"] == 2
+
+
+@pytest.mark.parametrize("depth", [None, 1, 2, 20])
+def test_reduce_depth(memap_parser, depth):
+    """
+    Test that reducing the depth keeps the totals of every section
+
+    :param memap_parser: Mocked parser
+    :param depth: the detail of the output
+    """
+    memap_parser.reduce_depth(depth)
+
+    for section in memap_parser.all_sections:
+        assert sum(module[section] for module
+                   in memap_parser.short_modules.values()) == \
+            sum(module[section] for module in memap_parser.modules.values())
+    if depth == 1:
+        assert sorted(memap_parser.short_modules) == \
+            ["[lib]", "main.o", "mbed-os", "test.o"]
+    memap_parser.short_modules["main.o"][".text"] += 1
+    assert memap_parser.modules["main.o"][".text"] == 7
+
+
+@pytest.mark.parametrize("toolchain", TOOLCHAINS)
+def test_parse_generated_map(tmpdir, monkeypatch, toolchain):
+    """
+    Test that the modules and sizes of a generated map file are parsed
+
+    :param tmpdir: a unique location to generate the map file in
+    :param toolchain: the toolchain to generate a map file for
+    """
+    monkeypatch.chdir(str(tmpdir))
+    generate_map(".", toolchain, 100)
+
+    memap_parser = MemapParser()
+    assert memap_parser.parse(MAP_FILE % toolchain, toolchain)
+
+    memap_parser.modules.pop("[fill]", None)
+    assert len(memap_parser.modules) == 100
+    for section, total in expected_totals(100).items():
+        assert sum(module[section] for module
+                   in memap_parser.modules.values()) == total
+    if toolchain == "GCC_ARM":
+        # The directories of the objects come from the map file
+        assert "dir1/object1.o" in memap_parser.modules
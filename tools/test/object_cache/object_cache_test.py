@@ -0,0 +1,80 @@
+"""Tests for the compiled object cache"""
+import os
+import shutil
+import tempfile
+import pytest
+
+from tools.object_cache import ObjectCache
+
+
+@pytest.fixture
+def workspace():
+    root = tempfile.mkdtemp()
+    yield root
+    shutil.rmtree(root)
+
+
+def _write(path, contents):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(contents)
+    os.utime(path, (1000, 1000))
+
+
+def _job(root, build):
+    build_dir = os.path.join(root, build)
+    obj = os.path.join(build_dir, "main.o")
+    return {
+        'source': os.path.join(root, "main.c"),
+        'object': obj,
+        'dep_path': os.path.join(build_dir, "main.d"),
+        'build_dir': build_dir,
+        'commands': [["gcc", "-DMBED_BUILD_TIMESTAMP=%s" % build,
+                      "-include", os.path.join(build_dir, "mbed_config.h"),
+                      "-MF", os.path.join(build_dir, "main.d"),
+                      "-o", obj, os.path.join(root, "main.c")]],
+    }
+
+
+def test_fetch_across_build_dirs(workspace):
+    """An object compiled in one build directory is reused in another, with
+    its dependency file pointing to the new build directory"""
+    header = os.path.join(workspace, "main.h")
+    _write(os.path.join(workspace, "main.c"), "#include \"main.h\"\n")
+    _write(header, "#define FOO 1\n")
+    cache = ObjectCache(os.path.join(workspace, "cache"))
+
+    first = _job(workspace, "build1")
+    config = os.path.join(first['build_dir'], "mbed_config.h")
+    _write(config, "")
+    _write(first['object'], "object code")
+    _write(first['dep_path'], "%s: %s %s\n" % (first['object'], header, config))
+    cache.store(first, [first['source'], header, config], "a warning")
+
+    second = _job(workspace, "build2")
+    _write(os.path.join(second['build_dir'], "mbed_config.h"), "")
+    assert cache.fetch(second) == "a warning"
+    assert open(second['object']).read() == "object code"
+    assert open(second['dep_path']).read() == "%s: %s %s\n" % (
+        second['object'], header,
+        os.path.join(second['build_dir'], "mbed_config.h"))
+
+    _write(header, "#define FOO 2\n")
+    third = _job(workspace, "build3")
+    _write(os.path.join(third['build_dir'], "mbed_config.h"), "")
+    assert cache.fetch(third) is None
+
+
+def test_cleanup(workspace):
+    """The least recently used files are evicted first, and every file in
+    the cache counts toward its size"""
+    cache = ObjectCache(workspace, max_size=190)
+    for age, name in enumerate(["old.o", "old.d", "old.manifest", "mid.o",
+                                "mid.d", "new.manifest", "new.o", "new.d"]):
+        path = os.path.join(workspace, "ab", name)
+        _write(path, "x" * 30)
+        os.utime(path, (1000 + age, 1000 + age))
+    cache.cleanup()
+    assert sorted(os.listdir(os.path.join(workspace, "ab"))) == [
+        "mid.d", "mid.o", "new.d", "new.manifest", "new.o"]
@@ -20,6 +20,7 @@ import sys
 import shutil
 import tempfile
 from os.path import join, abspath, dirname
+from copy import copy
 from contextlib import contextmanager
 import pytest
 
@@ -131,3 +132,39 @@ def test_modify_existing_target():
             # The existing target should not be modified by custom targets
             assert TARGET_MAP["Test_Target"].default_toolchain != 'GCC_ARM'
             assert TARGET_MAP["Test_Target"].bootloader_supported != True
+
+def test_target_copy():
+    """A copy of a target resolves the same attributes, and attributes set
+    on the copy do not change the shared target"""
+    initial_target_json = """
+    {
+        "Target": {
+            "core": null,
+            "extra_labels": [],
+            "macros": ["BASE", "VALUE=1"],
+            "public": false
+        },
+        "Test_Target": {
+            "inherits": ["Target"],
+            "core": "Cortex-M4",
+            "macros_add": ["TEST"],
+            "macros_remove": ["VALUE"],
+            "device_has_remove": ["MISSING"]
+        }
+    }"""
+
+    with temp_target_file(initial_target_json, json_filename="targets.json") as targets_dir:
+        Target.set_targets_json_location(os.path.join(targets_dir, "targets.json"))
+        update_target_data()
+        target = TARGET_MAP["Test_Target"]
+        target_copy = copy(target)
+
+        assert target.core == target_copy.core == "Cortex-M4"
+        assert target.macros == ["BASE", "TEST"]
+        assert target.macros is not target_copy.macros
+        target_copy.macros = []
+        target_copy.core = "Cortex-M0"
+        assert TARGET_MAP["Test_Target"].macros == ["BASE", "TEST"]
+        assert TARGET_MAP["Test_Target"].core == "Cortex-M4"
+        with pytest.raises(AttributeError):
+            target.device_name
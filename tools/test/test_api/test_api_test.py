@@ -15,10 +15,13 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import json
 import pytest
 from mock import patch
+from multiprocessing.pool import ThreadPool
 from tools.targets import set_targets_json_location
-from tools.test_api import find_tests, build_tests
+from tools.test_api import find_tests, build_tests, HostTestOutput,\
+    SingleTestRunner
 
 """
 Tests for test_api.py
@@ -91,3 +94,145 @@ def test_find_tests_app_config(build_path, target, toolchain_name, app_config):
                 "build_tests was not called with app_config"
             assert args[1]['app_config'] == app_config,\
                 "build_tests was called with an incorrect app_config"
+
+
+@pytest.mark.parametrize("app_config", [None, "app_config.json"])
+def test_build_tests_library_sources(tmpdir, app_config):
+    """
+    Test that a test with its own mbed_app.json is built from the library
+    sources instead of the compiled library, unless an app config is given
+
+    :param tmpdir: a directory holding the tests
+    :param app_config: the app config passed to build_tests
+    """
+    configured = tmpdir.mkdir("configured")
+    configured.join("mbed_app.json").write("{}")
+    tests = {'plain': str(tmpdir.mkdir("plain")), 'configured': str(configured)}
+    set_targets_json_location()
+    with patch('tools.test_api.get_config') as mock_get_config,\
+         patch('tools.test_api.build_project') as mock_build_project,\
+         patch('tools.test_api.Pool', ThreadPool):
+        mock_get_config.return_value = ({}, None, None)
+        mock_build_project.return_value = "build_project"
+
+        build_tests(tests, ["build_path"], "build_path", "K64F", "ARM",
+                    app_config=app_config, library_source_paths=['.'])
+
+        built = sorted(args[0][0] for args in mock_build_project.call_args_list)
+        configured_paths = ["build_path"] if app_config else ['.']
+        assert built == sorted([configured_paths + [str(configured)],
+                                ["build_path", tests['plain']]])
+
+def test_host_test_output_events():
+    """
+    Test that events are found on complete lines, even when the output of the
+    test arrives in pieces, and that the output is kept as it arrived
+
+    :return:
+    """
+    output = HostTestOutput()
+    assert output.feed("HOST: Reset tar") == []
+    assert output.feed("get...\r\nHOST: Property 'timeout' = '20'\n"
+                       "HOST: Property 'host_test_name' = 'echo'") == \
+        [("reset", None), ("property", ("timeout", "20"))]
+    assert output.feed("\n{success}\n{e") == \
+        [("property", ("host_test_name", "echo"))]
+    assert not output.finished
+    assert output.feed("nd}\r\nHOST: Reset target...\n") == []
+    assert output.finished
+    assert output.getvalue() == ("HOST: Reset target...\r\n"
+                                 "HOST: Property 'timeout' = '20'\n"
+                                 "HOST: Property 'host_test_name' = 'echo'\n"
+                                 "{success}\n{end}\r\n"
+                                 "HOST: Reset target...\n")
+
+def test_host_test_output_assert():
+    """
+    Test that an mbed assert ends the test and is marked in the output, and
+    that non ASCII characters are replaced
+
+    :return:
+    """
+    output = HostTestOutput()
+    output.feed("caf\xe9\nmbed assertation failed: x, file: a.c\nafter\n")
+    assert output.finished
+    assert output.getvalue() == ("caf \nmbed assertation failed: x, file: "
+                                 "a.c\n{{mbed_assert}}after\n")
+
+def test_host_test_output_bounded():
+    """
+    Test that only the end of a long output is kept
+
+    :return:
+    """
+    output = HostTestOutput(max_size=100)
+    for idx in range(1000):
+        output.feed("line %d\n" % idx)
+    output.feed("{success}\n")
+    value = output.getvalue()
+    assert value.endswith("line 999\n{success}\n")
+    dropped, kept = value.split("\n", 1)
+    assert len(kept) == 100
+    assert dropped == "[%d characters of output dropped]" % \
+        (sum(len("line %d\n" % idx) for idx in range(1000)) + 10 - 100)
+
+def test_mut_executors():
+    """
+    Test that queued tests run on every MUT of their target, in the order
+    they were queued, and that their results are recorded
+
+    :return:
+    """
+    muts = {"1": {"mcu": "K64F"}, "2": {"mcu": "K64F"},
+            "3": {"mcu": "LPC1768"}}
+    runner = SingleTestRunner(_muts=muts)
+    runner.test_summary = []
+    runner.test_summary_ext = {"K64F": {"GCC_ARM": {}}}
+    ran = []
+
+    def handle_mut(mut, data, target_name, toolchain_name, test_loops=1):
+        ran.append((mut["name"], data["test_id"]))
+        return ((runner.TEST_RESULT_OK, target_name, toolchain_name,
+                 data["test_id"]), {0: {"result": runner.TEST_RESULT_OK}})
+
+    for name, mut in muts.items():
+        mut["name"] = name
+    with patch.object(runner, "handle_mut", side_effect=handle_mut):
+        runner.start_mut_executors()
+        for test_id in ["MBED_A1", "MBED_A2"]:
+            runner.queue_test(json.dumps({"mcu": "K64F", "test_id": test_id}),
+                              "K64F", "GCC_ARM", test_id)
+        runner.stop_mut_executors()
+
+    for name in ["1", "2"]:
+        assert [test_id for mut, test_id in ran if mut == name] == \
+            ["MBED_A1", "MBED_A2"]
+    assert len(ran) == 4
+    assert len(runner.test_summary) == 4
+    assert sorted(runner.test_summary_ext["K64F"]["GCC_ARM"]) == \
+        ["MBED_A1", "MBED_A2"]
+    assert len(runner.test_summary_ext["K64F"]["GCC_ARM"]["MBED_A1"]) == 2
+    assert not runner.mut_executors
+
+def test_mut_executor_error():
+    """
+    Test that a test that fails to run on a MUT is recorded as an error
+
+    :return:
+    """
+    muts = {"1": {"mcu": "K64F"}}
+    runner = SingleTestRunner(_muts=muts)
+    runner.test_summary = []
+    runner.test_summary_ext = {"K64F": {"GCC_ARM": {}}}
+
+    with patch.object(runner, "handle_mut", side_effect=IOError("no disk")):
+        runner.start_mut_executors()
+        runner.queue_test(json.dumps({"mcu": "K64F", "test_id": "MBED_A1"}),
+                          "K64F", "GCC_ARM", "MBED_A1")
+        runner.stop_mut_executors()
+
+    assert [result[:4] for result in runner.test_summary] == \
+        [(runner.TEST_RESULT_ERROR, "K64F", "GCC_ARM", "MBED_A1")]
+    detailed = runner.test_summary_ext["K64F"]["GCC_ARM"]["MBED_A1"]
+    assert detailed[0][0]["result"] == runner.TEST_RESULT_ERROR
+    assert "no disk" in detailed[0][0]["output"]
@@ -0,0 +1,81 @@
+"""Tests for the job queue and log streaming of the singletest web service"""
+import json
+from threading import Event
+
+from tools.test_webapi import SingleTestRunnerWebService
+
+
+class FakeRunner(object):
+    """Stands in for SingleTestRunner, logs a few lines and waits for the
+    test to release it"""
+    opts_log_file_name = None
+
+    def __init__(self, test_spec, muts):
+        self.test_spec = test_spec
+        self.muts = muts
+        self.release = Event()
+
+    def dump_options(self):
+        return {"test_spec": self.test_spec}
+
+    def execute(self):
+        self.logger.log_line(self.logger.LogType.INFO, "building")
+        assert self.release.wait(30)
+        if self.test_spec.get("fail"):
+            raise Exception("no MUTs")
+        self.logger.log_line(self.logger.LogType.INFO, "testing")
+        return [], 0, {"K64F": {}}, {}, {}, {}
+
+
+def _result(response):
+    return json.loads(response)["result"]
+
+
+def test_job_queue():
+    """Test that jobs run on the worker pool and report their status"""
+    runners = []
+    def factory(test_spec, muts):
+        runners.append(FakeRunner(test_spec, muts))
+        return runners[-1]
+    service = SingleTestRunnerWebService(factory, workers=2)
+    first = service.submit({}, {})
+    second = service.submit({"fail": True}, {})
+    third = _result(service.rest_api_submit(json.dumps(
+        {"test_spec": {}, "muts": {"1": {}}})))["job"]
+    assert third == 3
+    assert json.loads(service.rest_api_submit("{}"))["success_code"] == -1
+
+    for runner in runners:
+        runner.release.set()
+    service.job_queue.join()
+    assert _result(service.rest_api_status()) == {
+        str(first): "finished", str(second): "failed", str(third): "finished"}
+    assert _result(service.rest_api_request_handler(third, "muts")) == {"1": {}}
+    assert _result(service.rest_api_request_handler(first, "test_results")) == {"K64F": {}}
+    assert _result(service.rest_api_config(second)) == {"test_spec": {"fail": True}}
+    assert json.loads(service.rest_api_status(42))["success_code"] == -1
+
+
+def test_log_polling_and_streaming():
+    """Test that log polls only return new lines and that the log stream
+    follows the job until it ends"""
+    runners = []
+    def factory(test_spec, muts):
+        runners.append(FakeRunner(test_spec, muts))
+        return runners[-1]
+    service = SingleTestRunnerWebService(factory)
+    job_id = service.submit({}, {})
+    stream = service.rest_api_log_stream(job_id)
+    assert next(stream).endswith("Info: building\n\n")
+
+    log = _result(service.rest_api_log(job_id))
+    assert len(log["log"]) == 1 and log["next"] == 1
+    runners[0].release.set()
+    events = list(stream)
+    assert events[0].startswith("id: 2\n") and "Info: testing" in events[0]
+    assert events[-1] == "event: end\ndata: finished\n\n"
+
+    log = _result(service.rest_api_log(job_id, log["next"]))
+    assert len(log["log"]) == 1 and log["next"] == 2
+    assert log["log"][0].endswith("Info: testing")
+    assert log["status"] == "finished"
@@ -0,0 +1,145 @@
+"""Tests for the batched test result logging of BaseDBAccess, run against
+an in-process SQLite database standing in for MySQL"""
+import sqlite3
+from mock import patch
+import pytest
+
+from tools.test_db import BaseDBAccess
+
+SCHEMA = """
+CREATE TABLE mtest_target (mtest_target_pk INTEGER PRIMARY KEY, mtest_target_name TEXT);
+CREATE TABLE mtest_toolchain (mtest_toolchain_pk INTEGER PRIMARY KEY, mtest_toolchain_name TEXT);
+CREATE TABLE mtest_test_type (mtest_test_type_pk INTEGER PRIMARY KEY, mtest_test_type_name TEXT);
+CREATE TABLE mtest_test_id (mtest_test_id_pk INTEGER PRIMARY KEY, mtest_test_id_name TEXT);
+CREATE TABLE mtest_test_result (mtest_test_result_pk INTEGER PRIMARY KEY, mtest_test_result_name TEXT);
+CREATE TABLE mtest_test_entry (
+    mtest_test_entry_pk INTEGER PRIMARY KEY,
+    mtest_build_id_fk INTEGER, mtest_target_fk INTEGER,
+    mtest_toolchain_fk INTEGER, mtest_test_type_fk INTEGER,
+    mtest_test_id_fk INTEGER, mtest_test_result_fk INTEGER,
+    mtest_test_output TEXT, mtest_test_time REAL, mtest_test_timeout REAL,
+    mtest_test_loop_no INTEGER, mtest_test_result_extra TEXT);
+"""
+
+
+class SQLiteDBAccess(BaseDBAccess):
+    """ SQLite database with the test suite DB scheme
+    """
+    def __init__(self, path):
+        BaseDBAccess.__init__(self)
+        self.PARAM = '?'
+        self.CONNECTION_ERRORS = (sqlite3.ProgrammingError,)
+        self.db = path
+        self.lookups = 0
+
+    def is_connected(self):
+        return self.db_object is not None
+
+    def reconnect(self):
+        self.db_object = sqlite3.connect(self.db)
+
+    def disconnect(self):
+        if self.db_object:
+            self.db_object.close()
+        self.db_object = None
+
+    def select_all(self, query, params=()):
+        return self.db_object.execute(query, params).fetchall()
+
+    def get_table_entry_pk(self, table, column, value, update_db=True):
+        self.lookups += 1
+        rows = self.select_all("SELECT %s_pk FROM %s WHERE %s=?" %
+                               (table, table, column), (value,))
+        if rows:
+            return rows[0][0]
+        return self.update_table_entry(table, column, value)
+
+    def update_table_entry(self, table, column, value):
+        cur = self.db_object.execute("INSERT INTO %s (%s) VALUES (?)" %
+                                     (table, column), (value,))
+        self.db_object.commit()
+        return cur.lastrowid
+
+
+@pytest.fixture
+def db(tmpdir):
+    path = str(tmpdir.join("results.db"))
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    con.close()
+    db = SQLiteDBAccess(path)
+    yield db
+    db.disconnect()
+
+
+def _queue(db, count):
+    for index in range(count):
+        db.queue_test_entry(1, "K64F" if index % 2 else "LPC1768",
+                            "GCC_ARM", "SingleTest", "MBED_%d" % (index % 10),
+                            "OK", "output\n'quoted'", 1.234, 10, index)
+
+
+def test_batched_insert(db):
+    """Test that entries are inserted in batches and every lookup table
+    value is only resolved once"""
+    db.BATCH_SIZE = 100
+    with patch.object(SQLiteDBAccess, "execute_many",
+                      autospec=True,
+                      side_effect=BaseDBAccess.execute_many) as execute_many:
+        _queue(db, 250)
+        assert execute_many.call_count == 2
+        assert len(db.test_entry_batch) == 50
+        assert db.flush_test_entries() == 50
+        assert execute_many.call_count == 3
+    # 2 targets, 1 toolchain, 1 test type, 10 test ids and 1 result
+    assert db.lookups == 15
+    rows = db.select_all("SELECT mtest_test_output, mtest_test_time, "
+                         "mtest_test_loop_no FROM mtest_test_entry "
+                         "ORDER BY mtest_test_loop_no")
+    assert len(rows) == 250
+    assert rows[-1] == ("output\n'quoted'", 1.23, 249)
+    assert db.flush_test_entries() == 0
+
+
+def test_reconnect(db):
+    """Test that a batch survives a lost connection"""
+    _queue(db, 10)
+    db.db_object.close()
+    assert db.flush_test_entries() == 10
+    db.disconnect()
+    _queue(db, 5)
+    assert db.flush_test_entries() == 5
+    assert db.select_all("SELECT COUNT(*) FROM mtest_test_entry") == [(15,)]
+    assert db.lookups == 15
+
+
+def test_lookup_reconnect(db):
+    """Test that lookups survive a connection dropped by the server"""
+    _queue(db, 1)
+    db.db_object.close()
+    db.queue_test_entry(1, "NUCLEO_F401RE", "GCC_ARM", "SingleTest",
+                        "MBED_1", "OK", "", 1, 10, 0)
+    assert db.flush_test_entries() == 2
+
+
+def test_unresolved_entry_dropped(db):
+    """Test that an entry is not queued when its lookup values can not be
+    resolved"""
+    with patch.object(SQLiteDBAccess, "reconnect"):
+        _queue(db, 1)
+    assert db.test_entry_batch == []
+    _queue(db, 1)
+    assert db.flush_test_entries() == 1
+
+
+def test_rejected_batch_dropped(db):
+    """Test that a batch rejected by the database does not fail every later
+    flush"""
+    _queue(db, 3)
+    with patch.object(SQLiteDBAccess, "execute_many",
+                      side_effect=sqlite3.IntegrityError("rejected")):
+        assert db.flush_test_entries() == 0
+    assert db.test_entry_batch == []
+    _queue(db, 2)
+    assert db.flush_test_entries() == 2
+    assert db.select_all("SELECT COUNT(*) FROM mtest_test_entry") == [(2,)]
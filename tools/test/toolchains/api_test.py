@@ -1,8 +1,13 @@
 """Tests for the toolchain sub-system"""
 import sys
 import os
+import shutil
+import tempfile
+import subprocess
+import pytest
 from string import printable
 from copy import deepcopy
+from distutils.spawn import find_executable
 from mock import MagicMock, patch
 from hypothesis import given, settings
 from hypothesis.strategies import text, lists, fixed_dictionaries, booleans
@@ -12,7 +17,8 @@ ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..",
 sys.path.insert(0, ROOT)
 
 from tools.toolchains import TOOLCHAIN_CLASSES, LEGACY_TOOLCHAIN_NAMES,\
-    Resources, TOOLCHAIN_PATHS
+    Resources, TOOLCHAIN_PATHS, SourceTree, OutputLog, ScanCache, DirLister
+from tools.utils import ToolException
 from tools.targets import TARGET_MAP
 
 def test_instantiation():
@@ -145,3 +151,388 @@ def test_path_specified_gcc(gcc_loc, exists_at_loc, exists_in_path):
                 assert TOOLCHAIN_PATHS['GCC_ARM'] == gcc_loc
             elif exists_in_path:
                 assert TOOLCHAIN_PATHS['GCC_ARM'] == ''
+
+
+def _make_tree(root, files, mtime=1000):
+    """Create the files (and their directories) below root, with mtimes old
+    enough for the scan cache to trust them"""
+    for name in files:
+        path = os.path.join(root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, "w").close()
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (mtime, mtime))
+
+def test_scan_cache():
+    """Test that a cached scan gives the same resources as a fresh one, and
+    that adding a file invalidates it"""
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, "src")
+        build = os.path.join(root, "build")
+        _make_tree(src, ["main.cpp", "inc/foo.h", "TARGET_K64F/k64f.c",
+                         "TARGET_NRF51822/nrf.c", "FEATURE_BLE/ble.cpp",
+                         "ignored/bad.c", ".mbedignore"])
+        with open(os.path.join(src, ".mbedignore"), "w") as ignore:
+            ignore.write("ignored/*\n")
+
+        def scan():
+            toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+            toolchain.build_dir = build
+            res = toolchain.scan_resources(src)
+            return toolchain, res
+
+        _, fresh = scan()
+        with patch('tools.toolchains.listdir') as _listdir, \
+             patch('tools.toolchains.dump') as _dump:
+            toolchain, cached = scan()
+            assert not _listdir.called
+            # A hit does not rewrite the cache
+            assert not _dump.called
+        for field in ["inc_dirs", "headers", "c_sources", "cpp_sources"]:
+            assert sorted(getattr(fresh, field)) == \
+                sorted(getattr(cached, field))
+        assert cached.file_basepath == fresh.file_basepath
+        assert list(cached.features) == ["BLE"]
+        assert cached.features["BLE"].cpp_sources == \
+            [os.path.join(src, "FEATURE_BLE", "ble.cpp")]
+        assert toolchain.is_ignored("ignored/bad.c")
+
+        _make_tree(src, ["new.c"], mtime=2000)
+        _, rescanned = scan()
+        assert os.path.join(src, "new.c") in rescanned.c_sources
+    finally:
+        shutil.rmtree(root)
+
+def test_scan_cache_merge():
+    """Test that builds saving a shared scan cache keep each other's scans"""
+    root = tempfile.mkdtemp()
+    try:
+        first, second = ScanCache(root), ScanCache(root)
+        for cache, key in [(first, "first"), (second, "second")]:
+            cache.scans[key] = {"used": 1}
+            cache.listings[key] = [1, [], []]
+            cache.dirty = True
+        second.listings["first"] = [2, ["newer"], []]
+        first.save()
+        second.save()
+        merged = ScanCache(root)
+        assert sorted(merged.scans) == ["first", "second"]
+        assert merged.listings["first"] == [2, ["newer"], []]
+        assert not os.path.exists(merged.filename + ".lock")
+
+        # A lock left behind by a killed build does not block saving
+        with open(merged.filename + ".lock", "w"):
+            pass
+        os.utime(merged.filename + ".lock", (1000, 1000))
+        merged.scans["third"] = {"used": 2}
+        merged.dirty = True
+        merged.save()
+        assert sorted(ScanCache(root).scans) == ["first", "second", "third"]
+    finally:
+        shutil.rmtree(root)
+
+def test_parallel_scan():
+    """Test that listing directories in threads finds the same resources, in
+    the same order, as a scan in a single thread"""
+    root = tempfile.mkdtemp()
+    try:
+        files = [".mbedignore", "BUILD/obj.c", "TESTS/test/main.cpp"]
+        for top in range(4):
+            for sub in range(4):
+                base = "top%d/sub%d/" % (top, sub)
+                files += [base + "a.c", base + "b.cpp", base + "c.h",
+                          base + "TARGET_K64F/k64f.c",
+                          base + "TARGET_NRF51822/nrf.c",
+                          base + "TOOLCHAIN_IAR/iar.c",
+                          base + "FEATURE_BLE/ble.cpp",
+                          base + "ignored/bad.c"]
+        _make_tree(root, files)
+        with open(os.path.join(root, ".mbedignore"), "w") as ignore:
+            ignore.write("*/*/ignored/*\n")
+
+        def scan(threads):
+            toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+            toolchain.build_dir = "BUILD"
+            toolchain.scan_threads = threads
+            return toolchain.scan_resources(root, collect_ignores=True)
+
+        serial = scan(1)
+        parallel = scan(8)
+        for field in ["inc_dirs", "headers", "c_sources", "cpp_sources",
+                      "ignored_dirs"]:
+            assert getattr(parallel, field) == getattr(serial, field)
+        assert len(serial.c_sources) == 32
+        assert sorted(parallel.features) == ["BLE"]
+        assert parallel.features["BLE"].cpp_sources == \
+            serial.features["BLE"].cpp_sources
+    finally:
+        shutil.rmtree(root)
+
+def test_source_tree_scan():
+    """Test that scans of a source tree snapshot find the same resources as
+    scans of the file system, for every target, without listing directories"""
+    root = tempfile.mkdtemp()
+    try:
+        _make_tree(root, [".mbedignore", "main.cpp", "TESTS/test/main.cpp",
+                          ".git/config", "lib/TARGET_K64F/k64f.c",
+                          "lib/TARGET_NRF5/nrf.c",
+                          "lib/TARGET_NRF5/.mbedignore",
+                          "lib/TARGET_NRF5/skip/skip.c",
+                          "lib/TOOLCHAIN_GCC_ARM/gcc.s",
+                          "lib/TOOLCHAIN_IAR/iar.s",
+                          "lib/FEATURE_BLE/ble.cpp", "lib/ignored/bad.c"])
+        with open(os.path.join(root, ".mbedignore"), "w") as ignore:
+            ignore.write("lib/ignored/*\n")
+        with open(os.path.join(root, "lib", "TARGET_NRF5", ".mbedignore"),
+                  "w") as ignore:
+            ignore.write("skip/*\n")
+        tree = SourceTree(root)
+
+        def scan(target, source_tree):
+            toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP[target])
+            toolchain.source_tree = source_tree
+            resources = toolchain.scan_resources(root, collect_ignores=True)
+            lib = toolchain.scan_resources(os.path.join(root, "lib"))
+            return resources, lib, toolchain.ignore_patterns
+
+        for target in ["K64F", "NRF51_DK"]:
+            from_disk = scan(target, None)
+            with patch("tools.toolchains.split_dir") as _split_dir, \
+                 patch("tools.toolchains.open", create=True) as _open:
+                from_tree = scan(target, tree)
+                features = from_tree[0].features["BLE"]
+            assert not _split_dir.called and not _open.called
+            for disk, snapshot in zip(from_disk[:2], from_tree[:2]):
+                for field in ["inc_dirs", "headers", "c_sources",
+                              "cpp_sources", "s_sources", "ignored_dirs"]:
+                    assert getattr(disk, field) == getattr(snapshot, field)
+            assert from_disk[2] == from_tree[2]
+            assert features.cpp_sources == \
+                from_disk[0].features["BLE"].cpp_sources
+        assert len(from_tree[0].c_sources) == 1
+        assert from_tree[0].s_sources == [os.path.join(root, "lib",
+                                                       "TOOLCHAIN_GCC_ARM",
+                                                       "gcc.s")]
+    finally:
+        shutil.rmtree(root)
+
+def test_source_tree_exclude():
+    """Test that excluded directories are scanned from the file system, so
+    that files written there after the snapshot are found"""
+    root = tempfile.mkdtemp()
+    try:
+        _make_tree(root, ["main.cpp", "BUILD/mbed/old.h"])
+        build = os.path.join(root, "BUILD", "mbed")
+        tree = SourceTree(root, exclude_paths=[os.path.join(root, "BUILD")])
+        assert root in tree and build not in tree
+        _make_tree(root, ["BUILD/mbed/new.h"])
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+        toolchain.source_tree = tree
+        assert sorted(toolchain.scan_resources(build).headers) == \
+            [os.path.join(build, "new.h"), os.path.join(build, "old.h")]
+    finally:
+        shutil.rmtree(root)
+
+def test_dir_lister_errors():
+    """Test that any error of a listing is raised to the caller, and that the
+    thread that hit it keeps listing"""
+    def list_dir(path):
+        if path == "broken":
+            raise ValueError(path)
+        return [path], []
+    lister = DirLister(list_dir, 1)
+    try:
+        broken = lister.start("broken")
+        working = lister.start("working")
+        with pytest.raises(ValueError):
+            broken()
+        assert working() == (["working"], [])
+    finally:
+        lister.close()
+
+def test_sort_by_compile_time():
+    """Test that the slowest sources, and those never compiled, go first"""
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+    toolchain.compile_times = {"fast.c": 0.5, "slow.c": 9.0, "mid.c": 2.0}
+    queue = [{'source': name} for name in ["fast.c", "mid.c", "new.c",
+                                           "slow.c"]]
+    assert [item['source'] for item in
+            toolchain.sort_by_compile_time(queue)] == \
+        ["new.c", "slow.c", "mid.c", "fast.c"]
+
+def _compile_jobs(command, count=4):
+    return [{'source': "%d.c" % i, 'object': "%d.o" % i,
+             'commands': [command], 'work_dir': os.getcwd(), 'chroot': None}
+            for i in range(count)]
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses posix commands")
+def test_compile_queue():
+    """Test that the parallel compile returns every object and records how
+    long each source took"""
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"], silent=True)
+    toolchain.jobs = 2
+    toolchain.to_be_compiled = 4
+    toolchain.compiled = 0
+    objects = toolchain.compile_queue(_compile_jobs(["true"]), [])
+    assert sorted(objects) == ["0.o", "1.o", "2.o", "3.o"]
+    assert sorted(toolchain.compile_times) == ["0.c", "1.c", "2.c", "3.c"]
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses posix commands")
+def test_compile_queue_errors():
+    """Test that the parallel compile stops on a failure or a timeout"""
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"], silent=True)
+    toolchain.jobs = 2
+    toolchain.to_be_compiled = 4
+    toolchain.compiled = 0
+    with pytest.raises(ToolException):
+        toolchain.compile_queue(_compile_jobs(["false"]), [])
+    toolchain.compile_timeout = 0.5
+    with pytest.raises(ToolException):
+        toolchain.compile_queue(_compile_jobs(["sleep", "5"]), [])
+
+def test_content_hash():
+    """Test that content hashing rebuilds objects when, and only when, the
+    contents of their inputs change"""
+    root = tempfile.mkdtemp()
+    try:
+        source = os.path.join(root, "main.c")
+        header = os.path.join(root, "main.h")
+        obj = os.path.join(root, "main.o")
+        for name in [source, header, obj,
+                     os.path.join(root, ".profile-c")]:
+            open(name, "w").close()
+        with open(os.path.join(root, "main.d"), "w") as dep_file:
+            dep_file.write("main.o: %s \\\n %s\n" % (source, header))
+
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+        toolchain.build_dir = root
+        toolchain.inc_md5 = ""
+        toolchain.config = MagicMock(app_config_location=None)
+        toolchain.content_hash = True
+
+        def rebuilds():
+            toolchain.file_digests = {}
+            commands = toolchain.compile_command(source, obj, [])
+            toolchain.store_digest(obj)
+            return commands is not None
+
+        for name in [source, header, os.path.join(root, ".profile-c")]:
+            os.utime(name, (1000, 1000))
+        assert not rebuilds(), "trusted an up to date object built by mtime"
+        os.utime(source, None)
+        os.utime(header, None)
+        assert not rebuilds(), "rebuilt although the contents are the same"
+        with open(header, "w") as hdr:
+            hdr.write("#define FOO 1\n")
+        assert rebuilds(), "did not rebuild when a dependency changed"
+        assert not rebuilds()
+        toolchain.macros.append("BAR")
+        toolchain.cxx_symbols = None
+        assert rebuilds(), "did not rebuild when the command line changed"
+    finally:
+        shutil.rmtree(root)
+
+def _host_compile(root, deterministic):
+    """Compile a source with the options of GCC_ARM, using the host compiler,
+    from a tree checked out at root"""
+    os.makedirs(os.path.join(root, "inc"))
+    os.makedirs(os.path.join(root, "BUILD"))
+    with open(os.path.join(root, "inc", "version.h"), "w") as header:
+        header.write('#define VERSION "1.0"\n')
+    with open(os.path.join(root, "main.c"), "w") as source:
+        source.write('#include "version.h"\n'
+                     'const char *version = VERSION;\n'
+                     '#ifdef MBED_BUILD_TIMESTAMP\n'
+                     'const double built = MBED_BUILD_TIMESTAMP;\n'
+                     '#endif\n')
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+        toolchain.build_dir = os.path.join(root, "BUILD")
+        toolchain.deterministic = deterministic
+        toolchain.timestamp = float(len(root))
+        includes = [os.path.join(root, "inc")]
+        toolchain.inc_md5 = "deterministic"
+        options = toolchain.get_compile_options(toolchain.get_symbols(),
+                                                includes)
+        assert subprocess.call(["gcc", "-c", "-g"] + options +
+                               ["-o", "main.o", "main.c"]) == 0
+        with open(os.path.join(root, "main.o"), "rb") as obj:
+            return options, obj.read()
+    finally:
+        os.chdir(cwd)
+
+@pytest.mark.skipif(not find_executable("gcc"), reason="needs a host gcc")
+def test_deterministic_build():
+    """Test that a deterministic build gives the same objects at any time and
+    in any directory"""
+    root = tempfile.mkdtemp()
+    try:
+        builds = [_host_compile(os.path.join(root, str(deterministic), path),
+                                deterministic)
+                  for deterministic in [False, True]
+                  for path in ["first", "second/checkout"]]
+        (options, obj), (other_options, other_obj) = builds[:2]
+        assert options != other_options
+        assert obj != other_obj
+        (options, obj), (other_options, other_obj) = builds[2:]
+        assert not any("MBED_BUILD_TIMESTAMP" in opt for opt in options)
+        assert options[:-1] == other_options[:-1]
+        assert obj == other_obj
+    finally:
+        shutil.rmtree(root)
+
+def test_compile_templates():
+    """Test that the commands built from the compile templates are the same
+    as those built from scratch"""
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+    toolchain.RESPONSE_FILES = False
+    toolchain.config_processed = True
+    includes = ["inc", "other"]
+    expected = [toolchain.compile_c(source, source + ".o", includes)
+                for source in ["a.c", "b.c"]]
+    toolchain.compile_templates = {}
+    commands = [toolchain.compile_c(source, source + ".o", includes)
+                for source in ["a.c", "b.c"]]
+    assert commands == expected
+    assert len(toolchain.compile_templates) == 1
+    assert toolchain.compile_cpp("c.cpp", "c.o", includes)[0][0] == \
+        toolchain.cppc[0]
+    assert len(toolchain.compile_templates) == 2
+    # Templates are not shared by different compiler commands or includes
+    command = toolchain.get_compile_template(toolchain.cc + ["-DEXTRA"],
+                                             includes)
+    assert "-DEXTRA" in command
+    assert toolchain.get_compile_template(toolchain.cc, ["inc"]) != \
+        toolchain.get_compile_template(toolchain.cc, includes)
+    assert len(toolchain.compile_templates) == 4
+
+def test_output_log():
+    """Test that the build output keeps its end within the size limit, and
+    that a disk backed log keeps all of it"""
+    messages = ["Warning %d\n" % idx for idx in range(1000)]
+    log = OutputLog(max_size=100)
+    for msg in messages:
+        log.write(msg)
+    assert log.size <= 100 + len(messages[-1])
+    assert log.tail().startswith("[%d characters of output dropped]\n" %
+                                 log.dropped)
+    assert log.tail().endswith("".join(messages[-5:]))
+    assert log.dropped + log.size == len("".join(messages))
+
+    log = OutputLog(max_size=100, disk=True)
+    for msg in messages:
+        log.write(msg)
+    assert log.size <= 100 + len(messages[-1])
+    assert "".join(log) == "".join(messages)
+    assert log.tail().endswith("".join(messages[-5:]))
+    log.write("Error\n")
+    assert "".join(log) == "".join(messages) + "Error\n"
+    log.close()
+
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"], silent=True)
+    toolchain.info("Building project")
+    assert toolchain.get_output() == "Building project\n"
@@ -0,0 +1,161 @@
+"""Measure how long compile_sources() takes to build its compile queue for a
+large number of sources, without running any compiler. A clean build queues
+every source, a no-op build finds every object up to date.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from time import time
+
+from mock import patch
+from prettytable import PrettyTable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..",
+                                    ".."))
+sys.path.insert(0, ROOT)
+
+from tools.toolchains import TOOLCHAIN_CLASSES, Resources
+from tools.targets import TARGET_MAP
+
+TOOLCHAINS = ["GCC_ARM", "ARM", "IAR"]
+
+# Sources are spread over this many directories, every one of them is an
+# include directory
+DIRECTORIES = 50
+
+
+def make_tree(root, count):
+    """Write a source tree of a number of C files and return its resources
+
+    Positional arguments:
+    root - the directory to write the tree into
+    count - the number of sources
+    """
+    resources = Resources()
+    for idx in range(count):
+        directory = os.path.join(root, "src", "dir%d" % (idx % DIRECTORIES))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            resources.inc_dirs.append(directory)
+        source = os.path.join(directory, "source%d.c" % idx)
+        open(source, "w").close()
+        resources.c_sources.append(source)
+        resources.file_basepath[source] = root
+    return resources
+
+
+def queue_time(toolchain_name, resources, build_dir, runs, templates=True):
+    """Best time of a number of runs of compile_sources(), with the
+    compilation itself left out, in seconds. Returns the time and the number
+    of sources that would be compiled
+
+    Positional arguments:
+    toolchain_name - the toolchain building the queue
+    resources - the sources to queue
+    build_dir - where the objects go
+    runs - the number of times to build the queue
+
+    Keyword arguments:
+    templates - reuse the compile command templates between sources
+    """
+    queued = []
+    def compile_seq(queue, objects):
+        queued.append(len(queue))
+        return objects + [item['object'] for item in queue]
+    best = None
+    for _ in range(runs):
+        toolchain = TOOLCHAIN_CLASSES[toolchain_name](TARGET_MAP["K64F"],
+                                                      silent=True)
+        toolchain.build_dir = build_dir
+        toolchain.config = type("Config", (object,),
+                                {"app_config_location": None})()
+        toolchain.jobs = 1
+        if not templates:
+            # Build the whole command for every source
+            toolchain.get_compile_template = (
+                lambda cc, includes, toolchain=toolchain:
+                cc + toolchain.get_compile_options(toolchain.get_symbols(),
+                                                   includes))
+        with patch.object(toolchain, "compile_seq", compile_seq), \
+             patch.object(toolchain, "save_compile_times"):
+            start = time()
+            toolchain.compile_sources(resources)
+        elapsed = time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, queued[-1]
+
+
+def make_up_to_date(resources, toolchain_name, build_dir):
+    """Write an object and a dependency file, newer than the source, for
+    every source"""
+    toolchain = TOOLCHAIN_CLASSES[toolchain_name](TARGET_MAP["K64F"],
+                                                  silent=True)
+    toolchain.prev_dir = None
+    for source in resources.c_sources:
+        obj = toolchain.relative_object_path(
+            build_dir, resources.file_basepath[source], source)
+        open(obj, "w").close()
+        with open(os.path.splitext(obj)[0] + ".d", "w") as dep_file:
+            if toolchain_name == "IAR":
+                # IAR lists one dependency per line
+                dep_file.write("%s\n" % source)
+            else:
+                dep_file.write("%s: %s\n" % (obj, source))
+
+
+def main():
+    """Entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--sources", type=int, default=5000,
+                        help="number of sources (default: 5000)")
+    parser.add_argument("-r", "--runs", type=int, default=3,
+                        help="number of runs of every measurement, the best "
+                        "is reported (default: 3)")
+    parser.add_argument("-t", "--toolchains", nargs="+", default=TOOLCHAINS,
+                        choices=TOOLCHAINS, help="toolchains to measure")
+    parser.add_argument("--json", dest="json",
+                        help="also write the results to a json file")
+    options = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    results = {}
+    table = PrettyTable(["Toolchain", "Build", "Queued", "Time (ms)",
+                         "Without templates (ms)"])
+    try:
+        os.chdir(root)
+        resources = make_tree(root, options.sources)
+        for toolchain_name in options.toolchains:
+            build_dir = os.path.join(root, "BUILD", toolchain_name)
+            os.makedirs(build_dir)
+            results[toolchain_name] = {}
+            for build in ["clean", "no-op"]:
+                if build == "no-op":
+                    make_up_to_date(resources, toolchain_name, build_dir)
+                elapsed, queued = queue_time(toolchain_name, resources,
+                                             build_dir, options.runs)
+                without, _ = queue_time(toolchain_name, resources,
+                                        build_dir, options.runs,
+                                        templates=False)
+                results[toolchain_name][build] = {
+                    "queued": queued, "time": elapsed,
+                    "without_templates": without}
+                table.add_row([toolchain_name, build, queued,
+                               "%.1f" % (elapsed * 1000),
+                               "%.1f" % (without * 1000)])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    print table
+
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
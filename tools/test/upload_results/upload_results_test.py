@@ -0,0 +1,189 @@
+"""Tests for the upload of test results, against a local HTTP server"""
+import gzip
+import json
+import threading
+from StringIO import StringIO
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from mock import patch
+import pytest
+
+from tools import upload_results
+from tools.upload_results import BatchUploader
+
+REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+%s
+</testsuites>
+"""
+
+SUITE = """<testsuite name="%(target)s::%(toolchain)s">
+  <properties>
+    <property name="target" value="%(target)s"/>
+    <property name="toolchain" value="%(toolchain)s"/>
+    <property name="vendor" value="Freescale"/>
+  </properties>
+  %(cases)s
+</testsuite>"""
+
+CASE = """<testcase classname="%(kind)s.%(target)s.%(toolchain)s.%(name)s" name="%(name)s">
+    %(result)s<system-out>%(kind)s output of %(name)s</system-out>
+  </testcase>"""
+
+
+# Seconds allowed for an upload
+UPLOAD_TIMEOUT = 60
+
+
+class ResultServer(ThreadingMixIn, HTTPServer):
+    """Records the project runs posted to it. It may fail the first requests,
+    or refuse compressed ones. Every keep-alive connection of the uploader is
+    served by its own thread"""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), ResultHandler)
+        self.submissions = []
+        self.encodings = []
+        self.fail = 0
+        self.accept_gzip = True
+        self.lock = threading.Lock()
+
+
+class ResultHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        with self.server.lock:
+            self._post()
+
+    def _post(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        encoding = self.headers.get("Content-Encoding")
+        if server.fail:
+            server.fail -= 1
+            return self._reply(503, "busy")
+        if encoding == "gzip":
+            if not server.accept_gzip:
+                return self._reply(415, "no gzip")
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        server.encodings.append(encoding)
+        server.submissions.append(json.loads(body))
+        self._reply(200, "ok")
+
+    def _reply(self, code, text):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+
+@pytest.fixture
+def server():
+    server = ResultServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _write_report(path, kind, targets, names):
+    suites = []
+    for target in targets:
+        cases = [CASE % dict(kind=kind, target=target, toolchain="GCC_ARM",
+                             name=name, result="")
+                 for name in names]
+        cases.append(CASE % dict(kind=kind, target=target,
+                                 toolchain="GCC_ARM", name="FAILING",
+                                 result='<failure message="FAIL"/>'))
+        suites.append(SUITE % dict(target=target, toolchain="GCC_ARM",
+                                   cases="\n".join(cases)))
+    with open(path, "w") as fd:
+        fd.write(REPORT % "\n".join(suites))
+
+
+def _add_project_runs(server, tmpdir, *extra):
+    arguments = ["-u", "http://127.0.0.1:%d/" % server.server_port,
+                 "-k", "key", "add-project-runs", "-b", "42", "-o", "linux",
+                 "-r", str(tmpdir.join("build.xml")),
+                 "-t", str(tmpdir.join("test.xml")),
+                 "--journal", str(tmpdir.join("journal")), "-l", "5"]
+    # Upload from another thread, so that a hung upload fails the test
+    # instead of the whole run
+    result = []
+    def upload():
+        try:
+            upload_results.main(arguments + list(extra))
+        except SystemExit as exc:
+            result.append(exc.code)
+    with patch.object(BatchUploader, "BACKOFF", 0):
+        thread = threading.Thread(target=upload)
+        thread.daemon = True
+        thread.start()
+        thread.join(UPLOAD_TIMEOUT)
+    assert not thread.is_alive(), "the upload did not finish"
+    return result[0]
+
+
+@pytest.fixture
+def reports(tmpdir):
+    names = ["MBED_%d" % number for number in range(6)]
+    _write_report(str(tmpdir.join("build.xml")), "build", ["K64F", "LPC1768"],
+                  names)
+    _write_report(str(tmpdir.join("test.xml")), "test", ["K64F"], names)
+    return tmpdir
+
+
+def test_upload(server, reports):
+    """Test that build and test results of a project are merged, and sent
+    compressed in parts of at most limit project runs"""
+    assert _add_project_runs(server, reports) == 0
+    runs = [run for submission in server.submissions
+            for run in submission["projectRuns"]]
+    assert len(runs) == 14
+    assert sorted(len(s["projectRuns"]) for s in server.submissions) == \
+        [4, 5, 5]
+    assert set(server.encodings) == set(["gzip"])
+    k64f = dict((run["project"], run) for run in runs
+                if run["platform"] == "K64F")
+    assert k64f["MBED_3"]["buildOutput"] == "build output of MBED_3"
+    assert k64f["MBED_3"]["testOutput"] == "test output of MBED_3"
+    assert k64f["FAILING"]["testPass"] is False
+    assert k64f["FAILING"]["testResult"] == "FAIL"
+    assert not reports.join("journal").check()
+
+
+def test_resume(server, reports):
+    """Test that an upload that failed part way only sends the remaining
+    parts when it is run again"""
+    server.fail = 1 + BatchUploader.ATTEMPTS
+    assert _add_project_runs(server, reports, "-j", "1") == 2
+    assert len(server.submissions) == 2
+    assert len(reports.join("journal").readlines()) == 2
+
+    assert _add_project_runs(server, reports, "-j", "1") == 0
+    assert len(server.submissions) == 3
+    assert sum(len(s["projectRuns"]) for s in server.submissions) == 14
+    assert not reports.join("journal").check()
+
+
+def test_uncompressed(server, reports):
+    """Test that parts are sent uncompressed to a server refusing gzip"""
+    server.accept_gzip = False
+    assert _add_project_runs(server, reports) == 0
+    assert len(server.submissions) == 3
+    assert set(server.encodings) == set([None])
+
+
+def test_worker_error(server, reports):
+    """Test that an unexpected error fails the upload instead of stopping a
+    worker and leaving the upload blocked"""
+    with patch.object(BatchUploader, "_post", side_effect=ValueError("bad")):
+        assert _add_project_runs(server, reports, "-j", "1") == 2
+    assert server.submissions == []
@@ -35,6 +35,7 @@ from copy import copy
 
 from time import sleep, time
 from Queue import Queue, Empty
+from collections import deque
 from os.path import join, exists, basename, relpath
 from threading import Thread, Lock
 from multiprocessing import Pool, cpu_count
@@ -82,6 +83,10 @@ except:
 
 
 class ProcessObserver(Thread):
+    # Largest read from the output of the process. A read returns as soon as
+    # any output is available, so it does not delay the output
+    CHUNK_SIZE = 64 * 1024
+
     def __init__(self, proc):
         Thread.__init__(self)
         self.proc = proc
@@ -91,9 +96,12 @@ class ProcessObserver(Thread):
         self.start()
 
     def run(self):
+        fd = self.proc.stdout.fileno()
         while self.active:
-            c = self.proc.stdout.read(1)
-            self.queue.put(c)
+            data = os.read(fd, self.CHUNK_SIZE)
+            if not data:
+                break
+            self.queue.put(data)
 
     def stop(self):
         self.active = False
@@ -103,6 +111,99 @@ class ProcessObserver(Thread):
             pass
 
 
+class HostTestOutput(object):
+    """ Captures the output of a host test, keeping only its last max_size
+        characters, and finds the events the test reports through it
+    """
+    # Events the test reports through its output
+    RE_EVENT = re.compile(r"(?P<end>\{end\})|"
+                          r"(?P<reset>HOST: Reset target\.\.\.)|"
+                          r"(?P<assert>mbed assertation failed: )|"
+                          r"HOST: Property '(?P<property>[^'\r\n]*)' = "
+                          r"'(?P<value>[\w\d _]+)'")
+
+    RE_LINE_END = re.compile("[\r\n]")
+
+    # Non ASCII characters from the serial port are replaced with spaces
+    ASCII_ONLY = "".join(chr(i) if i < 128 else " " for i in range(256))
+
+    MAX_SIZE = 1024 * 1024
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.chunks = deque()
+        self.size = 0
+        self.dropped = 0
+        # The last line of the output, until its end arrives
+        self.line = ""
+        # Set once the test reported its end or an mbed assert
+        self.finished = False
+
+    def _append(self, data):
+        if not data:
+            return
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size - len(self.chunks[0]) >= self.max_size:
+            dropped = self.chunks.popleft()
+            self.size -= len(dropped)
+            self.dropped += len(dropped)
+
+    def feed(self, data):
+        """ Add a piece of the output of the test, and return the events of
+            the lines it completed as a list of ("reset", None) and
+            ("property", (name, value)) tuples. The output following the end
+            of the test or an mbed assert is kept but no longer searched
+        """
+        data = data.translate(self.ASCII_ONLY)
+        if self.finished:
+            self._append(data)
+            return []
+        text = self.line + data
+        complete = max(text.rfind("\n"), text.rfind("\r")) + 1
+        self.line = text[complete:]
+        events = []
+        finish_at = None
+        mbed_assert = False
+        for match in self.RE_EVENT.finditer(text, 0, complete):
+            if finish_at is not None and match.start() >= finish_at:
+                break
+            if match.group("reset"):
+                events.append(("reset", None))
+            elif match.group("property") is not None:
+                events.append(("property", (match.group("property"),
+                                            match.group("value"))))
+            else:
+                mbed_assert = mbed_assert or bool(match.group("assert"))
+                if finish_at is None:
+                    finish_at = self.RE_LINE_END.search(text,
+                                                        match.end()).end()
+        if finish_at is None:
+            self._append(data)
+        else:
+            self.finished = True
+            cut = finish_at - (len(text) - len(data))
+            self._append(data[:cut])
+            if mbed_assert:
+                self._append("{{mbed_assert}}")
+            self._append(data[cut:])
+        return events
+
+    def getvalue(self):
+        """ The output captured so far
+        """
+        output = "".join(self.chunks)
+        if self.size > self.max_size:
+            self.dropped += self.size - self.max_size
+            output = output[-self.max_size:]
+            self.chunks = deque([output])
+            self.size = len(output)
+        if self.dropped:
+            output = "[%d characters of output dropped]\n" % self.dropped + \
+                     output
+        return output
+
+
 class SingleTestExecutor(threading.Thread):
     """ Example: Single test class in separate thread usage
     """
@@ -127,6 +228,48 @@ class SingleTestExecutor(threading.Thread):
         print "Completed in %.2f sec"% (elapsed_time)
 
 
+class MutExecutor(threading.Thread):
+    """ Runs tests on one MUT, one at a time, in the order their binaries are
+        built. Flashing and running a test on a MUT overlaps with building the
+        next binaries and with the tests running on the other MUTs
+    """
+    def __init__(self, single_test, mut):
+        threading.Thread.__init__(self)
+        self.single_test = single_test
+        self.mut = mut
+        self.queue = Queue()
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            data, target, toolchain, test_id, test_loops = job
+            try:
+                handle_result = self.single_test.handle_mut(
+                    self.mut, data, target, toolchain, test_loops=test_loops)
+            except Exception, e:
+                output = self.single_test.logger.log_line(
+                    self.single_test.logger.LogType.ERROR,
+                    'Test %s failed to run on %s: %s' % (test_id,
+                                                          self.mut['mcu'], e))
+                print output
+                handle_result = self.single_test.shape_failed_test_result(
+                    self.single_test.TEST_RESULT_ERROR, target, toolchain,
+                    test_id, output=output,
+                    target_name_unique=self.mut.get('mcu_unique',
+                                                    self.mut['mcu']))
+            self.single_test.record_handle_result(target, toolchain, test_id,
+                                                  handle_result)
+
+    def stop(self):
+        """ Stop once the tests queued so far have run
+        """
+        self.queue.put(None)
+
+
 class SingleTestRunner(object):
     """ Object wrapper for single test run which may involve multiple MUTs
     """
@@ -207,7 +350,8 @@ class SingleTestRunner(object):
                  _opts_consolidate_waterfall_test=None,
                  _opts_extend_test_timeout=None,
                  _opts_auto_detect=None,
-                 _opts_include_non_automated=False):
+                 _opts_include_non_automated=False,
+                 _opts_build_workers=None):
         """ Let's try hard to init this object
         """
         from colorama import init
@@ -267,6 +411,14 @@ class SingleTestRunner(object):
         self.opts = _opts
         self.opts_auto_detect = _opts_auto_detect
         self.opts_include_non_automated = _opts_include_non_automated
+        # Number of targets built at once with parallel test execution
+        self.opts_build_workers = _opts_build_workers if _opts_build_workers else \
+            max(1, cpu_count() // max(1, self.opts_jobs))
+
+        # Test runners of each MUT, by MUT id, while tests execute
+        self.mut_executors = {}
+        # Serializes the use of the database logger by the MUT test runners
+        self.db_logger_lock = Lock()
 
         self.build_report = _opts_build_report
         self.build_properties = _opts_build_properties
@@ -399,20 +551,22 @@ class SingleTestRunner(object):
                 random.shuffle(test_map_keys, self.shuffle_random_func)
                 # Update database with shuffle seed f applicable
                 if self.db_logger:
+                    with self.db_logger_lock:
+                        self.db_logger.reconnect();
+                        if self.db_logger.is_connected():
+                            self.db_logger.update_build_id_info(self.db_logger_build_id, _shuffle_seed=self.shuffle_random_func())
+                            self.db_logger.disconnect();
+
+            if self.db_logger:
+                with self.db_logger_lock:
                     self.db_logger.reconnect();
                     if self.db_logger.is_connected():
-                        self.db_logger.update_build_id_info(self.db_logger_build_id, _shuffle_seed=self.shuffle_random_func())
+                        # Update MUTs and Test Specification in database
+                        self.db_logger.update_build_id_info(self.db_logger_build_id, _muts=self.muts, _test_spec=self.test_spec)
+                        # Update Extra information in database (some options passed to test suite)
+                        self.db_logger.update_build_id_info(self.db_logger_build_id, _extra=json.dumps(self.dump_options()))
                         self.db_logger.disconnect();
 
-            if self.db_logger:
-                self.db_logger.reconnect();
-                if self.db_logger.is_connected():
-                    # Update MUTs and Test Specification in database
-                    self.db_logger.update_build_id_info(self.db_logger_build_id, _muts=self.muts, _test_spec=self.test_spec)
-                    # Update Extra information in database (some options passed to test suite)
-                    self.db_logger.update_build_id_info(self.db_logger_build_id, _extra=json.dumps(self.dump_options()))
-                    self.db_logger.disconnect();
-
             valid_test_map_keys = self.get_valid_tests(test_map_keys, target, toolchain, test_ids, self.opts_include_non_automated)
             skipped_test_map_keys = self.get_skipped_tests(test_map_keys, valid_test_map_keys)
 
@@ -504,27 +658,9 @@ class SingleTestRunner(object):
                         test_result = self.TEST_RESULT_NOT_SUPPORTED
 
 
-                    # Append test results to global test summary
-                    self.test_summary.append(
-                        (test_result, target, toolchain, test_id, test.get_description(), 0, 0, '-')
-                    )
-
-                    # Add detailed test result to test summary structure
-                    if test_id not in self.test_summary_ext[target][toolchain]:
-                        self.test_summary_ext[target][toolchain][test_id] = []
-
-                    self.test_summary_ext[target][toolchain][test_id].append({ 0: {
-                        'result' : test_result,
-                        'output' : '',
-                        'target_name' : target,
-                        'target_name_unique': target,
-                        'toolchain_name' : toolchain,
-                        'id' : test_id,
-                        'description' : test.get_description(),
-                        'elapsed_time' : 0,
-                        'duration' : 0,
-                        'copy_method' : None
-                    }})
+                    self.record_handle_result(target, toolchain, test_id,
+                        self.shape_failed_test_result(test_result, target,
+                                                      toolchain, test_id))
                     continue
 
                 if self.opts_only_build_tests:
@@ -545,41 +681,106 @@ class SingleTestRunner(object):
                 test_suite_properties['test.loops.%s.%s.%s'% (target, toolchain, test_id)] = test_loops
                 test_suite_properties['test.path.%s.%s.%s'% (target, toolchain, test_id)] = path
 
-                # read MUTs, test specification and perform tests
-                handle_results = self.handle(test_spec, target, toolchain, test_loops=test_loops)
+                # Queue the test on the MUTs, which run it while the next tests build
+                self.queue_test(test_spec, target, toolchain, test_id, test_loops=test_loops)
 
-                if handle_results is None:
-                    continue
+            test_suite_properties['skipped'] = ', '.join(test_suite_properties['skipped'])
+            self.test_suite_properties_ext[target][toolchain] = test_suite_properties
 
-                for handle_result in handle_results:
-                    if handle_result:
-                        single_test_result, detailed_test_results = handle_result
-                    else:
-                        continue
+        q.put(target + '_'.join(toolchains))
+        return
+
+    def execute_build_worker(self, slices, q, clean, test_ids):
+        """ Build (and queue the tests of) targets taken from the 'slices'
+            queue until it is empty
+        """
+        while True:
+            try:
+                target, toolchains = slices.get_nowait()
+            except Empty:
+                return
+            self.execute_thread_slice(q, target, toolchains, clean, test_ids, self.build_report, self.build_properties)
+
+    def queue_test(self, test_spec, target_name, toolchain_name, test_id, test_loops=1):
+        """ Queue a built test on every MUT it can run on. Without MUT
+            test runners (see start_mut_executors) the test runs right away
+        """
+        if not self.mut_executors:
+            for handle_result in self.handle(test_spec, target_name, toolchain_name, test_loops=test_loops):
+                self.record_handle_result(target_name, toolchain_name, test_id, handle_result)
+            return
+
+        data = json.loads(test_spec)
+        for id, m in sorted(self.muts.iteritems()):
+            if m['mcu'] == data['mcu']:
+                self.mut_executors[id].queue.put((data, target_name, toolchain_name, test_id, test_loops))
 
-                    # Append test results to global test summary
-                    if single_test_result is not None:
-                        self.test_summary.append(single_test_result)
+    def shape_failed_test_result(self, test_result, target, toolchain, test_id,
+                                 output='', target_name_unique=None):
+        """ Shape the result of a test that did not run, such as a test that
+            failed to build, the way handle_mut returns a test result
+        """
+        test_description = (TEST_MAP[test_id].get_description()
+                            if test_id in TEST_MAP else '')
+        target_name_unique = target_name_unique or target
+        return ((test_result, target_name_unique, toolchain, test_id,
+                 test_description, 0, 0, '-'),
+                {0: {
+                    'result' : test_result,
+                    'output' : output,
+                    'target_name' : target,
+                    'target_name_unique': target_name_unique,
+                    'toolchain_name' : toolchain,
+                    'id' : test_id,
+                    'description' : test_description,
+                    'elapsed_time' : 0,
+                    'duration' : 0,
+                    'copy_method' : None
+                }})
+
+    def record_handle_result(self, target, toolchain, test_id, handle_result):
+        """ Add the result of a test run on a MUT (as returned by handle_mut)
+            to the test summaries
+        """
+        if not handle_result:
+            return
+        single_test_result, detailed_test_results = handle_result
 
-                    # Add detailed test result to test summary structure
-                    if target not in self.test_summary_ext[target][toolchain]:
-                        if test_id not in self.test_summary_ext[target][toolchain]:
-                            self.test_summary_ext[target][toolchain][test_id] = []
+        with self.execute_thread_slice_lock:
+            # Append test results to global test summary
+            if single_test_result is not None:
+                self.test_summary.append(single_test_result)
 
-                        append_test_result = detailed_test_results
+            # Add detailed test result to test summary structure
+            if target not in self.test_summary_ext[target][toolchain]:
+                if test_id not in self.test_summary_ext[target][toolchain]:
+                    self.test_summary_ext[target][toolchain][test_id] = []
 
-                        # If waterfall and consolidate-waterfall options are enabled,
-                        # only include the last test result in the report.
-                        if self.opts_waterfall_test and self.opts_consolidate_waterfall_test:
-                            append_test_result = {0: detailed_test_results[len(detailed_test_results) - 1]}
+                append_test_result = detailed_test_results
 
-                        self.test_summary_ext[target][toolchain][test_id].append(append_test_result)
+                # If waterfall and consolidate-waterfall options are enabled,
+                # only include the last test result in the report.
+                if self.opts_waterfall_test and self.opts_consolidate_waterfall_test:
+                    append_test_result = {0: detailed_test_results[len(detailed_test_results) - 1]}
 
-            test_suite_properties['skipped'] = ', '.join(test_suite_properties['skipped'])
-            self.test_suite_properties_ext[target][toolchain] = test_suite_properties
+                self.test_summary_ext[target][toolchain][test_id].append(append_test_result)
 
-        q.put(target + '_'.join(toolchains))
-        return
+    def start_mut_executors(self):
+        """ Start a test runner for every MUT
+        """
+        if self.opts_only_build_tests:
+            return
+        for id, m in sorted(self.muts.iteritems()):
+            self.mut_executors[id] = MutExecutor(self, m)
+
+    def stop_mut_executors(self):
+        """ Wait for the tests queued on the MUTs to finish
+        """
+        for executor in self.mut_executors.values():
+            executor.stop()
+        for executor in self.mut_executors.values():
+            executor.join()
+        self.mut_executors = {}
 
     def execute(self):
         clean = self.test_spec.get('clean', False)
@@ -592,37 +793,49 @@ class SingleTestRunner(object):
             self.shuffle_random_seed = round(float(self.opts_shuffle_test_seed), self.SHUFFLE_SEED_ROUND)
 
 
-        if self.opts_parallel_test_exec:
-            ###################################################################
-            # Experimental, parallel test execution per singletest instance.
-            ###################################################################
-            execute_threads = []    # Threads used to build mbed SDL, libs, test cases and execute tests
-            # Note: We are building here in parallel for each target separately!
-            # So we are not building the same thing multiple times and compilers
-            # in separate threads do not collide.
-            # Inside execute_thread_slice() function function handle() will be called to
-            # get information about available MUTs (per target).
-            for target, toolchains in self.test_spec['targets'].iteritems():
-                self.test_suite_properties_ext[target] = {}
-                t = threading.Thread(target=self.execute_thread_slice, args = (q, target, toolchains, clean, test_ids, self.build_report, self.build_properties))
-                t.daemon = True
-                t.start()
-                execute_threads.append(t)
-
-            for t in execute_threads:
-                q.get() # t.join() would block some threads because we should not wait in any order for thread end
-        else:
-            # Serialized (not parallel) test execution
-            for target, toolchains in self.test_spec['targets'].iteritems():
-                if target not in self.test_suite_properties_ext:
+        # Every MUT runs its tests as soon as their binaries are built
+        self.start_mut_executors()
+
+        try:
+            if self.opts_parallel_test_exec:
+                ###################################################################
+                # Experimental, parallel test execution per singletest instance.
+                ###################################################################
+                execute_threads = []    # Threads used to build mbed SDL, libs and test cases
+                # Note: We are building here in parallel for each target separately!
+                # So we are not building the same thing multiple times and compilers
+                # in separate threads do not collide.
+                # Inside execute_thread_slice() function queue_test() will be called to
+                # run the tests on available MUTs (per target).
+                slices = Queue()
+                for target, toolchains in self.test_spec['targets'].iteritems():
                     self.test_suite_properties_ext[target] = {}
+                    slices.put((target, toolchains))
+
+                for _ in range(min(self.opts_build_workers, len(self.test_spec['targets']))):
+                    t = threading.Thread(target=self.execute_build_worker, args = (slices, q, clean, test_ids))
+                    t.daemon = True
+                    t.start()
+                    execute_threads.append(t)
+
+                for _ in self.test_spec['targets']:
+                    q.get() # t.join() would block some threads because we should not wait in any order for thread end
+            else:
+                # Serialized (not parallel) build
+                for target, toolchains in self.test_spec['targets'].iteritems():
+                    if target not in self.test_suite_properties_ext:
+                        self.test_suite_properties_ext[target] = {}
 
-                self.execute_thread_slice(q, target, toolchains, clean, test_ids, self.build_report, self.build_properties)
-                q.get()
+                    self.execute_thread_slice(q, target, toolchains, clean, test_ids, self.build_report, self.build_properties)
+                    q.get()
+        finally:
+            self.stop_mut_executors()
 
         if self.db_logger:
             self.db_logger.reconnect();
             if self.db_logger.is_connected():
+                # Test entries are queued by MUT executors, insert what is left
+                self.db_logger.flush_test_entries()
                 self.db_logger.update_build_id_info(self.db_logger_build_id, _status_fk=self.db_logger.BUILD_ID_STATUS_COMPLETED)
                 self.db_logger.disconnect();
 
@@ -833,9 +1046,6 @@ class SingleTestRunner(object):
         mcu = mut['mcu']
         copy_method = mut.get('copy_method')        # Available board configuration selection e.g. core selection etc.
 
-        if self.db_logger:
-            self.db_logger.reconnect()
-
         selected_copy_method = self.opts_copy_method if copy_method is None else copy_method
 
         # Tests can be looped so test results must be stored for the same test
@@ -933,26 +1143,24 @@ class SingleTestRunner(object):
                                          test_id, test_description, elapsed_time, single_timeout)
 
             # Update database entries for ongoing test
-            if self.db_logger and self.db_logger.is_connected():
-                test_type = 'SingleTest'
-                self.db_logger.insert_test_entry(self.db_logger_build_id,
-                                                 target_name,
-                                                 toolchain_name,
-                                                 test_type,
-                                                 test_id,
-                                                 single_test_result,
-                                                 single_test_output,
-                                                 elapsed_time,
-                                                 single_timeout,
-                                                 test_index)
+            if self.db_logger:
+                with self.db_logger_lock:
+                    test_type = 'SingleTest'
+                    self.db_logger.queue_test_entry(self.db_logger_build_id,
+                                                    target_name,
+                                                    toolchain_name,
+                                                    test_type,
+                                                    test_id,
+                                                    single_test_result,
+                                                    single_test_output,
+                                                    elapsed_time,
+                                                    single_timeout,
+                                                    test_index)
 
             # If we perform waterfall test we test until we get OK and we stop testing
             if self.opts_waterfall_test and single_test_result == self.TEST_RESULT_OK:
                 break
 
-        if self.db_logger:
-            self.db_logger.disconnect()
-
         return (self.shape_global_test_loop_result(test_all_result, self.opts_waterfall_test and self.opts_consolidate_waterfall_test),
                 target_name_unique,
                 toolchain_name,
@@ -1021,42 +1229,22 @@ class SingleTestRunner(object):
             printed by test runner and host test during test execution
         """
 
-        def get_char_from_queue(obs):
-            """ Get character from queue safe way
+        def get_data_from_queue(obs):
+            """ Get output from queue safe way
             """
             try:
-                c = obs.queue.get(block=True, timeout=0.5)
+                data = obs.queue.get(block=True, timeout=0.5)
             except Empty, _:
-                c = None
-            return c
-
-        def filter_queue_char(c):
-            """ Filters out non ASCII characters from serial port
-            """
-            if ord(c) not in range(128):
-                c = ' '
-            return c
+                data = None
+            return data
 
         def get_test_result(output):
             """ Parse test 'output' data
             """
             result = self.TEST_RESULT_TIMEOUT
-            for line in "".join(output).splitlines():
-                search_result = self.RE_DETECT_TESTCASE_RESULT.search(line)
-                if search_result and len(search_result.groups()):
-                    result = self.TEST_RESULT_MAPPING[search_result.groups(0)[0]]
-                    break
-            return result
-
-        def get_auto_property_value(property_name, line):
-            """ Scans auto detection line from MUT and returns scanned parameter 'property_name'
-                Returns string
-            """
-            result = None
-            if re.search("HOST: Property '%s'"% property_name, line) is not None:
-                property = re.search("HOST: Property '%s' = '([\w\d _]+)'"% property_name, line)
-                if property is not None and len(property.groups()) == 1:
-                    result = property.groups()[0]
+            search_result = self.RE_DETECT_TESTCASE_RESULT.search(output)
+            if search_result and len(search_result.groups()):
+                result = self.TEST_RESULT_MAPPING[search_result.groups(0)[0]]
             return result
 
         # print "{%s} port:%s disk:%s"  % (name, port, disk),
@@ -1088,61 +1276,51 @@ class SingleTestRunner(object):
         proc = Popen(cmd, stdout=PIPE, cwd=HOST_TESTS)
         obs = ProcessObserver(proc)
         update_once_flag = {}   # Stores flags checking if some auto-parameter was already set
-        line = ''
-        output = []
+        output = HostTestOutput()
         start_time = time()
         while (time() - start_time) < (2 * duration):
-            c = get_char_from_queue(obs)
-            if c:
+            data = get_data_from_queue(obs)
+            if data:
                 if verbose:
-                    sys.stdout.write(c)
-                c = filter_queue_char(c)
-                output.append(c)
-                # Give the mbed under test a way to communicate the end of the test
-                if c in ['\n', '\r']:
-
+                    sys.stdout.write(data)
+                for event, value in output.feed(data):
                     # Checking for auto-detection information from the test about MUT reset moment
-                    if 'reset_target' not in update_once_flag and "HOST: Reset target..." in line:
+                    if event == 'reset' and 'reset_target' not in update_once_flag:
                         # We will update this marker only once to prevent multiple time resets
                         update_once_flag['reset_target'] = True
                         start_time = time()
 
                     # Checking for auto-detection information from the test about timeout
-                    auto_timeout_val = get_auto_property_value('timeout', line)
-                    if 'timeout' not in update_once_flag and auto_timeout_val is not None:
+                    if (event == 'property' and value[0] == 'timeout' and
+                        'timeout' not in update_once_flag):
                         # We will update this marker only once to prevent multiple time resets
                         update_once_flag['timeout'] = True
-                        duration = int(auto_timeout_val)
+                        duration = int(value[1])
 
-                    # Detect mbed assert:
-                    if 'mbed assertation failed: ' in line:
-                        output.append('{{mbed_assert}}')
-                        break
-
-                    # Check for test end
-                    if '{end}' in line:
-                        break
-                    line = ''
-                else:
-                    line += c
+                # Give the mbed under test a way to communicate the end of the test
+                if output.finished:
+                    break
+            elif not obs.is_alive() and obs.queue.empty():
+                # The host test exited without reporting the end of the test
+                break
         end_time = time()
         testcase_duration = end_time - start_time   # Test case duration from reset to {end}
 
-        c = get_char_from_queue(obs)
+        data = get_data_from_queue(obs)
 
-        if c:
+        if data:
             if verbose:
-                sys.stdout.write(c)
-            c = filter_queue_char(c)
-            output.append(c)
+                sys.stdout.write(data)
+            output.feed(data)
 
         if verbose:
             print "Test::Output::Finish"
         # Stop test process
         obs.stop()
 
+        output = output.getvalue()
         result = get_test_result(output)
-        return (result, "".join(output), testcase_duration, duration)
+        return (result, output, testcase_duration, duration)
 
     def is_peripherals_available(self, target_mcu_name, peripherals=None):
         """ Checks if specified target should run specific peripheral test case defined in MUTs file
@@ -1877,6 +2055,12 @@ def get_default_test_options_parser():
                         action="store_true",
                         help='Experimental, you execute test runners for connected to your host MUTs in parallel (speeds up test result collection)')
 
+    parser.add_argument('--build-workers',
+                        dest='build_workers',
+                        type=int,
+                        default=None,
+                        help='Number of targets built at once with --parallel (default: number of cores divided by the number of jobs)')
+
     parser.add_argument('--config',
                         dest='verbose_test_configuration_only',
                         default=False,
@@ -2120,10 +2304,17 @@ def build_tests(tests, base_source_paths, build_path, target, toolchain_name,
                 clean=False, notify=None, verbose=False, jobs=1, macros=None,
                 silent=False, report=None, properties=None,
                 continue_on_build_fail=False, app_config=None,
-                build_profile=None, stats_depth=None):
+                build_profile=None, stats_depth=None, content_hash=False,
+                object_cache=None, object_cache_size=None,
+                library_source_paths=None, deterministic=False):
     """Given the data structure from 'find_tests' and the typical build parameters,
     build all the tests
 
+    base_source_paths may hold sources already compiled with build_library, as
+    tools/test.py does. library_source_paths then names the sources they were
+    compiled from: a test with its own mbed_app.json is built from these
+    instead, as its configuration applies to them too.
+
     Returns a tuple of the build result (True or False) followed by the test
     build data structure"""
 
@@ -2149,11 +2340,16 @@ def build_tests(tests, base_source_paths, build_path, target, toolchain_name,
     result = True
 
     jobs_count = int(jobs if jobs else cpu_count())
+
     p = Pool(processes=jobs_count)
     results = []
     for test_name, test_path in tests.iteritems():
         test_build_path = os.path.join(build_path, test_path)
-        src_path = base_source_paths + [test_path]
+        if (library_source_paths and not app_config and
+                exists(join(test_path, "mbed_app.json"))):
+            src_path = library_source_paths + [test_path]
+        else:
+            src_path = base_source_paths + [test_path]
         bin_file = None
         test_case_folder_name = os.path.basename(test_path)
 
@@ -2171,7 +2367,12 @@ def build_tests(tests, base_source_paths, build_path, target, toolchain_name,
             'build_profile': build_profile,
             'silent': True,
             'toolchain_paths': TOOLCHAIN_PATHS,
-            'stats_depth': stats_depth
+            'stats_depth': stats_depth,
+            'scan_cache_dir': build_path,
+            'content_hash': content_hash,
+            'object_cache': object_cache,
+            'object_cache_size': object_cache_size,
+            'deterministic': deterministic
         }
 
         results.append(p.apply_async(build_test_worker, args, kwargs))
@@ -51,6 +51,16 @@ class BaseDBAccess():
         # Build ID type PKs
         self.BUILD_ID_TYPE_TEST = 1 # Test
         self.BUILD_ID_TYPE_BUILD_ONLY = 2 # Build Only
+        # Query parameter placeholder of the DB-API driver ('%s', '?', ...)
+        self.PARAM = '%s'
+        # Driver exceptions raised when the connection to DB was lost
+        self.CONNECTION_ERRORS = ()
+        # Test entries are inserted in batches of this size
+        self.BATCH_SIZE = 500
+        # Lookup table PKs: {(table, value): pk}
+        self.pk_cache = {}
+        # Test entries waiting for flush_test_entries()
+        self.test_entry_batch = []
 
     def get_hostname(self):
         """ Useful when creating build_id in database
@@ -157,9 +167,108 @@ class BaseDBAccess():
         """
         pass
 
-    def insert_test_entry(self, build_id, target, toolchain, test_type, test_id, test_result, test_time, test_timeout, test_loop, test_extra=''):
+    def execute_many(self, query, rows, commit=True):
+        """ Execute parameterized query for each row of parameters, define if
+            you want to commit. Returns number of rows
+        """
+        con = self.db_object
+        cur = con.cursor()
+        cur.executemany(query, rows)
+        if commit:
+            con.commit()
+        return len(rows)
+
+    def ensure_connected(self):
+        """ Reconnects to DB if connection is not open
+        """
+        if not self.is_connected():
+            self.reconnect()
+        return self.is_connected()
+
+    def call_connected(self, func, *args):
+        """ Calls func(*args) with open DB connection. If connection to DB was
+            lost we reconnect and retry once. Returns None if DB can't be reached
+        """
+        for _ in range(2):
+            if not self.ensure_connected():
+                return None
+            try:
+                return func(*args)
+            except self.CONNECTION_ERRORS:
+                self.disconnect()
+        return None
+
+    def get_cached_table_entry_pk(self, table, column, value):
+        """ Same as get_table_entry_pk() but each (table, value) pair is only
+            looked up in DB once, PKs do not change so they survive reconnects
+        """
+        key = (table, value)
+        if key not in self.pk_cache:
+            result = self.call_connected(self.get_table_entry_pk, table, column, value)
+            if result is None:
+                return None
+            self.pk_cache[key] = result
+        return self.pk_cache[key]
+
+    def queue_test_entry(self, build_id, target, toolchain, test_type, test_id, test_result, test_output, test_time, test_timeout, test_loop, test_extra=''):
+        """ Queues test result entry, it is inserted to database with next
+            flush_test_entries() call. Batch is flushed automatically when it
+            reaches BATCH_SIZE entries. Entry is dropped if its lookup table
+            values can't be resolved
+        """
+        fks = [self.get_cached_table_entry_pk(table, table + '_name', value)
+               for table, value in [(self.TABLE_TARGET, target),
+                                    (self.TABLE_TOOLCHAIN, toolchain),
+                                    (self.TABLE_TEST_TYPE, test_type),
+                                    (self.TABLE_TEST_ID, test_id),
+                                    (self.TABLE_TEST_RESULT, test_result)]]
+        if None in fks:
+            print "Error: Unable to log result of test %s::%s::%s to database"% (toolchain, target, test_id)
+            return
+        self.test_entry_batch.append(tuple([build_id] + fks + [
+            test_output,
+            round(test_time, 2),
+            round(test_timeout, 2),
+            test_loop,
+            test_extra]))
+        if len(self.test_entry_batch) >= self.BATCH_SIZE:
+            self.flush_test_entries()
+
+    def flush_test_entries(self):
+        """ Inserts all queued test entries with one parameterized query and
+            commits them in one transaction. If connection to DB was lost we
+            reconnect and retry once, if DB can't be reached entries stay
+            queued for next flush. Entries rejected by DB are dropped.
+            Returns number of inserted entries
+        """
+        rows = self.test_entry_batch
+        if not rows:
+            return 0
+        columns = ['build_id_fk', 'target_fk', 'toolchain_fk', 'test_type_fk',
+                   'test_id_fk', 'test_result_fk', 'test_output', 'test_time',
+                   'test_timeout', 'test_loop_no', 'test_result_extra']
+        query = """INSERT INTO `%s` (%s)
+                        VALUES (%s)"""% (self.TABLE_TEST_ENTRY,
+                                         ', '.join(['`mtest_%s`'% c for c in columns]),
+                                         ', '.join([self.PARAM] * len(columns)))
+        try:
+            inserted = self.call_connected(self.execute_many, query, rows)
+        except Exception, e:
+            # Same rows would fail again with every next flush
+            print "Error: Dropped %d test results rejected by database: %s"% (len(rows), str(e))
+            self.test_entry_batch = []
+            return 0
+        if inserted is None:
+            return 0
+        self.test_entry_batch = []
+        return inserted
+
+    def insert_test_entry(self, build_id, target, toolchain, test_type, test_id, test_result, test_output, test_time, test_timeout, test_loop, test_extra=''):
         """ Inserts test result entry to database. All checks regarding existing
             toolchain names in DB are performed.
             If some data is missing DB will be updated
         """
-        pass
+        self.queue_test_entry(build_id, target, toolchain, test_type, test_id,
+                              test_result, test_output, test_time,
+                              test_timeout, test_loop, test_extra)
+        self.flush_test_entries()
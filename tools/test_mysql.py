@@ -30,6 +30,8 @@ class MySQLDBAccess(BaseDBAccess):
     def __init__(self):
         BaseDBAccess.__init__(self)
         self.DB_TYPE = 'mysql'
+        self.PARAM = '%s'
+        self.CONNECTION_ERRORS = (mdb.OperationalError, mdb.InterfaceError)
 
     def detect_database(self, verbose=False):
         """ detect database and return VERION data structure or string (verbose=True)
@@ -161,7 +163,6 @@ class MySQLDBAccess(BaseDBAccess):
         """ Checks for entries in tables with two columns (<TABLE_NAME>_pk, <column>)
             If update_db is True updates table entry if value in specified column doesn't exist
         """
-        # TODO: table buffering
         result = None
         table_pk = '%s_pk'% table
         query = """SELECT `%s`
@@ -228,44 +229,3 @@ class MySQLDBAccess(BaseDBAccess):
                                                           build_id)
             cur.execute(query)
             con.commit()
-
-    def insert_test_entry(self, build_id, target, toolchain, test_type, test_id, test_result, test_output, test_time, test_timeout, test_loop, test_extra=''):
-        """ Inserts test result entry to database. All checks regarding existing
-            toolchain names in DB are performed.
-            If some data is missing DB will be updated
-        """
-        # Get all table FK and if entry is new try to insert new value
-        target_fk = self.get_table_entry_pk(self.TABLE_TARGET, self.TABLE_TARGET + '_name', target)
-        toolchain_fk = self.get_table_entry_pk(self.TABLE_TOOLCHAIN, self.TABLE_TOOLCHAIN + '_name', toolchain)
-        test_type_fk = self.get_table_entry_pk(self.TABLE_TEST_TYPE, self.TABLE_TEST_TYPE + '_name', test_type)
-        test_id_fk = self.get_table_entry_pk(self.TABLE_TEST_ID, self.TABLE_TEST_ID + '_name', test_id)
-        test_result_fk = self.get_table_entry_pk(self.TABLE_TEST_RESULT, self.TABLE_TEST_RESULT + '_name', test_result)
-
-        con = self.db_object
-        cur = con.cursor()
-
-        query = """ INSERT INTO `%s` (`mtest_build_id_fk`,
-                                      `mtest_target_fk`,
-                                      `mtest_toolchain_fk`,
-                                      `mtest_test_type_fk`,
-                                      `mtest_test_id_fk`,
-                                      `mtest_test_result_fk`,
-                                      `mtest_test_output`,
-                                      `mtest_test_time`,
-                                      `mtest_test_timeout`,
-                                      `mtest_test_loop_no`,
-                                      `mtest_test_result_extra`)
-                         VALUES (%d, %d, %d, %d, %d, %d, '%s', %.2f, %.2f, %d, '%s')"""% (self.TABLE_TEST_ENTRY,
-                                                                                          build_id,
-                                                                                          target_fk,
-                                                                                          toolchain_fk,
-                                                                                          test_type_fk,
-                                                                                          test_id_fk,
-                                                                                          test_result_fk,
-                                                                                          self.escape_string(test_output),
-                                                                                          test_time,
-                                                                                          test_timeout,
-                                                                                          test_loop,
-                                                                                          self.escape_string(test_extra))
-        cur.execute(query)
-        con.commit()
@@ -20,7 +20,10 @@ Author: Przemyslaw Wirkus <Przemyslaw.wirkus@arm.com>
 import sys
 import json
 import optparse
-from flask import Flask
+from itertools import count
+from collections import OrderedDict
+from Queue import Queue
+from threading import Thread, Lock, Condition
 from os.path import join, abspath, dirname
 
 # Be sure that the tools directory is in the search path
@@ -34,6 +37,7 @@ from tools.build_api import mcu_toolchain_matrix
 # Imports from TEST API
 from test_api import SingleTestRunner
 from test_api import SingleTestExecutor
+from test_api import CLITestLogger
 from test_api import get_json_data_from_file
 from test_api import print_muts_configuration_from_json
 from test_api import print_test_configuration_from_json
@@ -41,17 +45,139 @@ from test_api import get_avail_tests_summary_table
 from test_api import get_default_test_options_parser
 
 
-class SingleTestRunnerWebService(SingleTestRunner):
-    def __init__(self):
-        super(SingleTestRunnerWebService, self).__init__()
+class StreamingTestLogger(CLITestLogger):
+    """ Test logger which lets web service clients read only the log lines
+        logged since their last request, or follow the log as it grows
+    """
+    def __init__(self, file_name=None):
+        CLITestLogger.__init__(self, file_name=file_name)
+        self.closed = False
+        self.cond = Condition()
+
+    def log_line(self, LogType, log_line, timestamp=True, line_delim='\n'):
+        with self.cond:
+            log_line_str = CLITestLogger.log_line(self, LogType, log_line,
+                                                  timestamp, line_delim)
+            self.cond.notify_all()
+        return log_line_str
+
+    def close(self):
+        """ No more lines will be logged, wakes up followers
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def read(self, since=0):
+        """ Returns list of log lines logged after first 'since' lines
+        """
+        with self.cond:
+            entries = self.log[since:]
+        return [self.log_print(entry) for entry in entries]
+
+    def follow(self, since=0, keepalive=15.0):
+        """ Yields (index, log line) pairs as lines are logged until the
+            logger is closed. Yields (index, None) if nothing was logged for
+            'keepalive' seconds, so streaming clients can tell we are alive
+        """
+        index = since
+        while True:
+            with self.cond:
+                if index >= len(self.log) and not self.closed:
+                    self.cond.wait(keepalive)
+                entries = self.log[index:]
+                closed = self.closed
+            if not entries:
+                if closed:
+                    return
+                yield index, None
+            for entry in entries:
+                yield index, self.log_print(entry)
+                index += 1
+
+
+class TestJob(object):
+    """ Test run requested through the web service. Every job has its own
+        runner, test results and log
+    """
+    def __init__(self, job_id, single_test):
+        self.id = job_id
+        self.single_test = single_test
+        self.status = 'queued'
+        self.result = None
+
+        # Test results are class attributes of SingleTestRunner, jobs must
+        # not share them
+        single_test.test_summary = []
+        single_test.test_summary_ext = {}
+        single_test.test_suite_properties_ext = {}
+        self.logger = StreamingTestLogger(single_test.opts_log_file_name)
+        single_test.logger = self.logger
+
+    def run(self):
+        self.status = 'running'
+        try:
+            test_summary, shuffle_seed, test_summary_ext, _, _, _ = self.single_test.execute()
+            self.result = test_summary_ext
+            self.status = 'finished'
+        except Exception, e:
+            self.logger.log_line(self.logger.LogType.EXCEPT, str(e))
+            self.status = 'failed'
+        finally:
+            self.logger.close()
+
+
+class SingleTestRunnerWebService(object):
+    """ Accepts test jobs through REST API, runs them on a pool of worker
+        threads and lets clients poll or stream their progress
+    """
+    def __init__(self, runner_factory, workers=1):
+        """ Positional arguments:
+            runner_factory - callable returning SingleTestRunner for a
+                             test specification and MUTs
+
+            Keyword arguments:
+            workers - number of jobs running at the same time
+        """
+        self.runner_factory = runner_factory
 
         # With this lock we should control access to certain resources inside this class
-        self.resource_lock = thread.allocate_lock()
+        self.resource_lock = Lock()
+        self.jobs = OrderedDict()
+        self.job_ids = count(1)
+        self.job_queue = Queue()
+        self.workers = []
+        for _ in range(workers):
+            t = Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self.workers.append(t)
 
         self.RestRequest = construct_enum(REST_MUTS='muts',
                                           REST_TEST_SPEC='test_spec',
                                           REST_TEST_RESULTS='test_results')
 
+    def _work(self):
+        while True:
+            job = self.job_queue.get()
+            try:
+                job.run()
+            finally:
+                self.job_queue.task_done()
+
+    def submit(self, test_spec, muts):
+        """ Queues test job and returns its ID
+        """
+        with self.resource_lock:
+            job = TestJob(next(self.job_ids), self.runner_factory(test_spec, muts))
+            self.jobs[job.id] = job
+        self.job_queue.put(job)
+        return job.id
+
+    def get_job(self, job_id):
+        with self.resource_lock:
+            return self.jobs.get(job_id)
+
     def get_rest_result_template(self, result, command, success_code):
         """ Returns common part of every web service request
         """
@@ -60,39 +186,119 @@ class SingleTestRunnerWebService(SingleTestRunner):
                   "success_code": success_code} # 0 - OK, >0 - Error number
         return result
 
+    def rest_response(self, result, command, success_code=0):
+        return json.dumps(self.get_rest_result_template(result, command, success_code), indent=4)
+
     # REST API handlers for Flask framework
-    def rest_api_status(self):
+    def rest_api_submit(self, request_data):
+        """ Queues test job described by JSON with 'test_spec' and 'muts'
+        """
+        try:
+            data = json.loads(request_data)
+            job_id = self.submit(data['test_spec'], data['muts'])
+        except (ValueError, KeyError, TypeError), e:
+            return self.rest_response(str(e), 'submit', -1)
+        return self.rest_response({'job': job_id}, 'submit')
+
+    def rest_api_status(self, job_id=None):
         """ Returns current test execution status. E.g. running / finished etc.
         """
         with self.resource_lock:
-            pass
-
-    def rest_api_config(self):
+            jobs = self.jobs.values()
+        if job_id is not None:
+            jobs = [job for job in jobs if job.id == job_id]
+            if not jobs:
+                return self.rest_response({}, 'status', -1)
+        result = dict((job.id, job.status) for job in jobs)
+        return self.rest_response(result, 'status')
+
+    def rest_api_config(self, job_id):
         """ Returns configuration passed to SingleTest executor
         """
-        with self.resource_lock:
-            pass
-
-    def rest_api_log(self):
-        """ Returns current test log """
-        with self.resource_lock:
-            pass
+        job = self.get_job(job_id)
+        if job is None:
+            return self.rest_response({}, 'config', -1)
+        return self.rest_response(job.single_test.dump_options(), 'config')
+
+    def rest_api_log(self, job_id, since=0):
+        """ Returns test log lines logged after first 'since' lines. Clients
+            pass back 'next' to only get new lines with the next poll
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return self.rest_response({}, 'log', -1)
+        lines = job.logger.read(since)
+        result = {'log': lines,
+                  'next': since + len(lines),
+                  'status': job.status}
+        return self.rest_response(result, 'log')
+
+    def rest_api_log_stream(self, job_id, since=0):
+        """ Yields test log as server-sent events while the job runs
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return
+        for index, line in job.logger.follow(since):
+            if line is None:
+                yield ": keepalive\n\n"
+            else:
+                yield "id: %d\ndata: %s\n\n"% (index + 1, line)
+        yield "event: end\ndata: %s\n\n"% job.status
 
-    def rest_api_request_handler(self, request_type):
+    def rest_api_request_handler(self, job_id, request_type):
         """ Returns various data structures. Both static and mutable during test
         """
         result = {}
         success_code = 0
-        with self.resource_lock:
-            if request_type == self.RestRequest.REST_MUTS:
-                result = self.muts # Returns MUTs
-            elif request_type == self.RestRequest.REST_TEST_SPEC:
-                result = self.test_spec # Returns Test Specification
-            elif request_type == self.RestRequest.REST_TEST_RESULTS:
-                pass # Returns test results
-            else:
-                success_code = -1
-        return json.dumps(self.get_rest_result_template(result, 'request/' + request_type, success_code), indent=4)
+        job = self.get_job(job_id)
+        if job is None:
+            success_code = -1
+        elif request_type == self.RestRequest.REST_MUTS:
+            result = job.single_test.muts # Returns MUTs
+        elif request_type == self.RestRequest.REST_TEST_SPEC:
+            result = job.single_test.test_spec # Returns Test Specification
+        elif request_type == self.RestRequest.REST_TEST_RESULTS:
+            result = job.result # Returns test results
+        else:
+            success_code = -1
+        return self.rest_response(result, 'request/' + request_type, success_code)
+
+
+def get_rest_api_app(service):
+    """ Flask application serving REST API of SingleTestRunnerWebService
+    """
+    from flask import Flask, Response, request, stream_with_context
+
+    app = Flask(__name__)
+
+    @app.route('/jobs', methods=['POST'])
+    def rest_api_submit():
+        return service.rest_api_submit(request.get_data())
+
+    @app.route('/status')
+    @app.route('/status/<int:job_id>')
+    def rest_api_status(job_id=None):
+        return service.rest_api_status(job_id)
+
+    @app.route('/config/<int:job_id>')
+    def rest_api_config(job_id):
+        return service.rest_api_config(job_id)
+
+    @app.route('/log/<int:job_id>')
+    def rest_api_log(job_id):
+        since = request.args.get('since', 0, type=int)
+        if request.accept_mimetypes.best == 'text/event-stream':
+            since = int(request.headers.get('Last-Event-ID', since))
+            return Response(stream_with_context(service.rest_api_log_stream(job_id, since)),
+                            mimetype='text/event-stream')
+        return service.rest_api_log(job_id, since)
+
+    @app.route('/request/<int:job_id>/<request_type>') # 'muts', 'test_spec', 'test_results'
+    def rest_api_request_handler(job_id, request_type):
+        return service.rest_api_request_handler(job_id, request_type)
+
+    return app
 
 
 def singletest_in_webservice_mode():
@@ -202,42 +408,31 @@ if __name__ == '__main__':
                                    _opts_copy_method=opts.copy_method
                                    )
 
-    try:
-        st_exec_thread = SingleTestExecutor(single_test)
-    except KeyboardInterrupt, e:
-        print "\n[CTRL+c] exit"
-    st_exec_thread.start()
-
     if opts.rest_api_enabled:
-        # Enable REST API
-
-        app = Flask(__name__)
-
-        @app.route('/')
-        def hello_world():
-            return 'Hello World!'
-
-        @app.route('/status')
-        def rest_api_status():
-            return single_test.rest_api_status() # TODO
-
-        @app.route('/config')
-        def rest_api_config():
-            return single_test.rest_api_config() # TODO
-
-        @app.route('/log')
-        def rest_api_log():
-            return single_test.rest_api_log() # TODO
-
-        @app.route('/request/<request_type>') # 'muts', 'test_spec', 'test_results'
-        def rest_api_request_handler(request_type):
-            result = single_test.rest_api_request_handler(request_type) # TODO
-            return result
+        # Enable REST API, test specification and MUTs given on command line
+        # are the first job, more jobs can be posted to /jobs
+        def runner_factory(test_spec, muts):
+            return SingleTestRunner(_global_loops_count=opts.test_global_loops_value,
+                                    _test_loops_list=opts.test_loops_list,
+                                    _muts=muts,
+                                    _test_spec=test_spec,
+                                    _opts_verbose=opts.verbose,
+                                    _opts_only_build_tests=opts.only_build_tests,
+                                    _opts_suppress_summary=True,
+                                    _opts_copy_method=opts.copy_method)
+        service = SingleTestRunnerWebService(runner_factory)
+        service.submit(test_spec, MUTs)
+        app = get_rest_api_app(service)
 
         rest_api_port = int(opts.rest_api_port_no) if opts.rest_api_port_no else 5555
         app.debug = False
-        app.run(port=rest_api_port) # Blocking Flask REST API web service
+        app.run(port=rest_api_port, threaded=True) # Blocking Flask REST API web service
     else:
+        try:
+            st_exec_thread = SingleTestExecutor(single_test)
+        except KeyboardInterrupt, e:
+            print "\n[CTRL+c] exit"
+        st_exec_thread.start()
         st_exec_thread.join()
 
 '''
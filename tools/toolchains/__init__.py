@@ -17,27 +17,41 @@ limitations under the License.
 
 import re
 import sys
-from os import stat, walk, getcwd, sep, remove
+from os import stat, walk, getcwd, sep, remove, listdir, rename, getpid, environ
+from os import open as os_open, close as os_close, O_CREAT, O_EXCL, O_WRONLY
+from errno import EEXIST
 from copy import copy
 from time import time, sleep
 from types import ListType
 from shutil import copyfile
 from os.path import join, splitext, exists, relpath, dirname, basename, split, abspath, isfile, isdir, normcase
 from itertools import chain
-from inspect import getmro
 from copy import deepcopy
 from tools.config import Config
 from abc import ABCMeta, abstractmethod
 from distutils.spawn import find_executable
 
-from multiprocessing import Pool, cpu_count
+from multiprocessing import Pool, TimeoutError, cpu_count
+from threading import Thread, Event
+from Queue import Queue
+from collections import deque
+from tempfile import TemporaryFile
 from tools.utils import run_cmd, mkdir, rel_path, ToolException, NotSupportedException, split_path, compile_worker
 from tools.settings import MBED_ORG_USER
 import tools.hooks as hooks
 from tools.memap import MemapParser
 from hashlib import md5
+from json import load, dump, dumps
 import fnmatch
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 
 #Disables multiprocessing if set to higher number than the host machine CPUs
 CPU_COUNT_MIN = 1
@@ -295,6 +309,363 @@ class Resources:
 
         return '\n'.join(s)
 
+
+def split_dir(path):
+    """List a directory, split into sub-directories and files in the same way
+    as os.walk(path, followlinks=True) does. scandir is used when available,
+    as it avoids a stat call per entry on most platforms
+
+    Raises OSError when the directory may not be listed.
+    """
+    dirs, files = [], []
+    if scandir is None:
+        for name in listdir(path):
+            if isdir(join(path, name)):
+                dirs.append(name)
+            else:
+                files.append(name)
+        return dirs, files
+    for entry in scandir(path):
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            dirs.append(entry.name)
+        else:
+            files.append(entry.name)
+    return dirs, files
+
+
+def _native_str(obj):
+    """Convert the unicode strings produced by json.load back into the byte
+    strings that the rest of the scanner works with"""
+    if isinstance(obj, unicode):
+        return obj.encode("utf-8")
+    elif isinstance(obj, list):
+        return [_native_str(o) for o in obj]
+    elif isinstance(obj, dict):
+        return dict((_native_str(k), _native_str(v)) for k, v in obj.items())
+    return obj
+
+
+class ScanCache(object):
+    """An on-disk cache of resource scans, stored in the build directory
+
+    Two levels of information are kept:
+    listings - the sub-directories and files of every directory walked, reused
+               for as long as the directory's mtime does not change
+    scans - the complete result of a scan_resources call, reused when every
+            directory it visited and every .mbedignore it read is unchanged
+    """
+    VERSION = 1
+
+    # The cache lives in a sub-directory, so that rewriting it does not
+    # change the mtime of a build directory that is itself being scanned
+    DIR_NAME = ".scan_cache"
+    FILE_NAME = "resources.json"
+
+    # Directories modified this recently may still change within the mtime
+    # resolution of the file system, so their listings are not trusted
+    RACY_SECONDS = 2
+
+    # Number of scan results kept; the least recently used are dropped first
+    MAX_SCANS = 256
+
+    # Seconds after which a cache hit updates the time of use on disk
+    USED_RESOLUTION = 24 * 60 * 60
+
+    # Seconds to wait for another build saving the cache. A lock older than
+    # this was left behind by a build that did not finish saving
+    LOCK_TIMEOUT = 10
+
+    RESOURCE_FIELDS = ['inc_dirs', 'headers', 's_sources', 'c_sources',
+                       'cpp_sources', 'objects', 'libraries', 'lib_builds',
+                       'lib_refs', 'repo_dirs', 'repo_files', 'hex_files',
+                       'bin_files', 'json_files', 'ignored_dirs']
+
+    def __init__(self, path):
+        self.filename = join(path, self.DIR_NAME, self.FILE_NAME)
+        self.listings, self.scans = self._read()
+        self.dirty = False
+
+    def _read(self):
+        """Read the listings and scans saved in the cache file"""
+        try:
+            with open(self.filename) as fd:
+                data = load(fd)
+            if data["version"] == self.VERSION:
+                return data["listings"], data["scans"]
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+        return {}, {}
+
+    def _lock(self):
+        """Take the lock of the cache file. Returns False if another process
+        held it for longer than LOCK_TIMEOUT seconds"""
+        lock_file = self.filename + ".lock"
+        deadline = time() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                os_close(os_open(lock_file, O_CREAT | O_EXCL | O_WRONLY))
+                return True
+            except OSError as exc:
+                if exc.errno != EEXIST:
+                    return False
+            try:
+                # The lock of a build that was killed while saving
+                if time() - stat(lock_file).st_mtime > self.LOCK_TIMEOUT:
+                    remove(lock_file)
+                    continue
+            except OSError:
+                continue
+            if time() > deadline:
+                return False
+            sleep(0.01)
+
+    def save(self):
+        """Write the cache back to disk if it changed. Parallel test builds
+        may share a single cache, so the scans other builds saved since this
+        cache was read are merged in under a lock, and the file is replaced
+        atomically"""
+        if not self.dirty:
+            return
+        lock_file = self.filename + ".lock"
+        tmp_file = "%s.%d" % (self.filename, getpid())
+        try:
+            mkdir(dirname(self.filename))
+            if not self._lock():
+                return
+        except (IOError, OSError):
+            return
+        try:
+            listings, scans = self._read()
+            for path, entry in self.listings.iteritems():
+                if path not in listings or listings[path][0] <= entry[0]:
+                    listings[path] = entry
+            for key, entry in self.scans.iteritems():
+                if key not in scans or scans[key]["used"] <= entry["used"]:
+                    scans[key] = entry
+            if len(scans) > self.MAX_SCANS:
+                keep = sorted(scans, key=lambda k: scans[k]["used"],
+                              reverse=True)[:self.MAX_SCANS]
+                scans = dict((k, scans[k]) for k in keep)
+            self.listings, self.scans = listings, scans
+            with open(tmp_file, "wb") as fd:
+                dump({"version": self.VERSION, "listings": self.listings,
+                      "scans": self.scans}, fd)
+            if sys.platform == "win32" and exists(self.filename):
+                remove(self.filename)
+            rename(tmp_file, self.filename)
+        except (IOError, OSError):
+            pass
+        finally:
+            try:
+                remove(lock_file)
+            except OSError:
+                pass
+        self.dirty = False
+
+    def listdir(self, path):
+        """List a directory, split into sub-directories and files in the same
+        way as os.walk does, and return the directory's mtime alongside
+
+        Raises OSError when the directory may not be listed.
+        """
+        mtime = stat(path).st_mtime
+        entry = self.listings.get(path)
+        if entry and entry[0] == mtime:
+            return list(entry[1]), list(entry[2]), mtime
+        dirs, files = split_dir(path)
+        if time() - mtime > self.RACY_SECONDS:
+            self.listings[path] = [mtime, dirs, files]
+            self.dirty = True
+        return list(dirs), list(files), mtime
+
+    @staticmethod
+    def key(*parts):
+        return md5(dumps(parts, sort_keys=True)).hexdigest()
+
+    def lookup(self, key, build_dir, base_path):
+        """Return a previously stored scan when none of its inputs changed
+
+        Positional arguments:
+        key - the key computed from the scan's inputs
+        build_dir - the build directory of the toolchain doing the scan
+        base_path - the base path of the scan
+        """
+        entry = self.scans.get(key)
+        if entry is None:
+            return None
+        # The build directory is skipped while walking. It only becomes an
+        # input of the scan when the walk actually reached it
+        if entry["build_dir"] is not None:
+            if entry["build_dir"] != build_dir:
+                return None
+        elif build_dir and any(relpath(d, base_path) == build_dir
+                               for d in entry["dirs"]):
+            return None
+        try:
+            for path, mtime in entry["dirs"].iteritems():
+                if stat(path).st_mtime != mtime:
+                    return None
+            for path, digest in entry["ignores"].iteritems():
+                with open(path) as fd:
+                    if md5(fd.read()).hexdigest() != digest:
+                        return None
+        except (IOError, OSError):
+            return None
+        # The time of use only orders the scans for eviction, so a hit only
+        # rewrites the cache when that time is far out of date
+        now = time()
+        if now - entry["used"] > self.USED_RESOLUTION:
+            self.dirty = True
+        entry["used"] = now
+        return _native_str(entry)
+
+    def store(self, key, build_dir, record, resources, patterns):
+        """Remember the result of a scan
+
+        Positional arguments:
+        key - the key computed from the scan's inputs
+        build_dir - the build directory of the toolchain doing the scan
+        record - the ScanRecord filled in during the walk
+        resources - the resulting Resources object
+        patterns - ignore patterns that were added during the scan
+        """
+        now = time()
+        if any(now - mtime <= self.RACY_SECONDS
+               for mtime in record.dirs.itervalues()):
+            return
+        entry = dict((field, getattr(resources, field))
+                     for field in self.RESOURCE_FIELDS)
+        entry.update({
+            "dirs": record.dirs,
+            "build_dir": build_dir if record.hit_build_dir else None,
+            "ignores": record.ignores,
+            "features": record.features,
+            "patterns": patterns,
+            "lib_dirs": list(resources.lib_dirs),
+            "linker_script": resources.linker_script,
+            "file_basepath": resources.file_basepath.keys(),
+            "used": now,
+        })
+        self.scans[key] = entry
+        self.dirty = True
+
+
+class ScanRecord(object):
+    """The inputs of a single scan, collected while walking the tree"""
+    def __init__(self):
+        self.dirs = {}
+        self.ignores = {}
+        self.features = {}
+        self.hit_build_dir = False
+
+class DirLister(object):
+    """Lists directories in a pool of threads, ahead of the walk that consumes
+    the listings. Scanning a workspace on a network file system is bound by
+    the latency of each listing, which the threads overlap
+    """
+    def __init__(self, list_dir, threads):
+        self._list_dir = list_dir
+        self._queue = Queue()
+        self._threads = [Thread(target=self._work) for _ in range(threads)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            path, result, done = job
+            try:
+                result.append((self._list_dir(path), None))
+            except Exception:
+                # Handed to the caller, so that a failed listing never
+                # leaves it waiting
+                result.append((None, sys.exc_info()))
+            finally:
+                done.set()
+
+    def start(self, path):
+        """Queue the listing of a directory. Returns a function that waits for
+        the listing and returns it, or raises the exception of the listing"""
+        result, done = [], Event()
+        self._queue.put((path, result, done))
+        def listing():
+            done.wait()
+            value, exc_info = result[0]
+            if exc_info:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            return value
+        return listing
+
+    def close(self):
+        """Stop the threads once the listings queued so far are done"""
+        for _ in self._threads:
+            self._queue.put(None)
+
+
+class SourceTree(object):
+    """A label neutral snapshot of the directories of a source tree, taken
+    once and shared by the scans of many targets and toolchains
+
+    Every directory is listed without regard to TARGET_, TOOLCHAIN_ and
+    FEATURE_ labels, along with the contents of its .mbedignore. A toolchain
+    given a SourceTree scans any path within it from the snapshot: the labels
+    and ignore patterns of the toolchain are applied in memory, exactly as
+    they would be during a walk of the file system. Directories that no scan
+    enters (hidden directories and TESTS) are not listed, and paths outside
+    the snapshot are scanned from the file system as usual.
+
+    Positional arguments:
+    top - the directory to take a snapshot of
+
+    Keyword arguments:
+    exclude_paths - directories left out of the snapshot, such as build
+                    directories that change while the snapshot is in use
+    threads - the number of threads listing directories
+    """
+    def __init__(self, top, exclude_paths=None, threads=8):
+        self.top = top
+        self.listings = {}
+        self.ignores = {}
+        self._excluded = set(normcase(abspath(path))
+                             for path in exclude_paths or [])
+        lister = DirLister(split_dir, threads)
+        try:
+            self._take(top, lister.start(top), lister.start)
+        finally:
+            lister.close()
+
+    def _take(self, path, listing, start):
+        try:
+            dirs, files = listing()
+        except OSError:
+            return
+        self.listings[path] = (dirs, files)
+        if ".mbedignore" in files:
+            try:
+                with open(join(path, ".mbedignore")) as fd:
+                    self.ignores[path] = fd.readlines()
+            except IOError:
+                pass
+        listings = [(join(path, d), start(join(path, d))) for d in dirs
+                    if not d.startswith('.') and d != 'TESTS' and
+                    not self._is_excluded(join(path, d))]
+        for sub_path, sub_listing in listings:
+            self._take(sub_path, sub_listing, start)
+
+    def _is_excluded(self, path):
+        return bool(self._excluded) and normcase(abspath(path)) in self._excluded
+
+    def __contains__(self, path):
+        return path in self.listings
+
+
 # Support legacy build conventions: the original mbed build system did not have
 # standard labels for the "TARGET_" and "TOOLCHAIN_" specific directories, but
 # had the knowledge of a list of these directories to be ignored.
@@ -310,6 +681,68 @@ LEGACY_TOOLCHAIN_NAMES = {
 }
 
 
+class OutputLog(object):
+    """The messages of a build, as shown in the build reports
+
+    Messages are kept as chunks instead of one growing string. Only the last
+    max_size characters, where the errors usually are, stay in memory. Older
+    messages are dropped, or moved to a temporary file when the log is disk
+    backed so that iterating over the log still gives all of it
+    """
+    MAX_SIZE = 1024 * 1024
+
+    def __init__(self, max_size=MAX_SIZE, disk=False):
+        self.max_size = max_size
+        self.disk = disk
+        self.chunks = deque()
+        self.size = 0
+        self.dropped = 0
+        self.spill = None
+
+    def write(self, msg):
+        """Add a message to the end of the log"""
+        self.chunks.append(msg)
+        self.size += len(msg)
+        while self.size - len(self.chunks[0]) >= self.max_size:
+            chunk = self.chunks.popleft()
+            self.size -= len(chunk)
+            if self.disk:
+                if self.spill is None:
+                    self.spill = TemporaryFile()
+                self.spill.write(chunk)
+            else:
+                self.dropped += len(chunk)
+
+    def __iter__(self):
+        """Iterate over the chunks of the log, oldest first"""
+        if self.dropped:
+            yield "[%d characters of output dropped]\n" % self.dropped
+        if self.spill is not None:
+            self.spill.seek(0)
+            for chunk in iter(lambda: self.spill.read(64 * 1024), ""):
+                yield chunk
+            self.spill.seek(0, 2)
+        for chunk in list(self.chunks):
+            yield chunk
+
+    def tail(self):
+        """The messages kept in memory, preceded by the amount of output
+        that is not"""
+        output = "".join(self.chunks)
+        if self.spill is not None:
+            output = ("[%d characters of output not shown]\n" %
+                      self.spill.tell()) + output
+        if self.dropped:
+            output = "[%d characters of output dropped]\n" % self.dropped + \
+                     output
+        return output
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
 class mbedToolchain:
     # Verbose logging
     VERBOSE = True
@@ -338,6 +771,17 @@ class mbedToolchain:
 
     PROFILE_FILE_NAME = ".profile"
 
+    COMPILE_TIMES_FILE_NAME = ".compile_times.json"
+
+    # Extension of the files holding the content digest of each object
+    DIGEST_EXT = ".hash"
+
+    # Default time, in seconds, allowed for compiling all sources of a build
+    COMPILE_TIMEOUT = 30 * 60
+
+    # Default number of threads listing directories while scanning resources
+    SCAN_THREADS = 8
+
     __metaclass__ = ABCMeta
 
     profile_template = {'common':[], 'c':[], 'cxx':[], 'asm':[], 'ld':[]}
@@ -388,6 +832,35 @@ class mbedToolchain:
         # Number of concurrent build jobs. 0 means auto (based on host system cores)
         self.jobs = 0
 
+        # Time allowed for compiling all sources, in seconds. None means no limit
+        self.compile_timeout = self.COMPILE_TIMEOUT
+
+        # Number of threads listing directories while scanning. 1 scans in
+        # the calling thread only
+        self.scan_threads = self.SCAN_THREADS
+
+        # Compile time of each source, used to schedule the slowest ones first
+        self.compile_times = {}
+
+        # Decide what to rebuild from the contents of the sources, their
+        # dependencies and the command line instead of modification times
+        self.content_hash = False
+        # Digest of each file read while computing object digests
+        self.file_digests = {}
+        # Digests of the objects being built, written once the build succeeds
+        self.pending_digests = {}
+
+        # Compiled objects shared between build directories. See ObjectCache
+        self.object_cache = None
+
+        # Leave the build time and absolute paths out of compiled objects, so
+        # that they only depend on the sources
+        self.deterministic = False
+
+        # Part of the compile commands shared by all sources, per compiler.
+        # Only kept while compile_sources() builds its queue
+        self.compile_templates = None
+
         # Ignore patterns from .mbedignore files
         self.ignore_patterns = []
         self._ignore_regex = re.compile("$^")
@@ -415,7 +888,7 @@ class mbedToolchain:
         self.silent = silent
 
         # Print output buffer
-        self.output = str()
+        self.output = OutputLog()
 
         # uVisor spepcific rules
         if 'UVISOR' in self.target.features and 'UVISOR_SUPPORTED' in self.target.extra_labels:
@@ -425,6 +898,16 @@ class mbedToolchain:
         # header files during dependency change. See need_update()
         self.stat_cache = {}
 
+        # Directory holding the on-disk resource scan cache. Defaults to the
+        # build directory when None; False disables the cache. See ScanCache
+        self.scan_cache_dir = None
+        self._scan_cache = None
+        self._scan_record = None
+
+        # Snapshot of the source tree shared between toolchains, scanned
+        # instead of the file system when set. See SourceTree
+        self.source_tree = None
+
         # Used by the mbed Online Build System to build in chrooted environment
         self.CHROOT = None
 
@@ -438,7 +921,7 @@ class mbedToolchain:
         return True
 
     def get_output(self):
-        return self.output
+        return self.output.tail()
 
     def print_notify(self, event, silent=False):
         """ Default command line notification
@@ -468,7 +951,7 @@ class mbedToolchain:
         if msg:
             if not silent:
                 print msg
-            self.output += msg + "\n"
+            self.output.write(msg + "\n")
 
     def print_notify_verbose(self, event, silent=False):
         """ Default command line notification with more verbose mode
@@ -485,7 +968,7 @@ class mbedToolchain:
             msg = '[%(severity)s] %(target_name)s::%(toolchain_name)s::%(file)s@%(line)s: %(message)s' % event
             if not silent:
                 print msg
-            self.output += msg + "\n"
+            self.output.write(msg + "\n")
 
         elif event['type'] == 'progress':
             self.print_notify(event) # standard handle
@@ -511,7 +994,7 @@ class mbedToolchain:
                 self.asm_symbols += self.target.macros
                 # Add extra symbols passed via 'macros' parameter
                 self.asm_symbols += self.macros
-            return list(set(self.asm_symbols))  # Return only unique symbols
+            return sorted(set(self.asm_symbols))  # Return only unique symbols
         else:
             if self.cxx_symbols is None:
                 # Target and Toolchain symbols
@@ -524,7 +1007,10 @@ class mbedToolchain:
                     self.cxx_symbols.extend(mbedToolchain.CORTEX_SYMBOLS[self.target.core])
 
                 # Symbols defined by the on-line build.system
-                self.cxx_symbols.extend(['MBED_BUILD_TIMESTAMP=%s' % self.timestamp, 'TARGET_LIKE_MBED', '__MBED__=1'])
+                self.cxx_symbols.extend(['TARGET_LIKE_MBED', '__MBED__=1'])
+                timestamp = self.get_build_timestamp()
+                if timestamp is not None:
+                    self.cxx_symbols.append('MBED_BUILD_TIMESTAMP=%s' % timestamp)
                 if MBED_ORG_USER:
                     self.cxx_symbols.append('MBED_USERNAME=' + MBED_ORG_USER)
 
@@ -541,7 +1027,17 @@ class mbedToolchain:
                 if hasattr(self.target, 'supported_form_factors'):
                     self.cxx_symbols.extend(["TARGET_FF_%s" % t for t in self.target.supported_form_factors])
 
-            return list(set(self.cxx_symbols))  # Return only unique symbols
+            return sorted(set(self.cxx_symbols))  # Return only unique symbols
+
+    def get_build_timestamp(self):
+        """Return the value of MBED_BUILD_TIMESTAMP, or None to leave it out
+
+        A deterministic build uses SOURCE_DATE_EPOCH when it is set, as the
+        reproducible builds convention goes, and otherwise leaves it out
+        """
+        if not self.deterministic:
+            return self.timestamp
+        return environ.get('SOURCE_DATE_EPOCH')
 
     # Extend the internal list of macros
     def add_macros(self, new_macros):
@@ -549,7 +1045,7 @@ class mbedToolchain:
 
     def get_labels(self):
         if self.labels is None:
-            toolchain_labels = [c.__name__ for c in getmro(self.__class__)]
+            toolchain_labels = [c.__name__ for c in self.__class__.__mro__]
             toolchain_labels.remove('mbedToolchain')
             self.labels = {
                 'TARGET': self.target.labels,
@@ -632,10 +1128,118 @@ class mbedToolchain:
 
         if isfile(path):
             self._add_file(path, resources, base_path, exclude_paths=exclude_paths)
-        else:
+            return resources
+
+        cache = None if self._in_source_tree(path) else self.get_scan_cache()
+        if cache is None:
             self._add_dir(path, resources, base_path, exclude_paths=exclude_paths)
+            return resources
+
+        labels = self.get_labels()
+        key = ScanCache.key(path, base_path, exclude_paths, collect_ignores,
+                            sorted(labels['TARGET']),
+                            sorted(labels['TOOLCHAIN']),
+                            sorted(self.legacy_ignore_dirs),
+                            self.ignore_patterns, self.LIBRARY_EXT,
+                            self.LINKER_EXT)
+        entry = cache.lookup(key, self.build_dir, base_path)
+        if entry is not None:
+            self._load_cached_scan(entry, resources, base_path)
+        else:
+            old_patterns = len(self.ignore_patterns)
+            old_record, self._scan_record = self._scan_record, ScanRecord()
+            try:
+                self._add_dir(path, resources, base_path,
+                              exclude_paths=exclude_paths)
+                cache.store(key, self.build_dir, self._scan_record, resources,
+                            self.ignore_patterns[old_patterns:])
+            finally:
+                self._scan_record = old_record
+        cache.save()
         return resources
 
+    def get_scan_cache(self):
+        """Return the ScanCache for this toolchain, or None when there is no
+        directory to keep one in"""
+        if self._scan_cache is None:
+            cache_dir = (self.build_dir if self.scan_cache_dir is None
+                         else self.scan_cache_dir)
+            if not cache_dir:
+                return None
+            self._scan_cache = ScanCache(cache_dir)
+        return self._scan_cache
+
+    def _load_cached_scan(self, entry, resources, base_path):
+        """Fill *resources* from a cached scan, replaying the side effects that
+        _add_dir has on this toolchain"""
+        for field in ScanCache.RESOURCE_FIELDS:
+            getattr(resources, field).extend(entry[field])
+        resources.lib_dirs |= set(entry['lib_dirs'])
+        resources.linker_script = entry['linker_script']
+        for path in entry['file_basepath']:
+            resources.file_basepath[path] = base_path
+        for name, dir_path in entry['features'].iteritems():
+            def closure (dir_path=dir_path, base_path=base_path):
+                return self.scan_resources(dir_path, base_path=base_path,
+                                           collect_ignores=resources.collect_ignores)
+            resources.features.add_lazy(name, closure)
+        if entry['patterns']:
+            self.ignore_patterns.extend(entry['patterns'])
+            self._ignore_regex = re.compile("|".join(
+                fnmatch.translate(p) for p in self.ignore_patterns))
+
+    def _in_source_tree(self, path):
+        return self.source_tree is not None and path in self.source_tree
+
+    def _list_dir(self, path):
+        """List a directory from the source tree snapshot, or through the
+        scan cache when a scan is being recorded. Returns the sub-directories,
+        the files and the mtime"""
+        if self._scan_record is None:
+            if self._in_source_tree(path):
+                dirs, files = self.source_tree.listings[path]
+                return list(dirs), list(files), None
+            dirs, files = split_dir(path)
+            return dirs, files, None
+        return self._scan_cache.listdir(path)
+
+    def _walk(self, top):
+        """An os.walk(top, followlinks=True) that reads directory listings
+        through the scan cache and records the directories it visits
+
+        The listings of the sub-directories that remain after the caller
+        pruned them are read ahead by a pool of threads, so that independent
+        subtrees are listed at once. Directories are still yielded in the
+        order os.walk yields them, and the caller handles every directory in
+        its own thread, so the resources found do not depend on the number of
+        threads.
+        """
+        if self.scan_threads > 1 and not self._in_source_tree(top):
+            lister = DirLister(self._list_dir, self.scan_threads)
+            start = lister.start
+        else:
+            lister = None
+            start = lambda path: lambda: self._list_dir(path)
+        try:
+            for step in self._walk_listed(top, start(top), start):
+                yield step
+        finally:
+            if lister is not None:
+                lister.close()
+
+    def _walk_listed(self, top, listing, start):
+        try:
+            dirs, files, mtime = listing()
+        except OSError:
+            return
+        if self._scan_record is not None:
+            self._scan_record.dirs[top] = mtime
+        yield top, dirs, files
+        listings = [(join(top, d), start(join(top, d))) for d in dirs]
+        for path, listing in listings:
+            for step in self._walk_listed(path, listing, start):
+                yield step
+
     # A helper function for scan_resources. _add_dir traverses *path* (assumed to be a
     # directory) and heeds the ".mbedignore" files along the way. _add_dir calls _add_file
     # on every file it considers adding to the resources object.
@@ -651,21 +1255,31 @@ class mbedToolchain:
         itself is generated.
         """
         labels = self.get_labels()
-        for root, dirs, files in walk(path, followlinks=True):
+        for root, dirs, files in self._walk(path):
             # Check if folder contains .mbedignore
             if ".mbedignore" in files:
-                with open (join(root,".mbedignore"), "r") as f:
-                    lines=f.readlines()
-                    lines = [l.strip() for l in lines] # Strip whitespaces
-                    lines = [l for l in lines if l != ""] # Strip empty lines
-                    lines = [l for l in lines if not re.match("^#",l)] # Strip comment lines
-                    # Append root path to glob patterns and append patterns to ignore_patterns
-                    self.add_ignore_patterns(root, base_path, lines)
+                if (self._scan_record is None and self._in_source_tree(root)
+                        and root in self.source_tree.ignores):
+                    lines = self.source_tree.ignores[root]
+                else:
+                    with open (join(root,".mbedignore"), "r") as f:
+                        lines=f.readlines()
+                if self._scan_record is not None:
+                    self._scan_record.ignores[join(root, ".mbedignore")] =\
+                        md5("".join(lines)).hexdigest()
+                lines = [l.strip() for l in lines] # Strip whitespaces
+                lines = [l for l in lines if l != ""] # Strip empty lines
+                lines = [l for l in lines if not re.match("^#",l)] # Strip comment lines
+                # Append root path to glob patterns and append patterns to ignore_patterns
+                self.add_ignore_patterns(root, base_path, lines)
 
             # Skip the whole folder if ignored, e.g. .mbedignore containing '*'
             root_path =join(relpath(root, base_path))
             if  (self.is_ignored(join(root_path,"")) or
                  self.build_dir == root_path):
+                if (self._scan_record is not None and
+                    self.build_dir == root_path):
+                    self._scan_record.hit_build_dir = True
                 resources.ignore_dir(root_path)
                 dirs[:] = []
                 continue
@@ -682,7 +1296,7 @@ class mbedToolchain:
                     # Ignore toolchain that do not match the current TOOLCHAIN
                     (d.startswith('TOOLCHAIN_') and d[10:] not in labels['TOOLCHAIN']) or
                     # Ignore .mbedignore files
-                    self.is_ignored(join(relpath(root, base_path), d,"")) or
+                    self.is_ignored(join(root_path, d,"")) or
                     # Ignore TESTS dir
                     (d == 'TESTS')):
                         resources.ignore_dir(dir_path)
@@ -694,6 +1308,8 @@ class mbedToolchain:
                         return self.scan_resources(dir_path, base_path=base_path,
                                                    collect_ignores=resources.collect_ignores)
                     resources.features.add_lazy(d[8:], closure)
+                    if self._scan_record is not None:
+                        self._scan_record.features[d[8:]] = dir_path
                     resources.ignore_dir(dir_path)
                     dirs.remove(d)
                 elif exclude_paths:
@@ -709,16 +1325,24 @@ class mbedToolchain:
             resources.inc_dirs.append(root)
             resources.file_basepath[root] = base_path
 
+            # Paths relative to the base path are matched against the
+            # .mbedignore patterns; derive them from root_path instead of
+            # calling relpath for every file
             for file in files:
                 file_path = join(root, file)
-                self._add_file(file_path, resources, base_path)
+                rel_path = file if root_path == "." else join(root_path, file)
+                self._add_file(file_path, resources, base_path,
+                               rel_path=rel_path)
 
     # A helper function for both scan_resources and _add_dir. _add_file adds one file
     # (*file_path*) to the resources object based on the file type.
-    def _add_file(self, file_path, resources, base_path, exclude_paths=None):
+    def _add_file(self, file_path, resources, base_path, exclude_paths=None,
+                  rel_path=None):
         resources.file_basepath[file_path] = base_path
 
-        if self.is_ignored(relpath(file_path, base_path)):
+        if rel_path is None:
+            rel_path = relpath(file_path, base_path)
+        if self.is_ignored(rel_path):
             return
 
         _, ext = splitext(file_path)
@@ -819,6 +1443,25 @@ class mbedToolchain:
             mkdir(obj_dir)
         return join(obj_dir, name + '.o')
 
+    def get_compile_template(self, cc, includes):
+        """Return the start of the command compiling a C or C++ source with
+        the compiler cc: the compiler, its flags, defines and include options.
+        While compile_sources() builds its queue the template is only built
+        once for every compiler command and include paths, as it is the same
+        for all sources
+
+        Positional arguments:
+        cc - the compiler command and flags
+        includes - the include paths
+        """
+        if self.compile_templates is None:
+            return cc + self.get_compile_options(self.get_symbols(), includes)
+        key = (tuple(cc), tuple(includes))
+        if key not in self.compile_templates:
+            self.compile_templates[key] = cc + self.get_compile_options(
+                self.get_symbols(), includes)
+        return list(self.compile_templates[key])
+
     # Generate response file for all includes.
     # ARM, GCC, IAR cross compatible
     def get_inc_file(self, includes):
@@ -828,12 +1471,17 @@ class mbedToolchain:
                 cmd_list = []
                 for c in includes:
                     if c:
+                        if self.deterministic:
+                            # Independent of where the tree is checked out
+                            c = relpath(c)
                         c = c.replace("\\", "/")
                         if self.CHROOT:
                             c = c.replace(self.CHROOT, '')
                         cmd_list.append('"-I%s"' % c)
                 string = " ".join(cmd_list)
                 f.write(string)
+        if self.deterministic:
+            return relpath(include_file)
         return include_file
 
     # Generate response file for all objects when linking.
@@ -885,7 +1533,10 @@ class mbedToolchain:
         # Sort include paths for consistency
         inc_paths = sorted(set(inc_paths))
         # Unique id of all include paths
-        self.inc_md5 = md5(' '.join(inc_paths)).hexdigest()
+        if self.deterministic:
+            self.inc_md5 = md5(' '.join(relpath(p) for p in inc_paths)).hexdigest()
+        else:
+            self.inc_md5 = md5(' '.join(inc_paths)).hexdigest()
 
         objects = []
         queue = []
@@ -898,30 +1549,47 @@ class mbedToolchain:
 
         # Sort compile queue for consistency
         files_to_compile.sort()
-        for source in files_to_compile:
-            object = self.relative_object_path(
-                self.build_dir, resources.file_basepath[source], source)
-
-            # Queue mode (multiprocessing)
-            commands = self.compile_command(source, object, inc_paths)
-            if commands is not None:
-                queue.append({
-                    'source': source,
-                    'object': object,
-                    'commands': commands,
-                    'work_dir': work_dir,
-                    'chroot': self.CHROOT
-                })
-            else:
-                self.compiled += 1
-                objects.append(object)
+        self.compile_templates = {}
+        try:
+            for source in files_to_compile:
+                object = self.relative_object_path(
+                    self.build_dir, resources.file_basepath[source], source)
+
+                # Queue mode (multiprocessing)
+                commands = self.compile_command(source, object, inc_paths)
+                if commands is not None:
+                    # Only C and C++ objects have the dependency information that
+                    # the object cache needs
+                    cacheable = (self.object_cache is not None and
+                                 not self.CHROOT and
+                                 splitext(source)[1].lower() in ['.c', '.cpp'])
+                    queue.append({
+                        'source': source,
+                        'object': object,
+                        'commands': commands,
+                        'work_dir': work_dir,
+                        'chroot': self.CHROOT,
+                        'build_dir': self.build_dir,
+                        'dep_path': splitext(object)[0] + '.d',
+                        'cache': self.object_cache.path if cacheable else None
+                    })
+                else:
+                    self.compiled += 1
+                    objects.append(object)
+        finally:
+            self.compile_templates = None
 
         # Use queues/multiprocessing if cpu count is higher than setting
         jobs = self.jobs if self.jobs else cpu_count()
+        self.load_compile_times()
         if jobs > CPU_COUNT_MIN and len(queue) > jobs:
-            return self.compile_queue(queue, objects)
+            objects = self.compile_queue(queue, objects)
         else:
-            return self.compile_seq(queue, objects)
+            objects = self.compile_seq(queue, objects)
+        self.save_compile_times()
+        if self.object_cache is not None:
+            self.object_cache.cleanup()
+        return objects
 
     # Compile source files queue in sequential order
     def compile_seq(self, queue, objects):
@@ -937,6 +1605,9 @@ class mbedToolchain:
                     res['output'],
                     res['command']
                 ])
+            self.compile_times[result['source']] = result['elapsed']
+            self.store_digest(result['object'])
+            self.cache_object(result)
             objects.append(result['object'])
         return objects
 
@@ -945,54 +1616,94 @@ class mbedToolchain:
         jobs_count = int(self.jobs if self.jobs else cpu_count() * CPU_COEF)
         p = Pool(processes=jobs_count)
 
-        results = []
-        for i in range(len(queue)):
-            results.append(p.apply_async(compile_worker, [queue[i]]))
-        p.close()
+        # Start the slowest translation units first, so that no core is left
+        # waiting on a single long compile at the end of the build
+        queue = self.sort_by_compile_time(queue)
+        deadline = time() + self.compile_timeout if self.compile_timeout else None
 
-        itr = 0
-        while len(results):
-            itr += 1
-            if itr > 180000:
-                p.terminate()
-                p.join()
-                raise ToolException("Compile did not finish in 5 minutes")
+        results = p.imap_unordered(compile_worker, queue)
+        p.close()
+        try:
+            for _ in range(len(queue)):
+                # A timeout is always given, as waiting without one can not be
+                # interrupted with Ctrl-C on Python 2
+                timeout = (deadline - time()) if deadline else 0xFFFF
+                try:
+                    result = results.next(max(timeout, 0))
+                except TimeoutError:
+                    raise ToolException("Compile did not finish in %d seconds"
+                                        % self.compile_timeout)
 
-            sleep(0.01)
-            pending = 0
-            for r in results:
-                if r._ready is True:
-                    try:
-                        result = r.get()
-                        results.remove(r)
-
-                        self.compiled += 1
-                        self.progress("compile", result['source'], build_update=True)
-                        for res in result['results']:
-                            self.cc_verbose("Compile: %s" % ' '.join(res['command']), result['source'])
-                            self.compile_output([
-                                res['code'],
-                                res['output'],
-                                res['command']
-                            ])
-                        objects.append(result['object'])
-                    except ToolException, err:
-                        if p._taskqueue.queue:
-                            p._taskqueue.queue.clear()
-                            sleep(0.5)
-                        p.terminate()
-                        p.join()
-                        raise ToolException(err)
-                else:
-                    pending += 1
-                    if pending >= jobs_count:
-                        break
+                self.compiled += 1
+                self.progress("compile", result['source'], build_update=True)
+                for res in result['results']:
+                    self.cc_verbose("Compile: %s" % ' '.join(res['command']), result['source'])
+                    self.compile_output([
+                        res['code'],
+                        res['output'],
+                        res['command']
+                    ])
+                self.compile_times[result['source']] = result['elapsed']
+                self.store_digest(result['object'])
+                self.cache_object(result)
+                objects.append(result['object'])
+        except:
+            # Stop on the first error; the remaining jobs are discarded
+            p.terminate()
+            p.join()
+            raise
 
-        results = None
         p.join()
 
         return objects
 
+    def cache_object(self, result):
+        """Add a freshly compiled object to the object cache
+
+        Positional arguments:
+        result - the result of compile_worker for the object
+        """
+        if (self.object_cache is None or result.get('cached') or
+            not result.get('cache')):
+            return
+        try:
+            dependencies = self.parse_dependencies(result['dep_path'])
+        except (IOError, IndexError):
+            return
+        job = dict(result, build_dir=self.build_dir)
+        self.object_cache.store(job, dependencies,
+                                "".join(res['output'] for res in result['results']))
+
+    def sort_by_compile_time(self, queue):
+        """Order a compile queue so that the sources that took the longest to
+        compile in previous builds come first. Sources without a recorded time
+        are assumed to be as slow as the slowest known one.
+        """
+        slowest = max(self.compile_times.values() or [0])
+        return sorted(queue, reverse=True,
+                      key=lambda item: self.compile_times.get(item['source'],
+                                                              slowest))
+
+    def load_compile_times(self):
+        """Load the compile time of each source, recorded by previous builds"""
+        self.compile_times = {}
+        if not self.build_dir:
+            return
+        try:
+            with open(join(self.build_dir, self.COMPILE_TIMES_FILE_NAME)) as fd:
+                self.compile_times = load(fd)
+        except (IOError, ValueError):
+            pass
+
+    def save_compile_times(self):
+        if not self.build_dir:
+            return
+        try:
+            with open(join(self.build_dir, self.COMPILE_TIMES_FILE_NAME), "wb") as fd:
+                dump(self.compile_times, fd)
+        except IOError:
+            pass
+
     # Determine the compile command based on type of source file
     def compile_command(self, source, object, includes):
         # Check dependencies
@@ -1006,21 +1717,27 @@ class mbedToolchain:
                 deps = self.parse_dependencies(dep_path) if (exists(dep_path)) else []
             except IOError, IndexError:
                 deps = []
+            has_dep_file = len(deps) > 0
             config_file = ([self.config.app_config_location]
                            if self.config.app_config_location else [])
             deps.extend(config_file)
             if ext == '.cpp' or self.COMPILE_C_AS_CPP:
                 deps.append(join(self.build_dir, self.PROFILE_FILE_NAME + "-cxx"))
+                compile_fn = self.compile_cpp
             else:
                 deps.append(join(self.build_dir, self.PROFILE_FILE_NAME + "-c"))
+                compile_fn = self.compile_c
+            if self.content_hash and has_dep_file:
+                return self.content_hash_command(
+                    compile_fn(source, object, includes), source, object, deps)
             if len(deps) == 0 or self.need_update(object, deps):
-                if ext == '.cpp' or self.COMPILE_C_AS_CPP:
-                    return self.compile_cpp(source, object, includes)
-                else:
-                    return self.compile_c(source, object, includes)
+                return compile_fn(source, object, includes)
         elif ext == '.s':
             deps = [source]
             deps.append(join(self.build_dir, self.PROFILE_FILE_NAME + "-asm"))
+            if self.content_hash:
+                return self.content_hash_command(
+                    self.assemble(source, object, includes), source, object, deps)
             if self.need_update(object, deps):
                 return self.assemble(source, object, includes)
         else:
@@ -1028,6 +1745,72 @@ class mbedToolchain:
 
         return None
 
+    def content_hash_command(self, commands, source, object, dependencies):
+        """Decide whether an object needs rebuilding from the contents of its
+        inputs rather than their modification times
+
+        Positional arguments:
+        commands - the commands that would build the object
+        source - the file being compiled
+        object - the object file that would be built
+        dependencies - all other files the object is built from
+
+        Return value:
+        The commands when the object needs rebuilding, None otherwise
+        """
+        digest = self.compile_digest(commands, [source] + dependencies)
+        digest_file = splitext(object)[0] + self.DIGEST_EXT
+        if digest is not None and not self.build_all and exists(object):
+            try:
+                with open(digest_file) as fd:
+                    previous = fd.read()
+            except IOError:
+                # Objects built before content hashing was enabled are trusted
+                # if their modification times say they are up to date
+                previous = (digest if not self.need_update(object, dependencies)
+                            else None)
+                if previous:
+                    self._write_digest(digest_file, digest)
+            if previous == digest:
+                return None
+        if digest is not None:
+            self.pending_digests[object] = (digest_file, digest)
+        return commands
+
+    def compile_digest(self, commands, dependencies):
+        """Compute a digest of the command lines and the contents of every
+        dependency of an object. The MBED_BUILD_TIMESTAMP define, which
+        changes on every build, is left out. Returns None when a dependency
+        is missing.
+        """
+        digest = md5()
+        for command in commands:
+            digest.update(repr([arg for arg in command
+                                if 'MBED_BUILD_TIMESTAMP=' not in arg]))
+        for dep in sorted(set(dependencies)):
+            if dep not in self.file_digests:
+                try:
+                    with open(dep, "rb") as fd:
+                        self.file_digests[dep] = md5(fd.read()).hexdigest()
+                except IOError:
+                    return None
+            digest.update(dep)
+            digest.update(self.file_digests[dep])
+        return digest.hexdigest()
+
+    def store_digest(self, object):
+        """Record the digest of an object once it has been built successfully"""
+        if object in self.pending_digests:
+            self._write_digest(*self.pending_digests.pop(object))
+
+    @staticmethod
+    def _write_digest(digest_file, digest):
+        try:
+            with open(digest_file, "wb") as fd:
+                fd.write(digest)
+        except IOError:
+            pass
+
     @abstractmethod
     def parse_dependencies(self, dep_path):
         """Parse the dependency information generated by the compiler.
@@ -15,6 +15,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import re
+from os import getcwd
 from os.path import join, basename, splitext, dirname, exists
 from distutils.spawn import find_executable
 
@@ -171,6 +172,10 @@ class GCC(mbedToolchain):
         else:
             opts += ["-I%s" % i for i in includes]
 
+        if self.deterministic:
+            # Debug information records the working directory
+            opts.append("-fdebug-prefix-map=%s=." % getcwd())
+
         if not for_asm:
             config_header = self.get_config_header()
             if config_header is not None:
@@ -191,7 +196,7 @@ class GCC(mbedToolchain):
     @hook_tool
     def compile(self, cc, source, object, includes):
         # Build compile command
-        cmd = cc + self.get_compile_options(self.get_symbols(), includes)
+        cmd = self.get_compile_template(cc, includes)
 
         cmd.extend(self.get_dep_option(object))
 
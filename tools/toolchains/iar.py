@@ -171,7 +171,7 @@ class IAR(mbedToolchain):
     @hook_tool
     def compile(self, cc, source, object, includes):
         # Build compile command
-        cmd = cc +  self.get_compile_options(self.get_symbols(), includes)
+        cmd = self.get_compile_template(cc, includes)
 
         cmd.extend(self.get_dep_option(object))
 
@@ -14,9 +14,19 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import os
 import sys
+import json
+import zlib
 import argparse
-import xml.etree.ElementTree as ET
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+from hashlib import sha1
+from threading import Thread, Lock
+from Queue import Queue
+from time import sleep
 import requests
 import urlparse
 
@@ -131,25 +141,22 @@ def add_project_runs(args):
     if args.test_report:
         add_report(project_run_data, args.test_report, False, args.build_id, args.host_os)
 
-    ts_data = format_project_run_data(project_run_data, args.limit)
-    total_result = True
-    
-    total_parts = len(ts_data)
+    total_runs = count_project_runs(project_run_data)
+    total_parts = (total_runs + args.limit - 1) // args.limit
     print "Uploading project runs in %d parts" % total_parts
-    
-    for index, data in enumerate(ts_data):
-        r = requests.post(urlparse.urljoin(args.url, "api/projectRuns"), headers=create_headers(args), json=data)
-        print("add-project-runs part %d/%d" % (index + 1, total_parts), r.status_code, r.reason)
-        print(r.text)
-    
-        if r.status_code >= 400:
-            total_result = False
-    
+
+    journal = args.journal or ".add-project-runs-%s.journal" % args.build_id
+    uploader = BatchUploader(urlparse.urljoin(args.url, "api/projectRuns"),
+                             create_headers(args), journal, jobs=args.jobs,
+                             compress=args.compress)
+    total_result = uploader.upload(
+        format_project_run_data(project_run_data, args.limit), total_parts)
+
     if total_result:
         print "'add-project-runs' completed successfully"
         sys.exit(0)
     else:
-        print "'add-project-runs' failed"
+        print "'add-project-runs' failed, run it again to upload the remaining parts"
         sys.exit(2)
 
 def prep_ts_data():
@@ -174,35 +181,181 @@ def finish_ts_data(ts_data, project_run_data):
     #      or remove "vendor" entirely from the viewer
     ts_data['vendors'] = list(project_run_data['vendors_set'])
     
+def count_project_runs(project_run_data):
+    return sum(len(toolchain)
+               for hostOs in project_run_data['projectRuns'].itervalues()
+               for platform in hostOs.itervalues()
+               for toolchain in platform.itervalues())
+
 def format_project_run_data(project_run_data, limit):
-    all_ts_data = []
+    """Generate the submissions of the project runs, at most limit project
+    runs each. Project runs are taken out of project_run_data as they are
+    submitted, and come in a stable order, so that the same reports always
+    give the same submissions"""
     current_limit_count = 0
-    
+
     ts_data = prep_ts_data()
     ts_data['projectRuns'] = []
 
-    for hostOs_name, hostOs in project_run_data['projectRuns'].iteritems():
-        for platform_name, platform in hostOs.iteritems():
-            for toolchain_name, toolchain in platform.iteritems():
-                for project_name, project in toolchain.iteritems():
+    for hostOs_name, hostOs in sorted(project_run_data['projectRuns'].iteritems()):
+        for platform_name, platform in sorted(hostOs.iteritems()):
+            for toolchain_name, toolchain in sorted(platform.iteritems()):
+                for project_name in sorted(toolchain):
                     if current_limit_count >= limit:
                         finish_ts_data(ts_data, project_run_data)
-                        all_ts_data.append(ts_data)
+                        yield ts_data
                         ts_data = prep_ts_data()
                         current_limit_count = 0
-                    
-                    ts_data['projectRuns'].append(project)
+
+                    ts_data['projectRuns'].append(toolchain.pop(project_name))
                     ts_data['platforms'].add(platform_name)
                     ts_data['toolchains'].add(toolchain_name)
                     ts_data['names'].add(project_name)
                     ts_data['hostOses'].add(hostOs_name)
                     current_limit_count += 1
-    
+
     if current_limit_count > 0:
         finish_ts_data(ts_data, project_run_data)
-        all_ts_data.append(ts_data)
-    
-    return all_ts_data
+        yield ts_data
+
+class BatchUploader(object):
+    """Posts submissions to a URL from a few threads sharing a pool of
+    keep-alive connections
+
+    Submissions are serialized (and compressed) one at a time, as the threads
+    become ready for them. The digest of every submission accepted by the
+    server is appended to a journal file, and submissions already in the
+    journal are not sent again, so that an upload that failed part way may
+    be resumed by running it again. The journal is removed once everything
+    was uploaded.
+    """
+    # Attempts made for each submission, and the delay before the first retry
+    # in seconds. The delay doubles on every retry
+    ATTEMPTS = 4
+    BACKOFF = 1.0
+    TIMEOUT = 300
+
+    def __init__(self, url, headers, journal, jobs=4, compress=True):
+        self.url = url
+        self.headers = headers
+        self.journal = journal
+        self.jobs = jobs
+        self.compress = compress
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=jobs)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = Lock()
+        self.failed = 0
+        try:
+            with open(journal) as fd:
+                self.done = set(line.strip() for line in fd)
+        except IOError:
+            self.done = set()
+
+    def upload(self, submissions, total_parts):
+        """Upload every submission. Returns True when all were accepted
+
+        Positional arguments:
+        submissions - an iterable of the submissions, as JSON serializable
+                      objects
+        total_parts - the number of submissions, for progress messages
+        """
+        queue = Queue(self.jobs)
+        threads = [Thread(target=self._work, args=(queue, total_parts))
+                   for _ in range(self.jobs)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for index, data in enumerate(submissions):
+            body = json.dumps(data)
+            digest = sha1(body).hexdigest()
+            if digest in self.done:
+                print("add-project-runs part %d/%d already uploaded" %
+                      (index + 1, total_parts))
+                continue
+            queue.put((index, body, digest))
+        for _ in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+        self.session.close()
+        if self.failed:
+            return False
+        try:
+            os.remove(self.journal)
+        except OSError:
+            pass
+        return True
+
+    def _work(self, queue, total_parts):
+        while True:
+            job = queue.get()
+            try:
+                if job is None:
+                    return
+                self._upload_part(job, total_parts)
+            except Exception as exc:
+                # Keep taking parts off the queue, so that the producer is
+                # never left blocked on a full queue
+                with self.lock:
+                    print("add-project-runs part %d/%d failed: %s" %
+                          (job[0] + 1, total_parts, exc))
+                    self.failed += 1
+            finally:
+                queue.task_done()
+
+    def _upload_part(self, job, total_parts):
+        index, body, digest = job
+        response = self._post(body)
+        with self.lock:
+            if response is None:
+                print("add-project-runs part %d/%d failed" %
+                      (index + 1, total_parts))
+            else:
+                print("add-project-runs part %d/%d" % (index + 1, total_parts),
+                      response.status_code, response.reason)
+                print(response.text)
+            if response is not None and response.status_code < 400:
+                with open(self.journal, "a") as fd:
+                    fd.write(digest + "\n")
+            else:
+                self.failed += 1
+
+    def _post(self, body):
+        """Post one submission, retrying connection and server errors.
+        Returns the last response, or None when no response was received"""
+        response = None
+        for attempt in range(self.ATTEMPTS):
+            headers = dict(self.headers)
+            headers['Content-Type'] = 'application/json'
+            compress = self.compress
+            if compress:
+                headers['Content-Encoding'] = 'gzip'
+                # A wbits of 16 + MAX_WBITS writes the gzip format
+                compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                              16 + zlib.MAX_WBITS)
+                data = compressor.compress(body) + compressor.flush()
+            else:
+                data = body
+            try:
+                response = self.session.post(self.url, data=data,
+                                             headers=headers,
+                                             timeout=self.TIMEOUT)
+            except requests.exceptions.RequestException as exc:
+                print("add-project-runs %s" % exc)
+                response = None
+            else:
+                if compress and response.status_code == 415:
+                    # The server does not take compressed submissions
+                    self.compress = False
+                    continue
+                if response.status_code < 500:
+                    return response
+            if attempt + 1 < self.ATTEMPTS:
+                sleep(self.BACKOFF * 2 ** attempt)
+        return response
 
 def find_project_run(projectRuns, project):
     keys = ['hostOs', 'platform', 'toolchain', 'project']
@@ -248,88 +401,106 @@ def update_project_run(projectRuns, project, is_build):
         add_project_run(projectRuns, project)
 
 def add_report(project_run_data, report_file, is_build, build_id, host_os):
-    tree = None
-
+    """Add the project runs of a JUnit report to project_run_data. The report
+    is read one test suite at a time, so that it is never held in memory as
+    a whole"""
     try:
-        tree = ET.parse(report_file)
-    except:
+        for test_suite in iter_test_suites(report_file):
+            add_test_suite(project_run_data, test_suite, is_build, build_id,
+                           host_os)
+    except (IOError, ET.ParseError):
         print(sys.exc_info()[0])
         print('Invalid path to report: %s', report_file)
         sys.exit(1)
 
-    test_suites = tree.getroot()
-
-    for test_suite in test_suites:
-        platform = ""
-        toolchain = ""
-        vendor = ""
-        for properties in test_suite.findall('properties'):
-            for property in properties.findall('property'):
-                if property.attrib['name'] == 'target':
-                    platform = property.attrib['value']
-                    project_run_data['platforms_set'].add(platform)
-                elif property.attrib['name'] == 'toolchain':
-                    toolchain = property.attrib['value']
-                    project_run_data['toolchains_set'].add(toolchain)
-                elif property.attrib['name'] == 'vendor':
-                    vendor = property.attrib['value']
-                    project_run_data['vendors_set'].add(vendor)
-
-        for test_case in test_suite.findall('testcase'):
-            projectRun = {}
-            projectRun['build'] = build_id
-            projectRun['hostOs'] = host_os
-            projectRun['platform'] = platform
-            projectRun['toolchain'] = toolchain
-            projectRun['project'] = test_case.attrib['classname'].split('.')[-1]
-            projectRun['vendor'] = vendor
-
-            project_run_data['names_set'].add(projectRun['project'])
-
-            should_skip = False
-            skips = test_case.findall('skipped')
-
-            if skips:
-                should_skip = skips[0].attrib['message'] == 'SKIP'
-
-            if not should_skip:
-                system_outs = test_case.findall('system-out')
-
-                output = ""
-                if system_outs:
-                    output = system_outs[0].text
-
-                if is_build:
-                    projectRun['buildOutput'] = output
-                else:
-                    projectRun['testOutput'] = output
-
-                errors = test_case.findall('error')
-                failures = test_case.findall('failure')
-                projectRunPass = None
-                result = None
-
-                if errors:
-                    projectRunPass = False
-                    result = errors[0].attrib['message']
-                elif failures:
-                    projectRunPass = False
-                    result = failures[0].attrib['message']
-                elif skips:
-                    projectRunPass = True
-                    result = skips[0].attrib['message']
-                else:
-                    projectRunPass = True
-                    result = 'OK'
-
-                if is_build:
-                    projectRun['buildPass'] = projectRunPass
-                    projectRun['buildResult'] = result
-                else:
-                    projectRun['testPass'] = projectRunPass
-                    projectRun['testResult'] = result
-
-                update_project_run(project_run_data['projectRuns'], projectRun, is_build)
+def iter_test_suites(report_file):
+    """Generate the test suites (the children of the root element) of a JUnit
+    report, discarding each one once it was handled"""
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(report_file, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                yield elem
+                elem.clear()
+                root.remove(elem)
+
+def add_test_suite(project_run_data, test_suite, is_build, build_id, host_os):
+    platform = ""
+    toolchain = ""
+    vendor = ""
+    for properties in test_suite.findall('properties'):
+        for property in properties.findall('property'):
+            if property.attrib['name'] == 'target':
+                platform = property.attrib['value']
+                project_run_data['platforms_set'].add(platform)
+            elif property.attrib['name'] == 'toolchain':
+                toolchain = property.attrib['value']
+                project_run_data['toolchains_set'].add(toolchain)
+            elif property.attrib['name'] == 'vendor':
+                vendor = property.attrib['value']
+                project_run_data['vendors_set'].add(vendor)
+
+    for test_case in test_suite.findall('testcase'):
+        projectRun = {}
+        projectRun['build'] = build_id
+        projectRun['hostOs'] = host_os
+        projectRun['platform'] = platform
+        projectRun['toolchain'] = toolchain
+        projectRun['project'] = test_case.attrib['classname'].split('.')[-1]
+        projectRun['vendor'] = vendor
+
+        project_run_data['names_set'].add(projectRun['project'])
+
+        should_skip = False
+        skips = test_case.findall('skipped')
+
+        if skips:
+            should_skip = skips[0].attrib['message'] == 'SKIP'
+
+        if not should_skip:
+            system_outs = test_case.findall('system-out')
+
+            output = ""
+            if system_outs:
+                output = system_outs[0].text
+
+            if is_build:
+                projectRun['buildOutput'] = output
+            else:
+                projectRun['testOutput'] = output
+
+            errors = test_case.findall('error')
+            failures = test_case.findall('failure')
+            projectRunPass = None
+            result = None
+
+            if errors:
+                projectRunPass = False
+                result = errors[0].attrib['message']
+            elif failures:
+                projectRunPass = False
+                result = failures[0].attrib['message']
+            elif skips:
+                projectRunPass = True
+                result = skips[0].attrib['message']
+            else:
+                projectRunPass = True
+                result = 'OK'
+
+            if is_build:
+                projectRun['buildPass'] = projectRunPass
+                projectRun['buildResult'] = result
+            else:
+                projectRun['testPass'] = projectRunPass
+                projectRun['testResult'] = result
+
+            update_project_run(project_run_data['projectRuns'], projectRun, is_build)
 
 def main(arguments):
     # Register and parse command line arguments
@@ -364,6 +535,9 @@ def main(arguments):
     add_project_runs_parser.add_argument('-t', '--test-report', required=False, help='path to junit xml test report')
     add_project_runs_parser.add_argument('-o', '--host-os', required=True, help='host os on which test was run')
     add_project_runs_parser.add_argument('-l', '--limit', required=False, type=int, default=1000, help='Limit the number of project runs sent at a time to avoid HTTP errors (default is 1000)')
+    add_project_runs_parser.add_argument('-j', '--jobs', required=False, type=int, default=4, help='Number of parts uploaded at once (default is 4)')
+    add_project_runs_parser.add_argument('--journal', required=False, help='file recording the parts already uploaded, so that a failed upload may be resumed (default is .add-project-runs-<build id>.journal)')
+    add_project_runs_parser.add_argument('--no-compress', dest='compress', action='store_false', help='do not gzip the parts uploaded')
     add_project_runs_parser.set_defaults(func=add_project_runs)
 
     args = parser.parse_args(arguments)
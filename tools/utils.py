@@ -15,7 +15,6 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import sys
-import inspect
 import os
 import argparse
 import math
@@ -25,10 +24,11 @@ from os.path import isdir, join, exists, split, relpath, splitext, abspath
 from os.path import commonprefix, normpath, dirname
 from subprocess import Popen, PIPE, STDOUT, call
 from math import ceil
+from time import time
 import json
 from collections import OrderedDict
 import logging
-from intelhex import IntelHex
+from tools.object_cache import ObjectCache
 
 def remove_if_in(lst, thing):
     if thing in lst:
@@ -39,9 +39,27 @@ def compile_worker(job):
 
     Positional argumets:
     job - a dict containing a list of commands and the remaining arguments
-          to run_cmd
+          to run_cmd. When it names an object cache, the object is taken
+          from the cache instead of running the commands if possible
     """
     results = []
+    start = time()
+    if job.get('cache'):
+        output = ObjectCache(job['cache']).fetch(job)
+        if output is not None:
+            return {
+                'source': job['source'],
+                'object': job['object'],
+                'commands': job['commands'],
+                'dep_path': job['dep_path'],
+                'cache': job['cache'],
+                'results': [{'code': 0, 'output': output if i == 0 else "",
+                             'command': command}
+                            for i, command in enumerate(job['commands'])],
+                'elapsed': time() - start,
+                'cached': True
+            }
+
     for command in job['commands']:
         try:
             _, _stderr, _rc = run_cmd(command, work_dir=job['work_dir'],
@@ -59,7 +77,11 @@ def compile_worker(job):
         'source': job['source'],
         'object': job['object'],
         'commands': job['commands'],
-        'results': results
+        'dep_path': job.get('dep_path'),
+        'cache': job.get('cache'),
+        'results': results,
+        'elapsed': time() - start,
+        'cached': False
     }
 
 def cmd(command, check=True, verbose=False, shell=False, cwd=None):
@@ -210,6 +232,7 @@ def get_caller_name(steps=2):
     Keyword arguments:
     steps - the number of steps up the stack the calling function is
     """
+    import inspect
     return inspect.stack()[steps][3]
 
 
@@ -350,6 +373,25 @@ def dict_to_ascii(dictionary):
     else:
         return dictionary
 
+def _ascii_pairs_hook(pairs):
+    """ A JSON object hook that builds an ordered dictionary with all of its
+    strings in ASCII, in the same pass as decoding. Nested objects have been
+    converted already by the time this is called
+    """
+    return OrderedDict([(key.encode('ascii'), _ascii_value(value))
+                        for key, value in pairs])
+
+def _ascii_value(value):
+    """ Convert the strings of a decoded JSON value that is not an object to
+    ASCII
+    """
+    if isinstance(value, unicode):
+        return value.encode('ascii')
+    elif isinstance(value, list):
+        return [_ascii_value(element) for element in value]
+    else:
+        return value
+
 def json_file_to_dict(fname):
     """ Read a JSON file and return its Python representation, transforming all
     the strings from Unicode to ASCII. The order of keys in the JSON file is
@@ -360,8 +402,8 @@ def json_file_to_dict(fname):
     """
     try:
         with open(fname, "r") as file_obj:
-            return dict_to_ascii(json.load(file_obj,
-                                           object_pairs_hook=OrderedDict))
+            return _ascii_value(json.load(file_obj,
+                                          object_pairs_hook=_ascii_pairs_hook))
     except (ValueError, IOError):
         sys.stderr.write("Error parsing '%s':\n" % fname)
         raise
@@ -450,6 +492,18 @@ def argparse_profile_filestring_type(string):
         raise argparse.ArgumentTypeError(
             "{0} does not exist in the filesystem.".format(string))
 
+def argparse_size_type(string):
+    """ An argument parser that reads a size in bytes, given in megabytes
+    unless followed by one of the suffixes K, M or G"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    unit = units.get(string[-1:].upper())
+    try:
+        value = float(string[:-1] if unit else string)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "{0} is not a valid size".format(string))
+    return int(value * (unit or units["M"]))
+
 def columnate(strings, separator=", ", chars=80):
     """ render a list of strings as a in a bunch of columns
 
@@ -519,6 +573,7 @@ def print_large_string(large_string):
 
 def intelhex_offset(filename, offset):
     """Load a hex or bin file at a particular offset"""
+    from intelhex import IntelHex
     _, inteltype = splitext(filename)
     ih = IntelHex()
     if inteltype == ".bin":